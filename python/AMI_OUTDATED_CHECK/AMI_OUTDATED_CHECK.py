@@ -113,11 +113,17 @@ Scenarios:
 
 """
 
-import json
 from datetime import datetime, timedelta
-import boto3
-import botocore
 from dateutil import parser
+import os
+import sys
+
+try:
+    import rdk_runtime
+except ImportError:
+    # Outside of a Lambda layer, the runtime is the rdk_runtime directory next to the rule directory.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import rdk_runtime
 
 ##############
 # Parameters #
@@ -378,34 +384,17 @@ def evaluate_parameters(rule_parameters):
 # Helper Functions #
 ####################
 
-# Build an error to be displayed in the logs when the parameter is invalid.
-def build_parameters_value_error_response(ex):
-    """Return an error dictionary when the evaluate_parameters() raises a ValueError.
-
-    Keyword arguments:
-    ex -- Exception text
-    """
-    return  build_error_response(internalErrorMessage="Parameter value is invalid",
-                                 internalErrorDetails="An ValueError was raised during the validation of the Parameter value",
-                                 customerErrorCode="InvalidParameterValueException",
-                                 customerErrorMessage=str(ex))
-
 # This gets the client after assuming the Config service role
 # either in the same AWS account or cross-account.
-def get_client(service, event):
+def get_client(service, event, region=None):
     """Return the service boto client. It should be used instead of directly calling the client.
 
     Keyword arguments:
     service -- the service name used for calling the boto.client()
     event -- the event variable given in the lambda handler
+    region -- the region where the client is called (default: None)
     """
-    if not ASSUME_ROLE_MODE:
-        return boto3.client(service)
-    credentials = get_assume_role_credentials(event["executionRoleArn"])
-    return boto3.client(service, aws_access_key_id=credentials['AccessKeyId'],
-                        aws_secret_access_key=credentials['SecretAccessKey'],
-                        aws_session_token=credentials['SessionToken']
-                       )
+    return rdk_runtime.get_client(service, event, region, assume_role=ASSUME_ROLE_MODE)
 
 # This generate an evaluation for config
 def build_evaluation(resource_id, compliance_type, event, resource_type=DEFAULT_RESOURCE_TYPE, annotation=None):
@@ -416,16 +405,9 @@ def build_evaluation(resource_id, compliance_type, event, resource_type=DEFAULT_
     compliance_type -- either COMPLIANT, NON_COMPLIANT or NOT_APPLICABLE
     event -- the event variable given in the lambda handler
     resource_type -- the CloudFormation resource type (or AWS::::Account) to report on the rule (default DEFAULT_RESOURCE_TYPE)
-    annotation -- an annotation to be added to the evaluation (default None)
+    annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
     """
-    eval_cc = {}
-    if annotation:
-        eval_cc['Annotation'] = annotation
-    eval_cc['ComplianceResourceType'] = resource_type
-    eval_cc['ComplianceResourceId'] = resource_id
-    eval_cc['ComplianceType'] = compliance_type
-    eval_cc['OrderingTimestamp'] = str(json.loads(event['invokingEvent'])['notificationCreationTime'])
-    return eval_cc
+    return rdk_runtime.build_evaluation(resource_id, compliance_type, event, resource_type, annotation)
 
 def build_evaluation_from_config_item(configuration_item, compliance_type, annotation=None):
     """Form an evaluation as a dictionary. Usually suited to report on configuration change rules.
@@ -433,231 +415,14 @@ def build_evaluation_from_config_item(configuration_item, compliance_type, annot
     Keyword arguments:
     configuration_item -- the configurationItem dictionary in the invokingEvent
     compliance_type -- either COMPLIANT, NON_COMPLIANT or NOT_APPLICABLE
-    annotation -- an annotation to be added to the evaluation (default None)
+    annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
     """
-    eval_ci = {}
-    if annotation:
-        eval_ci['Annotation'] = annotation
-    eval_ci['ComplianceResourceType'] = configuration_item['resourceType']
-    eval_ci['ComplianceResourceId'] = configuration_item['resourceId']
-    eval_ci['ComplianceType'] = compliance_type
-    eval_ci['OrderingTimestamp'] = configuration_item['configurationItemCaptureTime']
-    return eval_ci
+    return rdk_runtime.build_evaluation_from_config_item(configuration_item, compliance_type, annotation)
 
 ####################
 # Boilerplate Code #
 ####################
 
-# Helper function used to validate input
-def check_defined(reference, reference_name):
-    if not reference:
-        raise Exception('Error: ', reference_name, 'is not defined')
-    return reference
-
-# Check whether the message is OversizedConfigurationItemChangeNotification or not
-def is_oversized_changed_notification(message_type):
-    check_defined(message_type, 'messageType')
-    return message_type == 'OversizedConfigurationItemChangeNotification'
-
-# Check whether the message is a ScheduledNotification or not.
-def is_scheduled_notification(message_type):
-    check_defined(message_type, 'messageType')
-    return message_type == 'ScheduledNotification'
-
-# Get configurationItem using getResourceConfigHistory API
-# in case of OversizedConfigurationItemChangeNotification
-def get_configuration(resource_type, resource_id, configuration_capture_time):
-    result = AWS_CONFIG_CLIENT.get_resource_config_history(
-        resourceType=resource_type,
-        resourceId=resource_id,
-        laterTime=configuration_capture_time,
-        limit=1)
-    configurationItem = result['configurationItems'][0]
-    return convert_api_configuration(configurationItem)
-
-# Convert from the API model to the original invocation model
-def convert_api_configuration(configurationItem):
-    for k, v in configurationItem.items():
-        if isinstance(v, datetime.datetime):
-            configurationItem[k] = str(v)
-    configurationItem['awsAccountId'] = configurationItem['accountId']
-    configurationItem['ARN'] = configurationItem['arn']
-    configurationItem['configurationStateMd5Hash'] = configurationItem['configurationItemMD5Hash']
-    configurationItem['configurationItemVersion'] = configurationItem['version']
-    configurationItem['configuration'] = json.loads(configurationItem['configuration'])
-    if 'relationships' in configurationItem:
-        for i in range(len(configurationItem['relationships'])):
-            configurationItem['relationships'][i]['name'] = configurationItem['relationships'][i]['relationshipName']
-    return configurationItem
-
-# Based on the type of message get the configuration item
-# either from configurationItem in the invoking event
-# or using the getResourceConfigHistory API in getConfiguration function.
-def get_configuration_item(invokingEvent):
-    check_defined(invokingEvent, 'invokingEvent')
-    if is_oversized_changed_notification(invokingEvent['messageType']):
-        configurationItemSummary = check_defined(invokingEvent['configurationItemSummary'], 'configurationItemSummary')
-        return get_configuration(configurationItemSummary['resourceType'], configurationItemSummary['resourceId'], configurationItemSummary['configurationItemCaptureTime'])
-    elif is_scheduled_notification(invokingEvent['messageType']):
-        return None
-    return check_defined(invokingEvent['configurationItem'], 'configurationItem')
-
-# Check whether the resource has been deleted. If it has, then the evaluation is unnecessary.
-def is_applicable(configurationItem, event):
-    try:
-        check_defined(configurationItem, 'configurationItem')
-        check_defined(event, 'event')
-    except:
-        return True
-    status = configurationItem['configurationItemStatus']
-    eventLeftScope = event['eventLeftScope']
-    if status == 'ResourceDeleted':
-        print("Resource Deleted, setting Compliance Status to NOT_APPLICABLE.")
-    return (status == 'OK' or status == 'ResourceDiscovered') and not eventLeftScope
-
-def get_assume_role_credentials(role_arn):
-    sts_client = boto3.client('sts')
-    try:
-        assume_role_response = sts_client.assume_role(RoleArn=role_arn, RoleSessionName="configLambdaExecution")
-        return assume_role_response['Credentials']
-    except botocore.exceptions.ClientError as ex:
-        # Scrub error message for any internal account info leaks
-        print(str(ex))
-        if 'AccessDenied' in ex.response['Error']['Code']:
-            ex.response['Error']['Message'] = "AWS Config does not have permission to assume the IAM role."
-        else:
-            ex.response['Error']['Message'] = "InternalError"
-            ex.response['Error']['Code'] = "InternalError"
-        raise ex
-
-# This removes older evaluation (usually useful for periodic rule not reporting on AWS::::Account).
-def clean_up_old_evaluations(latest_evaluations, event):
-
-    cleaned_evaluations = []
-
-    old_eval = AWS_CONFIG_CLIENT.get_compliance_details_by_config_rule(
-        ConfigRuleName=event['configRuleName'],
-        ComplianceTypes=['COMPLIANT', 'NON_COMPLIANT'],
-        Limit=100)
-
-    old_eval_list = []
-
-    while True:
-        for old_result in old_eval['EvaluationResults']:
-            old_eval_list.append(old_result)
-        if 'NextToken' in old_eval:
-            next_token = old_eval['NextToken']
-            old_eval = AWS_CONFIG_CLIENT.get_compliance_details_by_config_rule(
-                ConfigRuleName=event['configRuleName'],
-                ComplianceTypes=['COMPLIANT', 'NON_COMPLIANT'],
-                Limit=100,
-                NextToken=next_token)
-        else:
-            break
-
-    for old_eval in old_eval_list:
-        old_resource_id = old_eval['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
-        newer_founded = False
-        for latest_eval in latest_evaluations:
-            if old_resource_id == latest_eval['ComplianceResourceId']:
-                newer_founded = True
-        if not newer_founded:
-            cleaned_evaluations.append(build_evaluation(old_resource_id, "NOT_APPLICABLE", event))
-
-    return cleaned_evaluations + latest_evaluations
-
-# This decorates the lambda_handler in rule_code with the actual PutEvaluation call
+# The evaluation and the reporting to Config are done by the shared runtime, see rdk_runtime/README.md.
 def lambda_handler(event, context):
-
-    global AWS_CONFIG_CLIENT
-
-    #print(event)
-    check_defined(event, 'event')
-    invoking_event = json.loads(event['invokingEvent'])
-    rule_parameters = {}
-    if 'ruleParameters' in event:
-        rule_parameters = json.loads(event['ruleParameters'])
-
-    try:
-        valid_rule_parameters = evaluate_parameters(rule_parameters)
-    except ValueError as ex:
-        return build_parameters_value_error_response(ex)
-
-    try:
-        AWS_CONFIG_CLIENT = get_client('config', event)
-        if invoking_event['messageType'] in ['ConfigurationItemChangeNotification', 'ScheduledNotification', 'OversizedConfigurationItemChangeNotification']:
-            configuration_item = get_configuration_item(invoking_event)
-            if is_applicable(configuration_item, event):
-                compliance_result = evaluate_compliance(event, configuration_item, valid_rule_parameters)
-            else:
-                compliance_result = "NOT_APPLICABLE"
-        else:
-            return build_internal_error_response('Unexpected message type', str(invoking_event))
-    except botocore.exceptions.ClientError as ex:
-        if is_internal_error(ex):
-            return build_internal_error_response("Unexpected error while completing API request", str(ex))
-        return build_error_response("Customer error while making API request", str(ex), ex.response['Error']['Code'], ex.response['Error']['Message'])
-    except ValueError as ex:
-        return build_internal_error_response(str(ex), str(ex))
-
-    evaluations = []
-    latest_evaluations = []
-
-    if not compliance_result:
-        latest_evaluations.append(build_evaluation(event['accountId'], "NOT_APPLICABLE", event, resource_type='AWS::::Account'))
-        evaluations = clean_up_old_evaluations(latest_evaluations, event)
-    elif isinstance(compliance_result, str):
-        evaluations.append(build_evaluation_from_config_item(configuration_item, compliance_result))
-    elif isinstance(compliance_result, list):
-        for evaluation in compliance_result:
-            missing_fields = False
-            for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-                if field not in evaluation:
-                    print("Missing " + field + " from custom evaluation.")
-                    missing_fields = True
-
-            if not missing_fields:
-                latest_evaluations.append(evaluation)
-        evaluations = clean_up_old_evaluations(latest_evaluations, event)
-    elif isinstance(compliance_result, dict):
-        missing_fields = False
-        for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-            if field not in compliance_result:
-                print("Missing " + field + " from custom evaluation.")
-                missing_fields = True
-        if not missing_fields:
-            evaluations.append(compliance_result)
-    else:
-        evaluations.append(build_evaluation_from_config_item(configuration_item, 'NOT_APPLICABLE'))
-
-    # Put together the request that reports the evaluation status
-    resultToken = event['resultToken']
-    testMode = False
-    if resultToken == 'TESTMODE':
-        # Used solely for RDK test to skip actual put_evaluation API call
-        testMode = True
-    # Invoke the Config API to report the result of the evaluation
-    evaluation_copy = []
-    evaluation_copy = evaluations[:]
-    while(evaluation_copy):
-        AWS_CONFIG_CLIENT.put_evaluations(Evaluations=evaluation_copy[:100], ResultToken=resultToken, TestMode=testMode)
-        del evaluation_copy[:100]
-    # Used solely for RDK test to be able to test Lambda function
-    return evaluations
-
-def is_internal_error(exception):
-    return ((not isinstance(exception, botocore.exceptions.ClientError)) or exception.response['Error']['Code'].startswith('5')
-            or 'InternalError' in exception.response['Error']['Code'] or 'ServiceError' in exception.response['Error']['Code'])
-
-def build_internal_error_response(internalErrorMessage, internalErrorDetails=None):
-    return build_error_response(internalErrorMessage, internalErrorDetails, 'InternalError', 'InternalError')
-
-def build_error_response(internalErrorMessage, internalErrorDetails=None, customerErrorCode=None, customerErrorMessage=None):
-    error_response = {
-        'internalErrorMessage': internalErrorMessage,
-        'internalErrorDetails': internalErrorDetails,
-        'customerErrorMessage': customerErrorMessage,
-        'customerErrorCode': customerErrorCode
-    }
-    print(error_response)
-    return error_response
+    return rdk_runtime.lambda_handler(event, context, sys.modules[__name__])
@@ -86,11 +86,19 @@ Scenarios:
 
 '''
 
+import os
+import sys
 import json
-import datetime
+import bisect
+import functools
 import ipaddress
-import boto3
-import botocore
+
+try:
+    import rdk_runtime
+except ImportError:
+    # Outside of a Lambda layer, the runtime is the rdk_runtime directory next to the rule directory.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import rdk_runtime
 
 ##############
 # Parameters #
@@ -102,6 +110,10 @@ DEFAULT_RESOURCE_TYPE = 'AWS::ApiGateway::RestApi'
 # Set to True to get the lambda to assume the Role attached on the Config Service (useful for cross-account).
 ASSUME_ROLE_MODE = False
 
+# Number of distinct whitelists and of distinct IP networks kept parsed, for the next invocations of a warm container.
+MAX_WHITELISTS = 16
+MAX_IP_NETWORKS = 4096
+
 #############
 # Main Code #
 #############
@@ -146,7 +158,8 @@ def evaluate_compliance(event, configuration_item, rule_parameters):
 
         policy = json.loads(gateway['policy'].replace('\\',''))
         
-        if is_policy_allows_more_than_whitelist(policy, rule_parameters):
+        # The verdict of a policy is computed once for all the APIs sharing it, see rdk_runtime/policy_engine.py.
+        if rdk_runtime.compile_policy(policy).evaluate(is_policy_allows_more_than_whitelist, tuple(rule_parameters)):
             evaluations.append(build_evaluation(gateway['name'], 'NON_COMPLIANT', event, annotation='The attached policy allows more than the whitelist.'))
             continue
         
@@ -155,52 +168,73 @@ def evaluate_compliance(event, configuration_item, rule_parameters):
     return evaluations
 
 def is_policy_allows_more_than_whitelist(policy, whitelist):
-    for statement in policy['Statement']:
-        if statement['Effect'] != 'Allow':
+    cidr_whitelist = get_cidr_whitelist(tuple(whitelist))
+    for statement in policy.statements:
+        if not statement.is_allow():
             continue
-        
-        if 'Condition' not in statement:
-            return True
-        
-        if 'IpAddress' not in statement['Condition']:
-            return True
 
-        if 'aws:SourceIp' not in statement['Condition']['IpAddress']:
+        source_ips = statement.get_condition_values('IpAddress', 'aws:SourceIp')
+        if source_ips is None:
             return True
-      
-        if not is_ip_in_whitelist(statement['Condition']['IpAddress']['aws:SourceIp'], whitelist):
+
+        if not cidr_whitelist.contains_all(source_ips):
             return True
 
     return False
 
 def is_ip_in_whitelist(ip_list_or_str, whitelist):
-
-    all_network_in_ip_list = get_all_ip_networks(ip_list_or_str)
-    all_network_in_whitelist = get_all_ip_networks(whitelist)
-    
-    for net in all_network_in_ip_list:
-        is_network_included = False
-        for net_whitelisted in  all_network_in_whitelist:
-            try:
-                list(net_whitelisted.address_exclude(net))
-                is_network_included = True
-            except:
-                continue
-        if not is_network_included:
-            return False
-    return True
-
-def get_all_ip_networks(ip_list_or_str):                
-    ip_network_to_return = []
     if isinstance(ip_list_or_str, str):
-        ip_network_to_return.append(ipaddress.ip_network(ip_list_or_str, strict=False))
-    elif isinstance(ip_list_or_str, list):
-        for addr in ip_list_or_str:
-            ip_network_to_return.append(ipaddress.ip_network(addr, strict=False))
-    else:
+        ip_list_or_str = [ip_list_or_str]
+    elif not isinstance(ip_list_or_str, (list, tuple)):
         raise ValueError("Unexpected value in the aws:SourceIp field of the policy.")
-    return ip_network_to_return
-        
+    return get_cidr_whitelist(tuple(whitelist)).contains_all(ip_list_or_str)
+
+class CidrWhitelist():
+    """The whitelisted IP networks, kept by IP version as sorted, merged and disjoint intervals of addresses.
+
+    A network is included in the whitelist when all its addresses are, possibly in several whitelisted networks.
+
+    Keyword arguments:
+    whitelist -- the IP addresses and networks of the WhitelistedIPs parameter
+    """
+
+    def __init__(self, whitelist):
+        networks = [get_ip_network(addr) for addr in whitelist]
+        # IP version -> (first addresses, last addresses) of the intervals
+        self.intervals = {version: merge_intervals([(int(net.network_address), int(net.broadcast_address)) for net in networks if net.version == version])
+                          for version in (4, 6)}
+
+    def contains(self, network):
+        begins, ends = self.intervals[network.version]
+        # The last interval beginning at or before the network.
+        index = bisect.bisect_right(begins, int(network.network_address)) - 1
+        return index >= 0 and ends[index] >= int(network.broadcast_address)
+
+    def contains_all(self, ip_list):
+        return all(self.contains(get_ip_network(addr)) for addr in ip_list)
+
+# The whitelist is compiled once per distinct parameter value.
+@functools.lru_cache(maxsize=MAX_WHITELISTS)
+def get_cidr_whitelist(whitelist):
+    return CidrWhitelist(whitelist)
+
+# The same IPs are found in the policies of many APIs.
+@functools.lru_cache(maxsize=MAX_IP_NETWORKS)
+def get_ip_network(addr):
+    return ipaddress.ip_network(addr, strict=False)
+
+# Sort the intervals and merge the overlapping or adjacent ones.
+def merge_intervals(intervals):
+    begins = []
+    ends = []
+    for begin, end in sorted(intervals):
+        if ends and begin <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            begins.append(begin)
+            ends.append(end)
+    return begins, ends
+
 def get_all_api_gateway(client):
     rest_apis_list = client.get_rest_apis(limit=500)
     apis_list = []
@@ -242,32 +276,21 @@ def is_ip_network(net):
     except:
         return False
 
-def build_parameters_value_error_response(ex):
-    return  build_error_response(internalErrorMessage="Customer error while parsing input parameters",
-                                 internalErrorDetails="Parameter value is invalid",
-                                 customerErrorCode="InvalidParameterValueException",
-                                 customerErrorMessage=str(ex))
-
 ####################
 # Helper Functions #
 ####################
 
 # This gets the client after assuming the Config service role
 # either in the same AWS account or cross-account.
-def get_client(service, event):
+def get_client(service, event, region=None):
     """Return the service boto client. It should be used instead of directly calling the client.
 
     Keyword arguments:
     service -- the service name used for calling the boto.client()
     event -- the event variable given in the lambda handler
+    region -- the region where the client is called (default: None)
     """
-    if not ASSUME_ROLE_MODE:
-        return boto3.client(service)
-    credentials = get_assume_role_credentials(event["executionRoleArn"])
-    return boto3.client(service, aws_access_key_id=credentials['AccessKeyId'],
-                        aws_secret_access_key=credentials['SecretAccessKey'],
-                        aws_session_token=credentials['SessionToken']
-                       )
+    return rdk_runtime.get_client(service, event, region, assume_role=ASSUME_ROLE_MODE)
 
 # This generate an evaluation for config
 def build_evaluation(resource_id, compliance_type, event, resource_type=DEFAULT_RESOURCE_TYPE, annotation=None):
@@ -278,16 +301,9 @@ def build_evaluation(resource_id, compliance_type, event, resource_type=DEFAULT_
     compliance_type -- either COMPLIANT, NON_COMPLIANT or NOT_APPLICABLE
     event -- the event variable given in the lambda handler
     resource_type -- the CloudFormation resource type (or AWS::::Account) to report on the rule (default DEFAULT_RESOURCE_TYPE)
-    annotation -- an annotation to be added to the evaluation (default None)
+    annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
     """
-    eval_cc = {}
-    if annotation:
-        eval_cc['Annotation'] = annotation
-    eval_cc['ComplianceResourceType'] = resource_type
-    eval_cc['ComplianceResourceId'] = resource_id
-    eval_cc['ComplianceType'] = compliance_type
-    eval_cc['OrderingTimestamp'] = str(json.loads(event['invokingEvent'])['notificationCreationTime'])
-    return eval_cc
+    return rdk_runtime.build_evaluation(resource_id, compliance_type, event, resource_type, annotation)
 
 def build_evaluation_from_config_item(configuration_item, compliance_type, annotation=None):
     """Form an evaluation as a dictionary. Usually suited to report on configuration change rules.
@@ -295,234 +311,14 @@ def build_evaluation_from_config_item(configuration_item, compliance_type, annot
     Keyword arguments:
     configuration_item -- the configurationItem dictionary in the invokingEvent
     compliance_type -- either COMPLIANT, NON_COMPLIANT or NOT_APPLICABLE
-    annotation -- an annotation to be added to the evaluation (default None)
+    annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
     """
-    eval_ci = {}
-    if annotation:
-        eval_ci['Annotation'] = annotation
-    eval_ci['ComplianceResourceType'] = configuration_item['resourceType']
-    eval_ci['ComplianceResourceId'] = configuration_item['resourceId']
-    eval_ci['ComplianceType'] = compliance_type
-    eval_ci['OrderingTimestamp'] = configuration_item['configurationItemCaptureTime']
-    return eval_ci
+    return rdk_runtime.build_evaluation_from_config_item(configuration_item, compliance_type, annotation)
 
 ####################
 # Boilerplate Code #
 ####################
 
-# Helper function to check if rule parameters exist
-def parameters_exist(parameters):
-    return len(parameters) != 0
-
-# Helper function used to validate input
-def check_defined(reference, reference_name):
-    if not reference:
-        raise Exception('Error: ', reference_name, 'is not defined')
-    return reference
-
-# Check whether the message is OversizedConfigurationItemChangeNotification or not
-def is_oversized_changed_notification(message_type):
-    check_defined(message_type, 'messageType')
-    return message_type == 'OversizedConfigurationItemChangeNotification'
-
-# Check whether the message is a ScheduledNotification or not.
-def is_scheduled_notification(message_type):
-    check_defined(message_type, 'messageType')
-    return message_type == 'ScheduledNotification'
-
-# Get configurationItem using getResourceConfigHistory API
-# in case of OversizedConfigurationItemChangeNotification
-def get_configuration(resource_type, resource_id, configuration_capture_time):
-    result = AWS_CONFIG_CLIENT.get_resource_config_history(
-        resourceType=resource_type,
-        resourceId=resource_id,
-        laterTime=configuration_capture_time,
-        limit=1)
-    configurationItem = result['configurationItems'][0]
-    return convert_api_configuration(configurationItem)
-
-# Convert from the API model to the original invocation model
-def convert_api_configuration(configurationItem):
-    for k, v in configurationItem.items():
-        if isinstance(v, datetime.datetime):
-            configurationItem[k] = str(v)
-    configurationItem['awsAccountId'] = configurationItem['accountId']
-    configurationItem['ARN'] = configurationItem['arn']
-    configurationItem['configurationStateMd5Hash'] = configurationItem['configurationItemMD5Hash']
-    configurationItem['configurationItemVersion'] = configurationItem['version']
-    configurationItem['configuration'] = json.loads(configurationItem['configuration'])
-    if 'relationships' in configurationItem:
-        for i in range(len(configurationItem['relationships'])):
-            configurationItem['relationships'][i]['name'] = configurationItem['relationships'][i]['relationshipName']
-    return configurationItem
-
-# Based on the type of message get the configuration item
-# either from configurationItem in the invoking event
-# or using the getResourceConfigHistiry API in getConfiguration function.
-def get_configuration_item(invokingEvent):
-    check_defined(invokingEvent, 'invokingEvent')
-    if is_oversized_changed_notification(invokingEvent['messageType']):
-        configurationItemSummary = check_defined(invokingEvent['configurationItemSummary'], 'configurationItemSummary')
-        return get_configuration(configurationItemSummary['resourceType'], configurationItemSummary['resourceId'], configurationItemSummary['configurationItemCaptureTime'])
-    elif is_scheduled_notification(invokingEvent['messageType']):
-        return None
-    return check_defined(invokingEvent['configurationItem'], 'configurationItem')
-
-# Check whether the resource has been deleted. If it has, then the evaluation is unnecessary.
-def is_applicable(configurationItem, event):
-    try:
-        check_defined(configurationItem, 'configurationItem')
-        check_defined(event, 'event')
-    except:
-        return True
-    status = configurationItem['configurationItemStatus']
-    eventLeftScope = event['eventLeftScope']
-    if status == 'ResourceDeleted':
-        print("Resource Deleted, setting Compliance Status to NOT_APPLICABLE.")
-    return (status == 'OK' or status == 'ResourceDiscovered') and not eventLeftScope
-
-def get_assume_role_credentials(role_arn):
-    sts_client = boto3.client('sts')
-    try:
-        assume_role_response = sts_client.assume_role(RoleArn=role_arn, RoleSessionName="configLambdaExecution")
-        return assume_role_response['Credentials']
-    except botocore.exceptions.ClientError as ex:
-        # Scrub error message for any internal account info leaks
-        if 'AccessDenied' in ex.response['Error']['Code']:
-            ex.response['Error']['Message'] = "AWS Config does not have permission to assume the IAM role."
-        else:
-            ex.response['Error']['Message'] = "InternalError"
-            ex.response['Error']['Code'] = "InternalError"
-        raise ex
-
-# This removes older evaluation (usually useful for periodic rule not reporting on AWS::::Account).
-def clean_up_old_evaluations(latest_evaluations, event):
-
-    cleaned_evalations = []
-
-    old_eval = AWS_CONFIG_CLIENT.get_compliance_details_by_config_rule(
-        ConfigRuleName=event['configRuleName'],
-        ComplianceTypes=['COMPLIANT', 'NON_COMPLIANT'],
-        Limit=100)
-
-    old_eval_list = []
-
-    while True:
-        for old_result in old_eval['EvaluationResults']:
-            old_eval_list.append(old_result)
-        if 'NextToken' in old_eval:
-            next_token = old_eval['NextToken']
-            old_eval = AWS_CONFIG_CLIENT.get_compliance_details_by_config_rule(
-                ConfigRuleName=event['configRuleName'],
-                ComplianceTypes=['COMPLIANT', 'NON_COMPLIANT'],
-                Limit=100,
-                NextToken=next_token)
-        else:
-            break
-
-    for old_eval in old_eval_list:
-        old_resource_id = old_eval['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
-        newer_founded = False
-        for latest_eval in latest_evaluations:
-            if old_resource_id == latest_eval['ComplianceResourceId']:
-                newer_founded = True
-        if not newer_founded:
-            cleaned_evalations.append(build_evaluation(old_resource_id, "NOT_APPLICABLE", event))
-
-    return cleaned_evalations + latest_evaluations
-
-# This decorates the lambda_handler in rule_code with the actual PutEvaluation call
+# The evaluation and the reporting to Config are done by the shared runtime, see rdk_runtime/README.md.
 def lambda_handler(event, context):
-
-    global AWS_CONFIG_CLIENT
-    AWS_CONFIG_CLIENT = get_client('config', event)
-
-    #print(event)
-    check_defined(event, 'event')
-    invoking_event = json.loads(event['invokingEvent'])
-    rule_parameters = {}
-    if 'ruleParameters' in event:
-        rule_parameters = json.loads(event['ruleParameters'])
-
-    try:
-        rule_parameters_clean = evaluate_parameters(rule_parameters)
-    except ValueError as ex:
-        return build_parameters_value_error_response(ex)
-
-    try:
-        configuration_item = get_configuration_item(invoking_event)
-        if invoking_event['messageType'] in ['ConfigurationItemChangeNotification', 'ScheduledNotification', 'OversizedConfigurationItemChangeNotification']:
-            if is_applicable(configuration_item, event):
-                compliance_result = evaluate_compliance(event, configuration_item, rule_parameters_clean)
-            else:
-                compliance_result = "NOT_APPLICABLE"
-        else:
-            return {'internalErrorMessage': 'Unexpected message type ' + str(invoking_event)}
-    except botocore.exceptions.ClientError as ex:
-        if is_internal_error(ex):
-            return build_internal_error_response("Unexpected error while completing API request", str(ex))
-        return build_error_response("Customer error while making API request", str(ex), ex.response['Error']['Code'], ex.response['Error']['Message'])
-    except ValueError as ex:
-        return build_internal_error_response(str(ex), str(ex))
-
-    evaluations = []
-    latest_evaluations = []
-
-    if not compliance_result:
-        latest_evaluations.append(build_evaluation(event['accountId'], "NOT_APPLICABLE", event, resource_type='AWS::::Account'))
-        evaluations = clean_up_old_evaluations(latest_evaluations, event)
-    elif isinstance(compliance_result, str):
-        evaluations.append(build_evaluation_from_config_item(configuration_item, compliance_result))
-    elif isinstance(compliance_result, list):
-        for evaluation in compliance_result:
-            missing_fields = False
-            for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-                if field not in evaluation:
-                    print("Missing " + field + " from custom evaluation.")
-                    missing_fields = True
-
-            if not missing_fields:
-                latest_evaluations.append(evaluation)
-        evaluations = clean_up_old_evaluations(latest_evaluations, event)
-    elif isinstance(compliance_result, dict):
-        missing_fields = False
-        for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-            if field not in compliance_result:
-                print("Missing " + field + " from custom evaluation.")
-                missing_fields = True
-        if not missing_fields:
-            evaluations.append(compliance_result)
-    else:
-        evaluations.append(build_evaluation_from_config_item(configuration_item, 'NOT_APPLICABLE'))
-
-    # Put together the request that reports the evaluation status
-    resultToken = event['resultToken']
-    testMode = False
-    if resultToken == 'TESTMODE':
-        # Used solely for RDK test to skip actual put_evaluation API call
-        testMode = True
-    # Invoke the Config API to report the result of the evaluation
-    evaluation_copy = []
-    evaluation_copy = evaluations[:]
-    while(evaluation_copy):
-        AWS_CONFIG_CLIENT.put_evaluations(Evaluations=evaluation_copy[:100], ResultToken=resultToken, TestMode=testMode)
-        del evaluation_copy[:100]
-    # Used solely for RDK test to be able to test Lambda function
-    return evaluations
-
-def is_internal_error(exception):
-    return ((not isinstance(exception, botocore.exceptions.ClientError)) or exception.response['Error']['Code'].startswith('5')
-            or 'InternalError' in exception.response['Error']['Code'] or 'ServiceError' in exception.response['Error']['Code'])
-
-def build_internal_error_response(internalErrorMessage, internalErrorDetails=None):
-    return build_error_response(internalErrorMessage, internalErrorDetails, 'InternalError', 'InternalError')
-
-def build_error_response(internalErrorMessage, internalErrorDetails=None, customerErrorCode=None, customerErrorMessage=None):
-    error_response = {
-        'internalErrorMessage': internalErrorMessage,
-        'internalErrorDetails': internalErrorDetails,
-        'customerErrorMessage': customerErrorMessage,
-        'customerErrorCode': customerErrorCode
-    }
-    print(error_response)
-    return error_response
+    return rdk_runtime.lambda_handler(event, context, sys.modules[__name__])
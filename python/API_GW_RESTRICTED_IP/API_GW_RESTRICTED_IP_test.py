@@ -195,8 +195,44 @@ class TestsOnCompliance(unittest.TestCase):
         resp_expected.append(build_expected_response('NON_COMPLIANT', 'name-api-1-no-match-address', annotation='The attached policy allows more than the whitelist.'))
         resp_expected.append(build_expected_response('NON_COMPLIANT', 'name-api-2-no-match-network', annotation='The attached policy allows more than the whitelist.'))
         assert_successful_evaluation(self, response, resp_expected, 2)
-    
-    
+
+    valid_whitelist_ip_adjacent = '{"WhitelistedIPs":"10.1.0.0/24,10.1.1.0/24,2001:db8::/33,2001:db8:8000::/33"}'
+
+    get_rest_with_apis_policy_match_adjacent_whitelist = {
+        'items': [{'name': 'name-api-1-match-adjacent-networks',
+                   'policy': json.dumps(json.dumps({'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Principal': '*', 'Action': 'execute-api:Invoke', 'Resource': '*',
+                                                                                           'Condition': {'IpAddress': {'aws:SourceIp': ['10.1.0.0/23', '2001:db8::/32']}}}]}))[1:-1],
+                   'endpointConfiguration': {'types': ['EDGE']}},
+                  {'name': 'name-api-2-no-match-family',
+                   'policy': json.dumps(json.dumps({'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Principal': '*', 'Action': 'execute-api:Invoke', 'Resource': '*',
+                                                                                           'Condition': {'IpAddress': {'aws:SourceIp': ['10.1.0.0/23', '::ffff:10.1.0.1']}}}]}))[1:-1],
+                   'endpointConfiguration': {'types': ['EDGE']}}
+                  ]
+    }
+    def test_whitelist_condition_matches_adjacent_networks(self):
+        apigw_client_mock.get_rest_apis = MagicMock(return_value=self.get_rest_with_apis_policy_match_adjacent_whitelist)
+        response = rule.lambda_handler(build_lambda_scheduled_event(rule_parameters=self.valid_whitelist_ip_adjacent), {})
+        resp_expected = []
+        resp_expected.append(build_expected_response('COMPLIANT', 'name-api-1-match-adjacent-networks'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'name-api-2-no-match-family', annotation='The attached policy allows more than the whitelist.'))
+        assert_successful_evaluation(self, response, resp_expected, 2)
+
+class TestsOnCidrWhitelist(unittest.TestCase):
+
+    def test_networks_merged_by_family(self):
+        cidr_whitelist = rule.get_cidr_whitelist(('10.0.0.0/8', '10.1.1.1', '11.0.0.0/8', '192.168.0.0/16', '::1'))
+        self.assertIs(cidr_whitelist, rule.get_cidr_whitelist(('10.0.0.0/8', '10.1.1.1', '11.0.0.0/8', '192.168.0.0/16', '::1')))
+        self.assertEqual([167772160, 3232235520], cidr_whitelist.intervals[4][0])
+        self.assertEqual([201326591, 3232301055], cidr_whitelist.intervals[4][1])
+        self.assertEqual(([1], [1]), cidr_whitelist.intervals[6])
+
+    def test_ip_in_whitelist(self):
+        whitelist = ['10.1.1.0/24', '10.1.2.0/28']
+        self.assertTrue(rule.is_ip_in_whitelist('10.1.1.10', whitelist))
+        self.assertTrue(rule.is_ip_in_whitelist(['10.1.1.0/25', '10.1.2.4/30'], whitelist))
+        self.assertFalse(rule.is_ip_in_whitelist(['10.1.1.2', '10.1.2.0/27'], whitelist))
+        self.assertFalse(rule.is_ip_in_whitelist('10.1.0.255', whitelist))
+        self.assertFalse(rule.is_ip_in_whitelist('::a01:101', whitelist))
 
 ####################
 # Helper Functions #
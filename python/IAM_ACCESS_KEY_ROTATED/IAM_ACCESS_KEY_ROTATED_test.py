@@ -176,10 +176,44 @@ class test_compliance(unittest.TestCase):
         resp_expected.append(build_expected_response("COMPLIANT", "AIDAJYPPIFB65RV8YYLDV"))
         assert_successful_evaluation(self, response, resp_expected, 2)
 
+class test_credential_report(unittest.TestCase):
+    def setUp(self):
+        config_client_mock.reset_mock()
+        iam_client_mock.reset_mock()
+        rule.rdk_runtime.clear_credential_report_cache()
+
+    def tearDown(self):
+        rule.rdk_runtime.clear_credential_report_cache()
+        iam_client_mock.get_credential_report = MagicMock()
+
+    user_list = {"Users": [{'UserId': 'AIDAJYPPIFB65RV8YYLDU', 'UserName': 'sampleUser1', 'CreateDate': datetime(2020, 1, 1, tzinfo=dateutil.tz.tzutc())},
+                           {'UserId': 'AIDAJYPPIFB65RV8YYLDV', 'UserName': 'sampleUser2', 'CreateDate': datetime(2020, 1, 1, tzinfo=dateutil.tz.tzutc())},
+                           {'UserId': 'AIDAJYPPIFB65RV8YYLDW', 'UserName': 'sampleUser3', 'CreateDate': datetime.utcnow().replace(tzinfo=dateutil.tz.tzutc())}]}
+
+    def test_keys_read_from_report(self):
+        iam_client_mock.list_users = MagicMock(return_value=self.user_list)
+        iam_client_mock.get_credential_report = MagicMock(return_value=build_credential_report_response([('sampleUser1', 120), ('sampleUser2', 10)]))
+        iam_client_mock.list_access_keys = MagicMock(return_value={'AccessKeyMetadata': []})
+        response = rule.lambda_handler(build_lambda_scheduled_event(), {})
+        resp_expected = []
+        resp_expected.append(build_expected_response("NON_COMPLIANT", "AIDAJYPPIFB65RV8YYLDU", annotation='This user (AIDAJYPPIFB65RV8YYLDU) has an expired active access key (access key 1). The key is older than 120 days. It must be no older than 90 days.'))
+        resp_expected.append(build_expected_response("COMPLIANT", "AIDAJYPPIFB65RV8YYLDV"))
+        resp_expected.append(build_expected_response("COMPLIANT", "AIDAJYPPIFB65RV8YYLDW"))
+        assert_successful_evaluation(self, response, resp_expected, 3)
+        # Only the user created after the report is looked up
+        iam_client_mock.list_access_keys.assert_called_once_with(UserName='sampleUser3')
+
 ####################
 # Helper Functions #
 ####################
 
+def build_credential_report_response(users_key_age):
+    content = 'user,arn,user_creation_time,password_enabled,password_last_used,mfa_active,access_key_1_active,access_key_1_last_rotated,access_key_1_last_used_date,access_key_2_active,access_key_2_last_rotated,access_key_2_last_used_date\n'
+    for user_name, key_age in users_key_age:
+        last_rotated = (datetime.utcnow() - timedelta(days=key_age)).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+        content += '{},arn:aws:iam::123456789012:user/{},2020-01-01T00:00:00+00:00,false,N/A,false,true,{},N/A,false,N/A,N/A\n'.format(user_name, user_name, last_rotated)
+    return {'Content': content.encode('utf-8'), 'ReportFormat': 'text/csv', 'GeneratedTime': datetime.utcnow().replace(tzinfo=dateutil.tz.tzutc())}
+
 def build_lambda_configurationchange_event(invoking_event, rule_parameters=None):
     rule_parameters = json.dumps(rule_parameters)
     invoking_event = json.dumps(invoking_event)
@@ -10,6 +10,8 @@
 # the specific language governing permissions and limitations under the License.
 
 import sys
+import random
+import ipaddress
 import unittest
 try:
     from unittest.mock import MagicMock
@@ -75,6 +77,7 @@ class ComplianceTest(unittest.TestCase):
     def setUp(self):
         CONFIG_CLIENT_MOCK.reset_mock()
         IAM_CLIENT_MOCK.reset_mock()
+        RULE.rdk_runtime.clear_policy_document_cache()
 
     user_list_empty = {"Users" : []}
     user_whitelist = {'UserId': 'AIDAJYPPIFB65RV8YYLDU', 'UserName': 'sampleUser1'}
@@ -177,6 +180,17 @@ class ComplianceTest(unittest.TestCase):
         resp_expected.append(build_expected_response("NON_COMPLIANT", self.user_not_whitelist['UserId'], annotation=f"IAM Policy includes more than maximum ip addresses: {RULE.DEFAULT_MAX_IP_NUMS+1}"))
         assert_successful_evaluation(self, response, resp_expected, 2)
 
+    def test_group_verdict_computed_once(self):
+        self.__mock_all_policy_ip_allowed()
+        users = [{'UserId': 'AIDAJYPPIFB65RV8YYLD{}'.format(n), 'UserName': 'sampleUser{}'.format(n)} for n in range(3, 8)]
+        IAM_CLIENT_MOCK.list_users = MagicMock(return_value={'Users': users})
+        response = RULE.lambda_handler(build_lambda_scheduled_event(), {})
+        resp_expected = [build_expected_response("COMPLIANT", user['UserId']) for user in users]
+        assert_successful_evaluation(self, response, resp_expected, len(users))
+        self.assertEqual(len(users), IAM_CLIENT_MOCK.list_groups_for_user.call_count)
+        IAM_CLIENT_MOCK.list_group_policies.assert_called_once_with(GroupName='sampleGroup')
+        IAM_CLIENT_MOCK.get_group_policy.assert_called_once()
+
     def __mock_only_user_inline_policy_not_ip_allowed(self):
         self.__mock_base()
         ip_allowed_policy = self.__ip_restricted_policy('Allow')
@@ -320,6 +334,180 @@ class ComplianceTest(unittest.TestCase):
         return policy
 
 
+class StatementOrderTest(unittest.TestCase):
+    """The verdicts merged by policy and by group give the compliance and the annotation of the statement by statement
+    evaluation of the rule before the verdicts were merged, see evaluate_statement_order()."""
+
+    max_ip_num = 20
+
+    def setUp(self):
+        RULE.rdk_runtime.clear_policy_document_cache()
+
+    def test_mixed_policies_allowed_everywhere(self):
+        account = build_account(user_inline=[[allow_ips(1)]], user_attached=[[allow_ips(4), allow_ips(2)]],
+                                groups=[([[allow_ips(8)]], [[allow_ips(16)]])])
+        self.assert_same_as_statement_order(account, ('COMPLIANT', None))
+
+    def test_mixed_policies_one_group_statement_not_allowed(self):
+        account = build_account(user_inline=[[allow_ips(1)]], user_attached=[[allow_ips(2)]],
+                                groups=[([[allow_ips(4)]], []), ([], [[allow_ips(8), allow_all()]])])
+        self.assert_same_as_statement_order(account, ('NON_COMPLIANT', None))
+
+    def test_annotation_of_last_condition_over_maximum(self):
+        # As before, each condition over the maximum replaces the annotation of the previous ones.
+        account = build_account(user_inline=[[allow_ips(21)]], user_attached=[[allow_ips(2)]],
+                                groups=[([[allow_ips(32)]], [[allow_ips(4)]])])
+        self.assert_same_as_statement_order(account, ('NON_COMPLIANT', 'IAM Policy includes more than maximum ip addresses: 32'))
+
+    def test_annotation_after_deny_in_same_policy_list(self):
+        # The deny ends the statements of its policy only: the next user inline policy is still checked.
+        account = build_account(user_inline=[[deny_ips(1), allow_ips(64)], [allow_ips(128)]], user_attached=[[allow_ips(256)]],
+                                groups=[([[allow_ips(512)]], [])])
+        self.assert_same_as_statement_order(account, ('COMPLIANT', 'IAM Policy includes more than maximum ip addresses: 128'))
+
+    def test_groups_skipped_after_user_deny(self):
+        account = build_account(user_inline=[[allow_all()]], user_attached=[[deny_ips(2)]],
+                                groups=[([[allow_ips(64)]], [[deny_ips(1)]])])
+        iam_client = self.assert_same_as_statement_order(account, ('COMPLIANT', None))
+        iam_client.list_group_policies.assert_not_called()
+        iam_client.list_attached_group_policies.assert_not_called()
+
+    def test_group_attached_skipped_after_group_inline_deny(self):
+        account = build_account(user_inline=[[allow_all()]], user_attached=[],
+                                groups=[([[deny_ips(4), allow_ips(64)]], [[allow_ips(128)]]), ([[allow_ips(256)]], [])])
+        iam_client = self.assert_same_as_statement_order(account, ('COMPLIANT', None))
+        iam_client.list_attached_group_policies.assert_not_called()
+
+    def test_random_accounts(self):
+        generator = random.Random(20200101)
+        statement_builders = [allow_all, lambda: allow_ips(generator.choice([1, 4, 21, 64])),
+                              lambda: deny_ips(generator.choice([1, 8, 32])), deny_all]
+
+        def build_policies():
+            return [[generator.choice(statement_builders)() for _ in range(generator.randint(1, 3))]
+                    for _ in range(generator.randint(0, 2))]
+
+        for _ in range(300):
+            account = build_account(build_policies(), build_policies(),
+                                    [(build_policies(), build_policies()) for _ in range(generator.randint(0, 3))])
+            RULE.rdk_runtime.clear_policy_document_cache()
+            self.assert_same_as_statement_order(account)
+
+    def assert_same_as_statement_order(self, account, expected=None):
+        expected_by_statements = evaluate_statement_order(account, self.max_ip_num)
+        if expected is not None:
+            self.assertEqual(expected, expected_by_statements)
+        iam_client = build_iam_client(account)
+        evaluater = RULE.ComplianceEvaluater(iam_client, 'sampleUser', self.max_ip_num, RULE.GroupVerdicts(iam_client, self.max_ip_num))
+        self.assertEqual(expected_by_statements, (evaluater.check_compliant(), evaluater.annotation), account)
+        return iam_client
+
+def allow_all():
+    return {'Effect': 'Allow', 'Action': '*', 'Resource': '*'}
+
+def deny_all():
+    return {'Effect': 'Deny', 'Action': '*', 'Resource': '*'}
+
+# A statement whose condition holds ip_num addresses (a power of 2).
+def allow_ips(ip_num):
+    return dict(allow_all(), Condition={'IpAddress': {'aws:SourceIp': [build_network(ip_num)]}})
+
+def deny_ips(ip_num):
+    return dict(deny_all(), Condition={'NotIpAddress': {'aws:SourceIp': [build_network(ip_num)]}})
+
+def build_network(ip_num):
+    return '10.0.0.0/{}'.format(32 - (ip_num - 1).bit_length())
+
+def build_account(user_inline, user_attached, groups):
+    """Return the policies of a user, each policy being a list of statements.
+
+    Keyword arguments:
+    user_inline -- the inline policies of the user
+    user_attached -- the managed policies attached to the user
+    groups -- the (inline policies, attached policies) of each group of the user
+    """
+    return {'user_inline': user_inline, 'user_attached': user_attached, 'groups': groups}
+
+def build_document(statements):
+    # A policy of one statement may give it as a dictionary.
+    return {'Version': '2012-10-17', 'Statement': statements[0] if len(statements) == 1 else statements}
+
+def build_iam_client(account):
+    documents = {}
+
+    def attach(prefix, policies):
+        attached = []
+        for index, statements in enumerate(policies):
+            policy_arn = 'arn:aws:iam::123456789012:policy/{}-{}'.format(prefix, index)
+            documents[policy_arn] = build_document(statements)
+            attached.append({'PolicyName': '{}-{}'.format(prefix, index), 'PolicyArn': policy_arn})
+        return {'AttachedPolicies': attached}
+
+    def group_name(index):
+        return 'group-{}'.format(index)
+
+    user_attached = attach('user', account['user_attached'])
+    group_attached = {group_name(index): attach(group_name(index), attached) for index, (_, attached) in enumerate(account['groups'])}
+    group_inline = {group_name(index): inline for index, (inline, _) in enumerate(account['groups'])}
+
+    iam_client = MagicMock()
+    iam_client.list_user_policies = MagicMock(return_value={'PolicyNames': [str(index) for index in range(len(account['user_inline']))]})
+    iam_client.get_user_policy = MagicMock(side_effect=lambda UserName, PolicyName: {
+        'PolicyDocument': build_document(account['user_inline'][int(PolicyName)])})
+    iam_client.list_attached_user_policies = MagicMock(return_value=user_attached)
+    iam_client.list_groups_for_user = MagicMock(return_value={'Groups': [{'GroupName': name} for name in sorted(group_inline)]})
+    iam_client.list_group_policies = MagicMock(side_effect=lambda GroupName: {
+        'PolicyNames': [str(index) for index in range(len(group_inline[GroupName]))]})
+    iam_client.get_group_policy = MagicMock(side_effect=lambda GroupName, PolicyName: {
+        'PolicyDocument': build_document(group_inline[GroupName][int(PolicyName)])})
+    iam_client.list_attached_group_policies = MagicMock(side_effect=lambda GroupName: group_attached[GroupName])
+    iam_client.get_policy = MagicMock(side_effect=lambda PolicyArn: {'Policy': {'Arn': PolicyArn, 'DefaultVersionId': 'v1'}})
+    iam_client.get_policy_version = MagicMock(side_effect=lambda PolicyArn, VersionId: {'PolicyVersion': {'Document': documents[PolicyArn]}})
+    return iam_client
+
+def evaluate_statement_order(account, max_ip_num):
+    """Return the (compliance type, annotation) of the user, checking the statements one by one in the order of the
+    rule before the verdicts were merged: user inline, user attached, then the inline and attached policies of
+    each group, a kind of policies being skipped once a statement denied the requests from outside of some IPs."""
+    state = {'is_ip_denied': False, 'is_all_policy_ip_allowed': None, 'annotation': None}
+
+    def is_valid_ips(ips):
+        if not ips:
+            return False
+        ip_nums = sum(ipaddress.ip_network(ip).num_addresses for ip in set(ips))
+        if ip_nums > max_ip_num:
+            state['annotation'] = f'IAM Policy includes more than maximum ip addresses: {ip_nums}'
+            return False
+        return True
+
+    def get_ips(statement, effect, operator):
+        if statement['Effect'] != effect:
+            return []
+        return statement.get('Condition', {}).get(operator, {}).get('aws:SourceIp', [])
+
+    def check_policies(policies):
+        if state['is_ip_denied']:
+            return
+        for statements in policies:
+            for statement in statements:
+                if is_valid_ips(get_ips(statement, 'Deny', 'NotIpAddress')):
+                    state['is_ip_denied'] = True
+                    break
+                if is_valid_ips(get_ips(statement, 'Allow', 'IpAddress')):
+                    if state['is_all_policy_ip_allowed'] is not False:
+                        state['is_all_policy_ip_allowed'] = True
+                else:
+                    state['is_all_policy_ip_allowed'] = False
+
+    check_policies(account['user_inline'])
+    check_policies(account['user_attached'])
+    for group_inline, group_attached in account['groups']:
+        check_policies(group_inline)
+        check_policies(group_attached)
+
+    is_compliant = state['is_ip_denied'] or state['is_all_policy_ip_allowed'] is True
+    return 'COMPLIANT' if is_compliant else 'NON_COMPLIANT', state['annotation']
+
 ####################
 # Helper Functions #
 ####################
@@ -332,7 +520,7 @@ def build_lambda_configurationchange_event(invoking_event, rule_parameters=None)
         'invokingEvent': invoking_event,
         'accountId': '123456789012',
         'configRuleArn': 'arn:aws:config:us-east-1:123456789012:config-rule/config-rule-8fngan',
-        'resultToken':'token'
+        'resultToken':'TESTMODE'
     }
     if rule_parameters:
         event_to_return['ruleParameters'] = rule_parameters
@@ -347,7 +535,7 @@ def build_lambda_scheduled_event(rule_parameters=None):
         'invokingEvent': invoking_event,
         'accountId': '123456789012',
         'configRuleArn': 'arn:aws:config:us-east-1:123456789012:config-rule/config-rule-8fngan',
-        'resultToken':'token'
+        'resultToken':'TESTMODE'
     }
     if rule_parameters:
         event_to_return['ruleParameters'] = rule_parameters
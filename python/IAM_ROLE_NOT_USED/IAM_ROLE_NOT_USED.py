@@ -49,17 +49,28 @@ Scenarios:
 
 
 import json
+import time
+import random
+import threading
 
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 
+from botocore.exceptions import ClientError
 from rdklib import Evaluator, Evaluation, ConfigRule, ComplianceType, InvalidParametersError
 
 
-CURRENT_TIME = datetime.now(timezone.utc)
 RESOURCE_TYPE = 'AWS::IAM::Role'
-PAGE_SIZE = 20
+# Maximum number of results of a select_resource_config page
+PAGE_SIZE = 100
 DEFAULT_DAYS = 90
 
+# Maximum number of get_role calls in flight; fewer while IAM throttles them
+ROLE_WORKERS = 16
+THROTTLING_ERROR_CODES = ('Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException')
+MAX_ATTEMPTS = 8
+BACKOFF_SECONDS = 0.2
+
 
 class IAM_ROLE_NOT_USED(ConfigRule):
 
@@ -68,20 +79,28 @@ class IAM_ROLE_NOT_USED(ConfigRule):
         iam_client = client_factory.build_client(service='iam')
         config_client = client_factory.build_client(service='config')
 
-        for username in describe_roles(config_client):
-            user_data = iam_client.get_role(RoleName=username)
-            last_used = user_data['Role']['RoleLastUsed']
-            if last_used:
-                diff = (CURRENT_TIME - last_used['LastUsedDate']).days
-            else:
-                created_on = user_data['Role']['CreateDate']
-                diff = (CURRENT_TIME - created_on).days
-            if diff <= valid_rule_parameters['DaysBeforeUnused']:
-                evaluations.append(Evaluation(ComplianceType.COMPLIANT, username, RESOURCE_TYPE))
-            else:
-                evaluations.append(Evaluation(ComplianceType.NON_COMPLIANT,
-                                              username, RESOURCE_TYPE,
-                                              annotation="Ensure that no AWS IAM Role is unused and make an action if unused (e.g. delete the user)."))
+        # The clock is read on every invocation, a warm container importing the rule only once
+        current_time = datetime.now(timezone.utc)
+        limiter = AdaptiveLimiter(ROLE_WORKERS)
+        role_names = list(describe_roles(config_client))
+
+        with ThreadPoolExecutor(max_workers=ROLE_WORKERS) as executor:
+            roles = executor.map(lambda role_name: get_role(iam_client, role_name, limiter), role_names)
+            for role_name, role in zip(role_names, roles):
+                # Deleted since it was recorded by Config
+                if role is None:
+                    continue
+                last_used = role['RoleLastUsed']
+                if last_used:
+                    diff = (current_time - last_used['LastUsedDate']).days
+                else:
+                    diff = (current_time - role['CreateDate']).days
+                if diff <= valid_rule_parameters['DaysBeforeUnused']:
+                    evaluations.append(Evaluation(ComplianceType.COMPLIANT, role_name, RESOURCE_TYPE))
+                else:
+                    evaluations.append(Evaluation(ComplianceType.NON_COMPLIANT,
+                                                  role_name, RESOURCE_TYPE,
+                                                  annotation="Ensure that no AWS IAM Role is unused and make an action if unused (e.g. delete the user)."))
         return evaluations
 
     def evaluate_parameters(self, rule_parameters):
@@ -102,8 +121,55 @@ class IAM_ROLE_NOT_USED(ConfigRule):
         return rule_parameters
 
 
+class AdaptiveLimiter():
+    """Bound the number of calls in flight: the limit is halved when a call is throttled, and grows back
+    by about one for each limit's worth of successful calls, up to the maximum."""
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+# Return the role, or None if it no longer exists; the throttled calls are retried with a jittered backoff
+def get_role(iam_client, role_name, limiter):
+    for attempt in range(MAX_ATTEMPTS):
+        throttled = False
+        limiter.acquire()
+        try:
+            return iam_client.get_role(RoleName=role_name)['Role']
+        except ClientError as ex:
+            error_code = ex.response['Error']['Code']
+            if error_code == 'NoSuchEntity':
+                return None
+            if error_code not in THROTTLING_ERROR_CODES or attempt == MAX_ATTEMPTS - 1:
+                raise
+            throttled = True
+        finally:
+            limiter.release(throttled)
+        time.sleep(random.uniform(0, BACKOFF_SECONDS * 2 ** attempt))
+    return None
+
+
+# Only the name of the roles is selected, by pages of the maximum size
 def describe_roles(config_client):
-    sql = "select * where resourceType = 'AWS::IAM::Role'"
+    sql = "SELECT resourceName WHERE resourceType = 'AWS::IAM::Role'"
     next_token = True
     response = config_client.select_resource_config(Expression=sql, Limit=PAGE_SIZE)
     while next_token:
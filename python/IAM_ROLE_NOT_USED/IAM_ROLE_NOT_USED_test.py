@@ -14,6 +14,7 @@ import unittest
 from datetime import datetime, timezone, timedelta
 
 from mock import patch, MagicMock
+from botocore.exceptions import ClientError
 from rdklib import Evaluation, ComplianceType, InvalidParametersError
 import rdklibtest
 
@@ -49,6 +50,10 @@ def mock_get_client(service, *args, **kwargs):
 @patch.object(CLIENT_FACTORY, 'build_client', MagicMock(side_effect=mock_get_client))
 class ComplianceTest(unittest.TestCase):
 
+    def tearDown(self):
+        CONFIG_CLIENT.select_resource_config = MagicMock()
+        IAM_CLIENT_MOCK.get_role = MagicMock()
+
     def test_compliance(self):
         rule_parameters = {"DaysBeforeUnused": "90"}
         rule_parameters = RULE.evaluate_parameters(rule_parameters)
@@ -69,6 +74,47 @@ class ComplianceTest(unittest.TestCase):
         resp_expected = [Evaluation(ComplianceType.NON_COMPLIANT, 'AWS-CodePipeline-Service', RESOURCE_TYPE)]
         rdklibtest.assert_successful_evaluation(self, response, resp_expected, 1)
 
+    def test_roles_selected_by_pages(self):
+        rule_parameters = RULE.evaluate_parameters({"DaysBeforeUnused": "90"})
+        input_event = rdklibtest.create_test_scheduled_event(rule_parameters_json=rule_parameters)
+        CONFIG_CLIENT.select_resource_config = MagicMock(side_effect=[
+            {"Results": ['{"resourceName":"role-1"}', '{"resourceName":"role-2"}'], "NextToken": "page-2"},
+            {"Results": ['{"resourceName":"role-3"}']}])
+        IAM_CLIENT_MOCK.get_role = MagicMock(side_effect=lambda RoleName: {"Role": {"RoleName": RoleName, "RoleLastUsed": {"LastUsedDate": datetime.now(timezone.utc)}}})
+        response = RULE.evaluate_periodic(input_event, CLIENT_FACTORY, rule_parameters)
+        resp_expected = [Evaluation(ComplianceType.COMPLIANT, role_name, RESOURCE_TYPE) for role_name in ('role-1', 'role-2', 'role-3')]
+        rdklibtest.assert_successful_evaluation(self, response, resp_expected, 3)
+        CONFIG_CLIENT.select_resource_config.assert_called_with(Expression="SELECT resourceName WHERE resourceType = 'AWS::IAM::Role'", NextToken='page-2', Limit=100)
+
+    @patch('time.sleep', MagicMock())
+    def test_throttled_calls_retried(self):
+        rule_parameters = RULE.evaluate_parameters({"DaysBeforeUnused": "90"})
+        input_event = rdklibtest.create_test_scheduled_event(rule_parameters_json=rule_parameters)
+        CONFIG_CLIENT.select_resource_config = MagicMock(return_value={"Results": ['{"resourceName":"role-1"}', '{"resourceName":"deleted-role"}']})
+        role = {"Role": {"RoleLastUsed": {}, "CreateDate": datetime.now(timezone.utc) - timedelta(days=10)}}
+        responses = {'role-1': iter([build_client_error('Throttling'), build_client_error('Throttling'), role]),
+                     'deleted-role': iter([build_client_error('NoSuchEntity')])}
+        def get_role(RoleName):
+            response = next(responses[RoleName])
+            if isinstance(response, ClientError):
+                raise response
+            return response
+        IAM_CLIENT_MOCK.get_role = MagicMock(side_effect=get_role)
+        response = RULE.evaluate_periodic(input_event, CLIENT_FACTORY, rule_parameters)
+        rdklibtest.assert_successful_evaluation(self, response, [Evaluation(ComplianceType.COMPLIANT, 'role-1', RESOURCE_TYPE)], 1)
+
+    def test_limiter_adapts_to_throttling(self):
+        limiter = MODULE.AdaptiveLimiter(16)
+        limiter.acquire()
+        limiter.release(throttled=True)
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(4, limiter.limit)
+        for _ in range(200):
+            limiter.acquire()
+            limiter.release(throttled=False)
+        self.assertEqual(16, limiter.limit)
+
     def test_invalid_params_strings(self):
         rule_parameters = {"DaysBeforeUnused": "sdfsdf"}
         with self.assertRaises(InvalidParametersError) as context:
@@ -80,3 +126,7 @@ class ComplianceTest(unittest.TestCase):
         with self.assertRaises(InvalidParametersError) as context:
             RULE.evaluate_parameters(rule_parameters)
         self.assertIn('The parameter "DaysBeforeUnused" must be greater than or equal to 0', str(context.exception))
+
+
+def build_client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'GetRole')
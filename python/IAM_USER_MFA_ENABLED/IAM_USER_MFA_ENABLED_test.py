@@ -192,7 +192,7 @@ def build_lambda_configurationchange_event(invoking_event, rule_parameters=None)
         'invokingEvent': invoking_event,
         'accountId': '123456789012',
         'configRuleArn': 'arn:aws:config:us-east-1:123456789012:config-rule/config-rule-8fngan',
-        'resultToken':'token'
+        'resultToken':'TESTMODE'
     }
     if rule_parameters:
         event_to_return['ruleParameters'] = rule_parameters
@@ -207,7 +207,7 @@ def build_lambda_scheduled_event(rule_parameters=None):
         'invokingEvent': invoking_event,
         'accountId': '123456789012',
         'configRuleArn': 'arn:aws:config:us-east-1:123456789012:config-rule/config-rule-8fngan',
-        'resultToken':'token'
+        'resultToken':'TESTMODE'
     }
     if rule_parameters:
         event_to_return['ruleParameters'] = rule_parameters
@@ -5,7 +5,9 @@
 # Can be used stand-alone or with the Rule Compliance Engine: https://github.com/awslabs/aws-config-engine-for-compliance-as-code
 #
 import sys
+import json
 import unittest
+import urllib.parse
 try:
     from unittest.mock import MagicMock, patch, ANY
 except ImportError:
@@ -56,6 +58,9 @@ class ComplianceTest(unittest.TestCase):
     get_managed_policy_doc_allow = {"PolicyVersion": {"Document": {"Statement": [{"Effect": "Allow", "Action": "*"}]}}}
     get_managed_policy_doc_deny = {"PolicyVersion": {"Document": {"Statement": [{"Effect": "Deny", "Action": "*"}]}}}
 
+    def setUp(self):
+        rule.rdk_runtime.clear_policy_document_cache()
+
     def test_non_compliant_inline(self):
         iam_client_mock.list_user_policies = MagicMock(return_value=self.list_user_policy_names)
         iam_client_mock.get_user_policy = MagicMock(return_value=self.get_user_policy_doc)
@@ -87,10 +92,97 @@ class ComplianceTest(unittest.TestCase):
         resp_expected.append(build_expected_response('COMPLIANT', 'AIDAICVB3PKAQMPEGDW2C'))
         assert_successful_evaluation(self, response, resp_expected)
 
+class PeriodicComplianceTest(unittest.TestCase):
+
+    full_star_document = {"Statement": [{"Effect": "Allow", "Action": "*"}]}
+    read_only_document = {"Statement": [{"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"}]}
+
+    def setUp(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': []})
+        config_client_mock.put_evaluations = MagicMock(return_value={'FailedEvaluations': []})
+        iam_client_mock.get_policy = MagicMock(side_effect=Exception('The managed policies are in the snapshot.'))
+
+    def test_entities_evaluated_from_snapshot(self):
+        first_page = {'UserDetailList': [build_user_detail('user1', 'AIDAICVB3PKAQMPEGDW21', inline_documents={'policyname1': self.full_star_document}),
+                                           build_user_detail('user2', 'AIDAICVB3PKAQMPEGDW22', attached_policy_arns=['arn1'])],
+                      'Policies': [build_managed_policy('arn1', 'managedpolicy1', self.full_star_document)],
+                      'IsTruncated': True, 'Marker': 'page-2'}
+        second_page = {'UserDetailList': [build_user_detail('user3', 'AIDAICVB3PKAQMPEGDW23', inline_documents={'policyname3': self.read_only_document},
+                                                              attached_policy_arns=['arn2'])],
+                       'Policies': [build_managed_policy('arn2', 'managedpolicy2', self.read_only_document)],
+                       'IsTruncated': False}
+        iam_client_mock.get_account_authorization_details = MagicMock(side_effect=[first_page, second_page])
+        response = rule.lambda_handler(build_lambda_scheduled_event(), {})
+        resp_expected = []
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAICVB3PKAQMPEGDW21', annotation='The inline policy "policyname1" attached to the user "user1" has full star allow permissions.'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAICVB3PKAQMPEGDW22', annotation='The managed policy "managedpolicy1" attached to the user "user2" has full star allow permissions.'))
+        resp_expected.append(build_expected_response('COMPLIANT', 'AIDAICVB3PKAQMPEGDW23'))
+        assert_successful_evaluation(self, response, resp_expected, 3)
+        iam_client_mock.get_account_authorization_details.assert_called_with(Filter=['User', 'LocalManagedPolicy', 'AWSManagedPolicy'], MaxItems=1000, Marker='page-2')
+
+class RecordedPoliciesTest(unittest.TestCase):
+
+    full_star_document = {"Statement": [{"Effect": "Allow", "Action": "*"}]}
+    read_only_document = {"Statement": [{"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"}]}
+
+    def setUp(self):
+        rule.rdk_runtime.clear_policy_document_cache()
+        iam_client_mock.list_user_policies = MagicMock(side_effect=Exception('The inline policies are in the configuration item.'))
+        iam_client_mock.list_attached_user_policies = MagicMock(side_effect=Exception('The managed policies are in the configuration item.'))
+        iam_client_mock.get_policy = MagicMock(side_effect=Exception('The managed policy is recorded by Config.'))
+        config_client_mock.batch_get_resource_config = MagicMock(return_value={'baseConfigurationItems': [
+            build_policy_configuration_item('arn:aws:iam::123456789012:policy/managedpolicy1', self.full_star_document)]})
+
+    def test_non_compliant_inline(self):
+        invoking_event = build_recorded_invoking_event(inline_documents={'policyname1': self.full_star_document})
+        response = rule.lambda_handler(build_lambda_configurationchange_event(invoking_event), {})
+        resp_expected = [build_expected_response('NON_COMPLIANT', 'AIDAICVB3PKAQMPEGDW2C', annotation='The inline policy "policyname1" attached to the user "someusername" has full star allow permissions.')]
+        assert_successful_evaluation(self, response, resp_expected)
+        config_client_mock.batch_get_resource_config.assert_not_called()
+
+    def test_non_compliant_managed(self):
+        invoking_event = build_recorded_invoking_event(inline_documents={'policyname1': self.read_only_document}, attached_policy_names=['managedpolicy1'])
+        response = rule.lambda_handler(build_lambda_configurationchange_event(invoking_event), {})
+        resp_expected = [build_expected_response('NON_COMPLIANT', 'AIDAICVB3PKAQMPEGDW2C', annotation='The managed policy "managedpolicy1" attached to the user "someusername" has full star allow permissions.')]
+        assert_successful_evaluation(self, response, resp_expected)
+        config_client_mock.batch_get_resource_config.assert_called_once_with(resourceKeys=[{'resourceType': 'AWS::IAM::Policy', 'resourceId': 'ANPAmanagedpolicy1'}])
+
 ####################
 # Helper Functions #
 ####################
 
+def build_recorded_invoking_event(inline_documents=None, attached_policy_names=()):
+    configuration_item = {
+        'configurationItemStatus': 'OK',
+        'resourceType': DEFAULT_RESOURCE_TYPE,
+        'resourceId': 'AIDAICVB3PKAQMPEGDW2C',
+        'configurationItemCaptureTime': '2018-02-20T06:56:55.533Z',
+        'configuration': {
+            'userName': 'someusername',
+            'userPolicyList': [{'policyName': name, 'policyDocument': urllib.parse.quote(json.dumps(document))} for name, document in (inline_documents or {}).items()],
+            'attachedManagedPolicies': [{'policyName': name, 'policyArn': 'arn:aws:iam::123456789012:policy/' + name} for name in attached_policy_names]
+        },
+        'relationships': [{'resourceType': 'AWS::IAM::Policy', 'resourceId': 'ANPA' + name, 'resourceName': name, 'name': 'Is attached to CustomerManagedPolicy'}
+                          for name in attached_policy_names]
+    }
+    return json.dumps({'messageType': 'ConfigurationItemChangeNotification', 'notificationCreationTime': '2018-02-20T06:56:55.533Z', 'configurationItem': configuration_item})
+
+def build_policy_configuration_item(arn, document):
+    configuration = {'arn': arn, 'defaultVersionId': 'v2',
+                     'policyVersionList': [{'versionId': 'v1', 'isDefaultVersion': False, 'document': urllib.parse.quote(json.dumps({}))},
+                                           {'versionId': 'v2', 'isDefaultVersion': True, 'document': urllib.parse.quote(json.dumps(document))}]}
+    return {'resourceType': 'AWS::IAM::Policy', 'arn': arn, 'configuration': json.dumps(configuration)}
+
+def build_user_detail(user_name, user_id, inline_documents=None, attached_policy_arns=()):
+    return {'UserName': user_name, 'UserId': user_id,
+            'UserPolicyList': [{'PolicyName': name, 'PolicyDocument': document} for name, document in (inline_documents or {}).items()],
+            'AttachedManagedPolicies': [{'PolicyArn': arn, 'PolicyName': arn} for arn in attached_policy_arns]}
+
+def build_managed_policy(arn, policy_name, document):
+    return {'Arn': arn, 'PolicyName': policy_name, 'DefaultVersionId': 'v2',
+            'PolicyVersionList': [{'VersionId': 'v1', 'IsDefaultVersion': False, 'Document': {}},
+                                  {'VersionId': 'v2', 'IsDefaultVersion': True, 'Document': document}]}
+
 def build_lambda_configurationchange_event(invoking_event, rule_parameters=None):
     event_to_return = {
         'configRuleName':'myrule',
@@ -99,7 +191,7 @@ def build_lambda_configurationchange_event(invoking_event, rule_parameters=None)
         'invokingEvent': invoking_event,
         'accountId': '123456789012',
         'configRuleArn': 'arn:aws:config:us-east-1:123456789012:config-rule/config-rule-8fngan',
-        'resultToken':'token'
+        'resultToken':'TESTMODE'
     }
     if rule_parameters:
         event_to_return['ruleParameters'] = rule_parameters
@@ -114,7 +206,7 @@ def build_lambda_scheduled_event(rule_parameters=None):
         'invokingEvent': invoking_event,
         'accountId': '123456789012',
         'configRuleArn': 'arn:aws:config:us-east-1:123456789012:config-rule/config-rule-8fngan',
-        'resultToken':'token'
+        'resultToken':'TESTMODE'
     }
     if rule_parameters:
         event_to_return['ruleParameters'] = rule_parameters
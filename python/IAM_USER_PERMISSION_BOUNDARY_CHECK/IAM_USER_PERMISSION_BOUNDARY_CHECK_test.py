@@ -54,6 +54,11 @@ class TESTInvalidpermissionboundary(unittest.TestCase):
 class TESTScenarios2to8(unittest.TestCase):
     user_list = {'Users': [{'UserId': 'AIDAIDFOUX2OSRO6DO7XM', 'UserName': 'user-name-1'}, {'UserId': 'AIDAIDFOUX2OSRO6DO7XN', 'UserName': 'user-name-2'}]}
 
+    # These scenarios get the users one by one, as without the iam:GetAccountAuthorizationDetails permission.
+    def setUp(self):
+        IAM_CLIENT_MOCK.get_account_authorization_details = MagicMock(side_effect=build_client_error('AccessDenied'))
+        IAM_CLIENT_MOCK.list_policies = MagicMock(return_value={'Policies': [{'Arn': 'arn:aws:iam::aws:policy/AdministratorAccess'}], 'IsTruncated': False})
+
     def construct_permission_list(self, UserName):
         user_info_list = {"User": {"UserName": "user-name-1", "PermissionsBoundary": {"PermissionsBoundaryType": "Policy", "PermissionsBoundaryArn": "arn:aws:iam::aws:policy/AdministratorAccess"}, "UserId": "AIDAJDTYJDDPUWJ7IR3G2", "Arn": "arn:aws:iam::677885075477:user/ddbtest"}}
         return user_info_list
@@ -74,8 +79,8 @@ class TESTScenarios2to8(unittest.TestCase):
         lambda_event = build_lambda_scheduled_event()
         response = RULE.lambda_handler(lambda_event, {})
         resp_expected = []
-        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM'))
-        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM', annotation=RULE.NO_BOUNDARY_ANNOTATION))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN', annotation=RULE.NO_BOUNDARY_ANNOTATION))
         assert_successful_evaluation(self, response, resp_expected, 2)
 
     # Permission Boundary is present in the Account but IAM user does not have it attached.
@@ -85,8 +90,8 @@ class TESTScenarios2to8(unittest.TestCase):
         lambda_event = build_lambda_scheduled_event()
         response = RULE.lambda_handler(lambda_event, {})
         resp_expected = []
-        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM'))
-        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM', annotation=RULE.NO_BOUNDARY_ANNOTATION))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN', annotation=RULE.NO_BOUNDARY_ANNOTATION))
         assert_successful_evaluation(self, response, resp_expected, 2)
 
     # Permission Boundary is present in the Account and IAM user does have it attached.
@@ -121,8 +126,8 @@ class TESTScenarios2to8(unittest.TestCase):
         lambda_event = build_lambda_scheduled_event(rule_parameters=rule_param)
         response = RULE.lambda_handler(lambda_event, {})
         resp_expected = []
-        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM'))
-        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM', annotation=RULE.NO_BOUNDARY_ANNOTATION))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN', annotation=RULE.NO_BOUNDARY_ANNOTATION))
         assert_successful_evaluation(self, response, resp_expected, 2)
 
     # Permission Boundary Name is provided as the input but IAM user does not have it attached.
@@ -138,6 +143,44 @@ class TESTScenarios2to8(unittest.TestCase):
         resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN'))
         assert_successful_evaluation(self, response, resp_expected, 2)
 
+class TESTAuthorizationDetails(unittest.TestCase):
+
+    user_details = {'UserDetailList': [
+        {'UserId': 'AIDAIDFOUX2OSRO6DO7XM', 'UserName': 'user-name-1',
+         'PermissionsBoundary': {'PermissionsBoundaryType': 'Policy', 'PermissionsBoundaryArn': 'arn:aws:iam::aws:policy/AdministratorAccess'}},
+        {'UserId': 'AIDAIDFOUX2OSRO6DO7XN', 'UserName': 'user-name-2',
+         'PermissionsBoundary': {'PermissionsBoundaryType': 'Policy', 'PermissionsBoundaryArn': 'arn:aws:iam::aws:policy/AAccess'}},
+        {'UserId': 'AIDAIDFOUX2OSRO6DO7XO', 'UserName': 'user-name-3'}], 'IsTruncated': False}
+
+    def setUp(self):
+        IAM_CLIENT_MOCK.get_account_authorization_details = MagicMock(return_value=self.user_details)
+        IAM_CLIENT_MOCK.get_user = MagicMock(side_effect=Exception('The permissions boundaries are in the authorization details.'))
+
+    def test_boundaries_from_authorization_details(self):
+        response = RULE.lambda_handler(build_lambda_scheduled_event(), {})
+        resp_expected = []
+        resp_expected.append(build_expected_response('COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM'))
+        resp_expected.append(build_expected_response('COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XO', annotation=RULE.NO_BOUNDARY_ANNOTATION))
+        assert_successful_evaluation(self, response, resp_expected, 3)
+        IAM_CLIENT_MOCK.get_account_authorization_details.assert_called_once_with(Filter=['User'], MaxItems=1000)
+
+    def test_allowed_boundaries_from_authorization_details(self):
+        rule_param = "{\"policyArns\":\"arn:aws:iam::aws:policy/AdministratorAccess\"}"
+        response = RULE.lambda_handler(build_lambda_scheduled_event(rule_parameters=rule_param), {})
+        resp_expected = []
+        resp_expected.append(build_expected_response('COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XM'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XN'))
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'AIDAIDFOUX2OSRO6DO7XO', annotation=RULE.NO_BOUNDARY_ANNOTATION))
+        assert_successful_evaluation(self, response, resp_expected, 3)
+
+    # Only a missing permission falls back on the former calls, e.g. a throttling fails the evaluation.
+    def test_other_error_not_falling_back(self):
+        IAM_CLIENT_MOCK.get_account_authorization_details = MagicMock(side_effect=build_client_error('Throttling'))
+        IAM_CLIENT_MOCK.list_users = MagicMock(side_effect=Exception('The users are not got one by one.'))
+        response = RULE.lambda_handler(build_lambda_scheduled_event(), {})
+        assert_customer_error_response(self, response, 'Throttling', 'Throttling')
+
 ####################
 # Helper Functions #
 ####################
@@ -245,3 +288,6 @@ class TestStsErrors(unittest.TestCase):
         response = RULE.lambda_handler(build_lambda_configurationchange_event('{}'), {})
         assert_customer_error_response(
             self, response, 'AccessDenied', 'AWS Config does not have permission to assume the IAM role.')
+
+def build_client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'operation')
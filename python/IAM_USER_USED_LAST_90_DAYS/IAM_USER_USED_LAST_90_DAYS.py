@@ -106,40 +106,52 @@ Scenarios:
         | NotUsedTimeOutInDays is not configured : 90 (default) |
 '''
 
+import os
+import sys
 import json
-import boto3
 import botocore
 import datetime
+import concurrent.futures
 from dateutil.tz import tzutc
 import dateutil.parser
 from datetime import timedelta
 import re
-# import liblogging
-# logger = logging.getLogger()
 
-AWS_CONFIG_CLIENT = boto3.client('config')
+try:
+    import rdk_runtime
+except ImportError:
+    # Outside of a Lambda layer, the runtime is the rdk_runtime directory next to the rule directory.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import rdk_runtime
 
 DEFAULT_RESOURCE_TYPE = "AWS::IAM::User"
 ASSUME_ROLE_MODE = False
 
+# Maximum age of the IAM credential report the periodic evaluation reads the activity of the users from, in seconds;
+# 0 to look up the access keys of each user.
+CREDENTIAL_REPORT_MAX_AGE_SECONDS = 4 * 3600
+
+# Number of the ListAccessKeys and GetAccessKeyLastUsed calls in flight during the periodic evaluation.
+ACCESS_KEY_WORKERS = 8
+
 def build_invalid_integer_error_response(exception):
-    return build_error_response(internalErrorMessage="Customer error while parsing input parameters",
-                                internalErrorDetails=str(exception),
-                                customerErrorCode="InvalidParameterValueException",
-                                customerErrorMessage="Parameter 'NotUsedTimeOutInDays' is not a valid integer.")
+    return rdk_runtime.build_error_response(internal_error_message="Customer error while parsing input parameters",
+                                            internal_error_details=str(exception),
+                                            customer_error_code="InvalidParameterValueException",
+                                            customer_error_message="Parameter 'NotUsedTimeOutInDays' is not a valid integer.")
 
  
 def build_unsupported_expiration_days_error_response():
-    return  build_error_response(internalErrorMessage="Customer error while parsing input parameters",
-                                 internalErrorDetails="Parameter value is greater than supported value",
-                                 customerErrorCode="InvalidParameterValueException",
-                                 customerErrorMessage="Value of parameter 'NotUsedTimeOutInDays' is not valid. Use a value between 0 and 999999999, and try again.")
+    return  rdk_runtime.build_error_response(internal_error_message="Customer error while parsing input parameters",
+                                             internal_error_details="Parameter value is greater than supported value",
+                                             customer_error_code="InvalidParameterValueException",
+                                             customer_error_message="Value of parameter 'NotUsedTimeOutInDays' is not valid. Use a value between 0 and 999999999, and try again.")
 
 def build_invalid_str_error_response(exception):
-    return  build_error_response(internalErrorMessage="Customer error while parsing input parameters",
-                                 internalErrorDetails=str(exception),
-                                 customerErrorCode="InvalidParameterValueException",
-                                 customerErrorMessage="Value of parameter 'WhitelistedUserList' is not valid.")
+    return  rdk_runtime.build_error_response(internal_error_message="Customer error while parsing input parameters",
+                                             internal_error_details=str(exception),
+                                             customer_error_code="InvalidParameterValueException",
+                                             customer_error_message="Value of parameter 'WhitelistedUserList' is not valid.")
             
 def validate_whitelist(list):
     for user in list:
@@ -197,89 +209,111 @@ def is_access_keys_used_recently(iam_client, username, NotUsedTimeOutInDays):
             return True
     return False
 
+# The credential report gives the last use of the password and of the access keys of every user at once.
+def is_used_recently_in_report(report_user, NotUsedTimeOutInDays):
+    last_used_dates = [report_user.password_last_used] + [access_key.last_used for access_key in report_user.access_keys]
+    for last_used_date in last_used_dates:
+        if last_used_date and is_older_than(last_used_date, NotUsedTimeOutInDays):
+            return True
+    return False
+
 def evaluate_scheduled_compliance(event, configuration_item, rule_parameters):
 
     evaluations = []
     iam_client = get_client('iam', event)
-    
-    users_list = iam_client.list_users()
-    
-    while True:
-        for user in users_list['Users']:
-
-            if user['UserId'] in rule_parameters['WhitelistedUserList']:
-                evaluations.append(build_evaluation(user['UserId'], 'COMPLIANT', event))
-                continue
-
-            if is_older_than(user['CreateDate'], rule_parameters['NewUserCooldownInDays']):
-                evaluations.append(build_evaluation(user['UserId'], 'COMPLIANT', event))
-                continue
-
-            if is_password_used_recently(user, rule_parameters['NotUsedTimeOutInDays']):
-                evaluations.append(build_evaluation(user['UserId'], 'COMPLIANT', event))
-                continue
+    credential_report = rdk_runtime.get_credential_report(iam_client, event, CREDENTIAL_REPORT_MAX_AGE_SECONDS)
 
-            if is_access_keys_used_recently(iam_client, user['UserName'], rule_parameters['NotUsedTimeOutInDays']):
-                evaluations.append(build_evaluation(user['UserId'], 'COMPLIANT', event))
-                continue
-
-            evaluations.append(build_evaluation(user['UserId'], 'NON_COMPLIANT', event))
+    users_list = iam_client.list_users()
 
-        if "Marker" in users_list:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=ACCESS_KEY_WORKERS) as executor:
+        while True:
+            # The users classified from the ListUsers page and the credential report are not looked up.
+            compliance_types = {user['UserId']: get_compliance_type_without_calls(user, credential_report, rule_parameters)
+                                for user in users_list['Users']}
+            user_names = [user['UserName'] for user in users_list['Users'] if compliance_types[user['UserId']] is None]
+            recent_user_names = get_users_with_access_keys_used_recently(executor, iam_client, user_names, rule_parameters['NotUsedTimeOutInDays'])
+
+            for user in users_list['Users']:
+                compliance_type = compliance_types[user['UserId']]
+                if compliance_type is None:
+                    compliance_type = 'COMPLIANT' if user['UserName'] in recent_user_names else 'NON_COMPLIANT'
+                evaluations.append(build_evaluation(user['UserId'], compliance_type, event))
+
+            if "Marker" in users_list:
                 users_list = iam_client.list_users(Marker=users_list["Marker"])
-        else:
-            break
+            else:
+                break
 
     if not evaluations:
         evaluations.append(build_evaluation(event['accountId'],'NOT_APPLICABLE', event, resource_type='AWS::::Account'))
     return evaluations
 
-# USE AS IS
-# Helper function to check if rule parameters exist
-def parameters_exist(parameters):
-    return len(parameters) != 0
-
-# Helper function used to validate input
-def check_defined(reference, referenceName):
-    if not reference:
-        raise Exception('Error: ', referenceName, 'is not defined')
-    return reference
-
-# Check whether the message is OversizedConfigurationItemChangeNotification or not
-def is_oversized_changed_notification(messageType):
-    check_defined(messageType, 'messageType')
-    return messageType == 'OversizedConfigurationItemChangeNotification'
-
-# Check whether the message is a ScheduledNotification or not.
-def is_scheduled_notification(messageType):
-    check_defined(messageType, 'messageType')
-    return messageType == 'ScheduledNotification'
-
-# Get configurationItem using getResourceConfigHistory API
-# in case of OversizedConfigurationItemChangeNotification
-def get_configuration(resourceType, resourceId, configurationCaptureTime):
-    result = AWS_CONFIG_CLIENT.get_resource_config_history(
-        resourceType=resourceType,
-        resourceId=resourceId,
-        laterTime=configurationCaptureTime,
-        limit=1)
-    configurationItem = result['configurationItems'][0]
-    return convert_api_configuration(configurationItem)
-
-# Convert from the API model to the original invocation model
-def convert_api_configuration(configurationItem):
-    for k, v in configurationItem.items():
-        if isinstance(v, datetime.datetime):
-            configurationItem[k] = str(v)
-    configurationItem['awsAccountId'] = configurationItem['accountId']
-    configurationItem['ARN'] = configurationItem['arn']
-    configurationItem['configurationStateMd5Hash'] = configurationItem['configurationItemMD5Hash']
-    configurationItem['configurationItemVersion'] = configurationItem['version']
-    configurationItem['configuration'] = json.loads(configurationItem['configuration'])
-    if 'relationships' in configurationItem:
-        for i in range(len(configurationItem['relationships'])):
-            configurationItem['relationships'][i]['name'] = configurationItem['relationships'][i]['relationshipName']
-    return configurationItem
+# Return the compliance type of a user known from the ListUsers data and the credential report, or None when its access keys must be looked up.
+def get_compliance_type_without_calls(user, credential_report, rule_parameters):
+    if user['UserId'] in rule_parameters['WhitelistedUserList']:
+        return 'COMPLIANT'
+
+    if is_older_than(user['CreateDate'], rule_parameters['NewUserCooldownInDays']):
+        return 'COMPLIANT'
+
+    if is_password_used_recently(user, rule_parameters['NotUsedTimeOutInDays']):
+        return 'COMPLIANT'
+
+    # The users missing from the credential report, e.g. created after it, are looked up one by one.
+    report_user = credential_report.get_user(user) if credential_report else None
+    if report_user is None:
+        return None
+    if is_used_recently_in_report(report_user, rule_parameters['NotUsedTimeOutInDays']):
+        return 'COMPLIANT'
+    return 'NON_COMPLIANT'
+
+def get_users_with_access_keys_used_recently(executor, iam_client, user_names, NotUsedTimeOutInDays):
+    """Return the names of the users, among user_names, having an access key used in the last NotUsedTimeOutInDays days.
+
+    The access keys of all the users are listed and looked up concurrently, the keys of a user one after the other:
+    once a key of a user is found used recently, its other keys are not looked up.
+
+    Keyword arguments:
+    executor -- the executor running the ListAccessKeys and GetAccessKeyLastUsed calls
+    iam_client -- the IAM boto client
+    user_names -- the names of the users to look up
+    NotUsedTimeOutInDays -- the maximum time without activity, in days
+    """
+    recent_user_names = set()
+    # user name -> access key ids not looked up yet
+    remaining_key_ids = {}
+    # future -> user name, for the ListAccessKeys and the GetAccessKeyLastUsed calls
+    list_futures = {executor.submit(list_access_key_ids, iam_client, user_name): user_name for user_name in user_names}
+    key_futures = {}
+    pending = set(list_futures)
+    try:
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future in list_futures:
+                    user_name = list_futures[future]
+                    remaining_key_ids[user_name] = future.result()
+                else:
+                    user_name = key_futures.pop(future)
+                    last_used_date = future.result()
+                    if last_used_date and is_older_than(last_used_date, NotUsedTimeOutInDays):
+                        recent_user_names.add(user_name)
+                        continue
+                if remaining_key_ids[user_name]:
+                    key_future = executor.submit(get_access_key_last_used_date, iam_client, remaining_key_ids[user_name].pop(0))
+                    key_futures[key_future] = user_name
+                    pending.add(key_future)
+    finally:
+        # e.g. on a ClientError, the calls not started yet are not made.
+        for future in pending:
+            future.cancel()
+    return recent_user_names
+
+def list_access_key_ids(iam_client, username):
+    return [access_key['AccessKeyId'] for access_key in iam_client.list_access_keys(UserName=username)['AccessKeyMetadata']]
+
+def get_access_key_last_used_date(iam_client, access_key_id):
+    return iam_client.get_access_key_last_used(AccessKeyId=access_key_id)['AccessKeyLastUsed'].get('LastUsedDate')
 
 def check_valid_notification(invoking_event):
     if 'messageType' not in invoking_event:
@@ -290,110 +324,52 @@ def check_valid_notification(invoking_event):
 # Based on the type of message get the configuration item
 # either from configurationItem in the invoking event
 # or using the getResourceConfigHistiry API in getConfiguration function.
-def get_configuration_item(invokingEvent):
-    check_defined(invokingEvent, 'invokingEvent')
-    check_valid_notification(invokingEvent)
-    if is_oversized_changed_notification(invokingEvent['messageType']):
-        configurationItemSummary = check_defined(invokingEvent['configurationItemSummary'], 'configurationItemSummary')
-        return get_configuration(configurationItemSummary['resourceType'], configurationItemSummary['resourceId'], configurationItemSummary['configurationItemCaptureTime'])
-    elif is_scheduled_notification(invokingEvent['messageType']):
-        return None
-    return check_defined(invokingEvent['configurationItem'], 'configurationItem')
-
-# Check whether the resource has been deleted. If it has, then the evaluation is unnecessary.
-def is_applicable(configurationItem, event):
-    check_defined(configurationItem, 'configurationItem')
-    check_defined(event, 'event')
-    status = configurationItem['configurationItemStatus']
-    eventLeftScope = event['eventLeftScope']
-    if status == 'ResourceDeleted':
-        print("Resource Deleted, setting Compliance Status to NOT_APPLICABLE.")
-    return (status == 'OK' or status == 'ResourceDiscovered') and not eventLeftScope
+def get_configuration_item(config_client, invoking_event):
+    rdk_runtime.check_defined(invoking_event, 'invokingEvent')
+    check_valid_notification(invoking_event)
+    return rdk_runtime.get_configuration_item(config_client, invoking_event)
 
 # This gets the client after assuming the Config service role
 # either in the same AWS account or cross-account.
-def get_client(service, event=None):
-    if not ASSUME_ROLE_MODE:
-        return boto3.client(service)
-    credentials = get_assume_role_credentials(event["executionRoleArn"])
-    return boto3.client(service, aws_access_key_id=credentials['AccessKeyId'],
-                        aws_secret_access_key=credentials['SecretAccessKey'],
-                        aws_session_token=credentials['SessionToken']
-                       )
-
-def get_assume_role_credentials(role_arn):
-    sts_client = boto3.client('sts')
-    try:
-        assume_role_response = sts_client.assume_role(RoleArn=role_arn, RoleSessionName="configLambdaExecution")
-        return assume_role_response['Credentials']
-    except botocore.exceptions.ClientError as ex:
-        # Scrub error message for any internal account info leaks
-        if 'AccessDenied' in ex.response['Error']['Code']:
-            ex.response['Error']['Message'] = "AWS Config does not have permission to assume the IAM role."
-        else:
-            ex.response['Error']['Message'] = "InternalError"
-            ex.response['Error']['Code'] = "InternalError"
-        raise ex
+def get_client(service, event, region=None):
+    """Return the service boto client. It should be used instead of directly calling the client.
+
+    Keyword arguments:
+    service -- the service name used for calling the boto.client()
+    event -- the event variable given in the lambda handler
+    region -- the region where the client is called (default: None)
+    """
+    return rdk_runtime.get_client(service, event, region, assume_role=ASSUME_ROLE_MODE)
 
 # This generate an evaluation for config
 def build_evaluation(resource_id, compliance_type, event, resource_type=DEFAULT_RESOURCE_TYPE, annotation=None):
-    eval = {}
-    if annotation:
-        eval['Annotation'] = annotation
-    eval['ComplianceResourceType'] = resource_type
-    eval['ComplianceResourceId'] = resource_id
-    eval['ComplianceType'] = compliance_type
-    eval['OrderingTimestamp'] = str(json.loads(event['invokingEvent'])['notificationCreationTime'])
-    return eval
+    return rdk_runtime.build_evaluation(resource_id, compliance_type, event, resource_type, annotation)
 
 def build_evaluation_from_config_item(configuration_item, compliance_type, annotation=None):
-    eval_ci = {}
-    if annotation:
-        eval_ci['Annotation'] = annotation
-    eval_ci['ComplianceResourceType'] = configuration_item['resourceType']
-    eval_ci['ComplianceResourceId'] = configuration_item['resourceId']
-    eval_ci['ComplianceType'] = compliance_type
-    eval_ci['OrderingTimestamp'] = configuration_item['configurationItemCaptureTime']
-    return eval_ci
-
-# This removes older evaluation (useful for periodic rule not reporting on AWS::::Account).
-def clean_up_old_evaluations(latest_evaluations, event):
-    
-    cleaned_evalations = []
+    return rdk_runtime.build_evaluation_from_config_item(configuration_item, compliance_type, annotation)
 
-    old_evaluations = AWS_CONFIG_CLIENT.get_compliance_details_by_config_rule(
-        ConfigRuleName=event['configRuleName'], 
-        ComplianceTypes=['COMPLIANT','NON_COMPLIANT'],
-        Limit=100)['EvaluationResults']
-    
-    for old_eval in old_evaluations:
-        old_resource_id = old_eval['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
-        newer_founded = False
-        for latest_eval in latest_evaluations:
-            if old_resource_id == latest_eval['ComplianceResourceId']:
-                newer_founded = True
-        if not newer_founded:
-            cleaned_evalations.append(build_evaluation(old_resource_id, "NOT_APPLICABLE", event))
-
-    return cleaned_evalations + latest_evaluations
-
-# This decorates the lambda_handler in rule_code with the actual PutEvaluation call
+# This decorates the lambda_handler in rule_code with the actual PutEvaluation call.
+# The rule validates its parameters and the message type itself, the rest is done by the shared runtime.
 def lambda_handler(event, context):
+    # Like rdk_runtime.lambda_handler, log the API calls of the invocation as an EMF record, also when the rule failed.
+    rdk_runtime.metrics.reset_api_metrics()
+    try:
+        return handle_event(event, context)
+    finally:
+        rdk_runtime.metrics.print_api_metrics(event or {})
+
+def handle_event(event, context):
 
-    global AWS_CONFIG_CLIENT
     try:
-        if ASSUME_ROLE_MODE:
-            AWS_CONFIG_CLIENT = get_client('config', event)
+        config_client = get_client('config', event)
     except Exception as ex:
-        return build_error_response('Encountered error while making API request',
-                                    str(ex),
-                                    ex.response['Error']['Code'],
-                                    ex.response['Error']['Message']
-                                   )
-        
-    # liblogging.logEvent(event)
+        return rdk_runtime.build_error_response('Encountered error while making API request',
+                                                str(ex),
+                                                ex.response['Error']['Code'],
+                                                ex.response['Error']['Message']
+                                               )
 
-    check_defined(event, 'event')
+    rdk_runtime.check_defined(event, 'event')
     invoking_event = json.loads(event['invokingEvent'])
     rule_parameters = {}
     if 'ruleParameters' in event:
@@ -405,7 +381,7 @@ def lambda_handler(event, context):
             expiration_days = int(str(rule_parameters['NotUsedTimeOutInDays']))
         except ValueError as ex:
             return build_invalid_integer_error_response(ex)
-        
+
     if expiration_days < 0 or expiration_days > 999999999:  # max value supported by time delta function
         return build_unsupported_expiration_days_error_response() 
 
@@ -425,86 +401,39 @@ def lambda_handler(event, context):
             return build_invalid_str_error_response(ex)
         except ValueError as ex:
             return build_invalid_str_error_response(ex)
-    
+
     rule_parameters = {
         'NotUsedTimeOutInDays': expiration_days,
         'WhitelistedUserList': whilelist_list,
         'NewUserCooldownInDays': new_user_cool_down
         }
-    
+
     try:
-        configuration_item = get_configuration_item(invoking_event)
+        configuration_item = get_configuration_item(config_client, invoking_event)
         if invoking_event['messageType'] == 'ConfigurationItemChangeNotification':
-            # liblogging.logCIMetadata(event)
             compliance_result = evaluate_changetrigger_compliance(event, configuration_item, rule_parameters)
         elif invoking_event['messageType'] == 'ScheduledNotification':
             compliance_result = evaluate_scheduled_compliance(event, configuration_item, rule_parameters)
         else:
             return {'internalErrorMessage': 'Unexpected message type ' + str(invoking_event)}
     except botocore.exceptions.ClientError as ex:
-        if is_internal_error(ex):
-            return build_internal_error_response("Unexpected error while completing API request", str(ex))
-        else:
-            return build_error_response("Customer error while making API request", str(ex), ex.response['Error']['Code'],
-                ex.response['Error']['Message'])
+        if rdk_runtime.is_internal_error(ex):
+            return rdk_runtime.build_internal_error_response("Unexpected error while completing API request", str(ex))
+        return rdk_runtime.build_error_response("Customer error while making API request", str(ex), ex.response['Error']['Code'],
+                                                ex.response['Error']['Message'])
     except ValueError as ex:
-        return build_internal_error_response(str(ex), str(ex))
-    
+        return rdk_runtime.build_internal_error_response(str(ex), str(ex))
+
     evaluations = []
-    latest_evaluations = []
-    
+
     if isinstance(compliance_result, str):
         evaluations.append(build_evaluation_from_config_item(configuration_item, compliance_result))
     elif isinstance(compliance_result, list):
-        for evaluation in compliance_result:
-            missing_fields = False
-            for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-                if field not in evaluation:
-                    print("Missing " + field + " from custom evaluation.")
-                    missing_fields = True
-
-            if not missing_fields:
-                latest_evaluations.append(evaluation)
-
-        evaluations = clean_up_old_evaluations(latest_evaluations, event)
-        
-    elif isinstance(compliance_result, dict):
-        missing_fields = False
-        for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-            if field not in compliance_result:
-                print("Missing " + field + " from custom evaluation.")
-                missing_fields = True
-        if not missing_fields:
-            evaluations.append(compliance_result)
+        evaluations = rdk_runtime.clean_up_old_evaluations(config_client, compliance_result, event, DEFAULT_RESOURCE_TYPE)
     else:
         evaluations.append(build_evaluation_from_config_item(configuration_item, 'NOT_APPLICABLE'))
 
-    # Put together the request that reports the evaluation status
-    resultToken = event['resultToken']
-    testMode = False
-    if resultToken == 'TESTMODE':
-        # Used solely for RDK test to skip actual put_evaluation API call
-        testMode = True
-    # Invoke the Config API to report the result of the evaluation
-    evaluation_copy = []
-    evaluation_copy = evaluations[:]
-    while(evaluation_copy):
-        AWS_CONFIG_CLIENT.put_evaluations(Evaluations=evaluation_copy[:100], ResultToken=resultToken, TestMode=testMode)
-        del evaluation_copy[:100]
+    rdk_runtime.put_evaluations(config_client, evaluations, event['resultToken'])
+
     # Used solely for RDK test to be able to test Lambda function
     return evaluations
-
-def is_internal_error(exception):
-    return ((not isinstance(exception, botocore.exceptions.ClientError)) or exception.response['Error']['Code'].startswith('5')
-        or 'InternalError' in exception.response['Error']['Code'] or 'ServiceError' in exception.response['Error']['Code'])
- 
-def build_internal_error_response(internalErrorMessage, internalErrorDetails=None):
-    return build_error_response(internalErrorMessage, internalErrorDetails, 'InternalError', 'InternalError')
- 
-def build_error_response(internalErrorMessage, internalErrorDetails=None, customerErrorCode=None, customerErrorMessage=None):
-    return {
-        'internalErrorMessage': internalErrorMessage,
-        'internalErrorDetails': internalErrorDetails,
-        'customerErrorMessage': customerErrorMessage,
-        'customerErrorCode': customerErrorCode
-    }
\ No newline at end of file
@@ -15,6 +15,7 @@ from botocore.exceptions import ClientError
 import sys
 import datetime
 import json
+import concurrent.futures
 from dateutil.tz import tzutc
 from datetime import timedelta
 
@@ -159,6 +160,17 @@ class TestInvalidParameters(unittest.TestCase):
             self.assertEqual(response['customerErrorCode'], 'InvalidParameterValueException')
 
             
+class TestApiCallMetrics(unittest.TestCase):
+
+    def test_metrics_printed_on_every_invocation(self):
+        with patch.object(rule.rdk_runtime.metrics, 'reset_api_metrics') as reset_api_metrics, \
+                patch.object(rule.rdk_runtime.metrics, 'print_api_metrics') as print_api_metrics:
+            event = buildLambdaEvent(ruleParameters={"NotUsedTimeOutInDays": "ABC"})
+            response = rule.lambda_handler(event, {})
+        self.assertEqual(response['customerErrorCode'], 'InvalidParameterValueException')
+        reset_api_metrics.assert_called_once_with()
+        print_api_metrics.assert_called_once_with(event)
+
 class TestConfigurationChangeNotification(unittest.TestCase):
     
     def setUp(self):
@@ -273,8 +285,12 @@ class TestScheduledNotification(unittest.TestCase):
 
     def test_scheduled_Compliant_pwd_Compliant_access_key(self):
         iam_client_mock.list_users = MagicMock(return_value=self.users_list)
-        iam_client_mock.list_access_keys = MagicMock(return_value=self.list_some_access_keys)
-        iam_client_mock.get_access_key_last_used = MagicMock(side_effect=[get_user_access_key_day(93), get_user_access_key_day(87), get_user_access_key_day(93), get_user_access_key_day(87), get_user_access_key_day(93), get_user_access_key_day(93)])
+        # The keys are looked up concurrently: the days since the last use are given by key.
+        last_used_days = {'some-user-1': [93, 87], 'some-user-2': [93, 87], 'some-user-3': [93, 93]}
+        iam_client_mock.list_access_keys = MagicMock(side_effect=lambda UserName: {'AccessKeyMetadata': [
+            {'AccessKeyId': '{}:{}'.format(UserName, number)} for number in range(len(last_used_days[UserName]))]})
+        iam_client_mock.get_access_key_last_used = MagicMock(side_effect=lambda AccessKeyId: get_user_access_key_day(
+            last_used_days[AccessKeyId.split(':')[0]][int(AccessKeyId.split(':')[1])]))
         response = rule.lambda_handler(buildLambdaEvent(scheduled=True), {})
         resp_expected = [
             build_expected_response('COMPLIANT', 'AIDAABCD12345ABCDE123'),
@@ -282,6 +298,26 @@ class TestScheduledNotification(unittest.TestCase):
             build_expected_response('NON_COMPLIANT', 'AIDA12345ABCDE12345AB')]
         assert_successful_evaluation(self, response, resp_expected, evaluations_count=3)
 
+    def test_scheduled_access_keys_not_looked_up_for_users_classified(self):
+        users_list = {'Users': [dict(self.users_list['Users'][0], PasswordLastUsed=constructDateTime(10))] + self.users_list['Users'][1:]}
+        iam_client_mock.list_users = MagicMock(return_value=users_list)
+        iam_client_mock.list_access_keys = MagicMock(return_value=self.list_one_access_key)
+        iam_client_mock.get_access_key_last_used = MagicMock(return_value=get_user_access_key_day(93))
+        response = rule.lambda_handler(buildLambdaEvent(parameter_catalog(whitelist='AIDAJYPPIFB65RV8YYLDU'), scheduled=True), {})
+        resp_expected = [
+            build_expected_response('COMPLIANT', 'AIDAABCD12345ABCDE123'),
+            build_expected_response('COMPLIANT', 'AIDAJYPPIFB65RV8YYLDU'),
+            build_expected_response('NON_COMPLIANT', 'AIDA12345ABCDE12345AB')]
+        assert_successful_evaluation(self, response, resp_expected, evaluations_count=3)
+        iam_client_mock.list_access_keys.assert_called_once_with(UserName='some-user-3')
+
+    def test_scheduled_other_keys_not_looked_up_once_user_compliant(self):
+        iam_client_mock.list_access_keys = MagicMock(return_value=self.list_some_access_keys)
+        iam_client_mock.get_access_key_last_used = MagicMock(return_value=get_user_access_key_day(87))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual({'some-user-1'}, rule.get_users_with_access_keys_used_recently(executor, iam_client_mock, ['some-user-1'], 90))
+        iam_client_mock.get_access_key_last_used.assert_called_once_with(AccessKeyId='access_key_1')
+
     users_list_empty = { 'Users': []}
 
     def test_scheduled_notApplicable_no_user(self):
@@ -183,7 +183,7 @@ def build_lambda_event():
         'invokingEvent': invoking_event,
         'accountId': '123456789012',
         'configRuleArn': 'arn:aws:config:us-east-1:123456789012:config-rule/config-rule-8fngan',
-        'resultToken':'token'
+        'resultToken':'TESTMODE'
 } 
 
 def assert_successful_evaluation(testClass, response, resp_expected, evaluations_count=1):
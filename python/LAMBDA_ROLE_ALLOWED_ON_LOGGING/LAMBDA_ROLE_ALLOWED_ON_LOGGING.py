@@ -17,6 +17,7 @@ Description:
 
 Trigger:
   Configuration Change on AWS::Lambda::Function
+  Configuration Change on AWS::IAM::Role, to forget the verdict on the role
 
 Reports on:
   AWS::Lambda::Function
@@ -74,49 +75,102 @@ Blind spot:
     4) More than 100 policies are attached on role
     5) Explicit Deny are not covered
     6) NotAction are not covered
+    7) A change of the default version of a managed policy is only seen once the verdict on the role expires (ROLE_VERDICT_TTL_SECONDS)
+    8) A change of the role only drops the verdict kept by the container receiving it, the other warm containers reuse theirs until it expires (ROLE_VERDICT_TTL_SECONDS)
+    9) A change of the role does not re-evaluate the functions using it, their evaluation is only updated when they are evaluated again
 '''
 
+import os
+import sys
 import json
-import datetime
-import fnmatch
 import re
-import boto3
-import botocore.exceptions
+import time
+import threading
 
-AWS_CONFIG_CLIENT = boto3.client('config')
+try:
+    import rdk_runtime
+except ImportError:
+    # Outside of a Lambda layer, the runtime is the rdk_runtime directory next to the rule directory.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import rdk_runtime
 
 DEFAULT_RESOURCE_TYPE = "AWS::Lambda::Function"
+ROLE_RESOURCE_TYPE = "AWS::IAM::Role"
 ASSUME_ROLE_MODE = True
 
+# Time during which the verdict on a role is reused for the functions sharing it.
+ROLE_VERDICT_TTL_SECONDS = 300
+
+# (account id, role name) -> (attachment fingerprint, compliance type, expiration time), kept for the next invocations of a warm container
+ROLE_VERDICTS = {}
+ROLE_VERDICTS_LOCK = threading.Lock()
+
 def evaluate_compliance(configuration_item, rule_parameters):
 
     role = configuration_item['relationships'][0]['resourceName']
+    # In ASSUME_ROLE_MODE, the accounts share the container and can have roles of the same name.
+    role_key = (ACCOUNT_ID, role)
     try:
-        attachedpolicies = IAM_CLIENT.list_attached_role_policies(RoleName=role)
-        if attachedpolicies['AttachedPolicies']:
-            for policy in attachedpolicies['AttachedPolicies']:
-                if policy['PolicyArn'] == "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole":
-                    return 'COMPLIANT'
-            if is_a_role_managed_policy_allow_logging(attachedpolicies['AttachedPolicies']):
-                return 'COMPLIANT'
+        attachedpolicies = IAM_CLIENT.list_attached_role_policies(RoleName=role)['AttachedPolicies']
+        inlinepolicies = IAM_CLIENT.list_role_policies(RoleName=role)['PolicyNames']
 
-        inlinepolicies = IAM_CLIENT.list_role_policies(RoleName=role)
-        if inlinepolicies['PolicyNames']:
-            if is_a_role_inline_policy_allow_logging(role, inlinepolicies['PolicyNames']):
-                return 'COMPLIANT'
+        # Many functions share the same role: its policies are analysed once while they stay attached.
+        fingerprint = get_attachment_fingerprint(attachedpolicies, inlinepolicies)
+        compliance_type = get_role_verdict(role_key, fingerprint)
+        if compliance_type is None:
+            compliance_type = evaluate_role(role, attachedpolicies, inlinepolicies)
+            put_role_verdict(role_key, fingerprint, compliance_type)
 
     except Exception as e:
         print("Exception:" + str(e) + "\nFunction: " + configuration_item['configuration']['functionName'])
         raise
 
+    return compliance_type
+
+def evaluate_role(role, attachedpolicies, inlinepolicies):
+
+    if attachedpolicies:
+        for policy in attachedpolicies:
+            if policy['PolicyArn'] == "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole":
+                return 'COMPLIANT'
+        if is_a_role_managed_policy_allow_logging(attachedpolicies):
+            return 'COMPLIANT'
+
+    if inlinepolicies:
+        if is_a_role_inline_policy_allow_logging(role, inlinepolicies):
+            return 'COMPLIANT'
+
     return 'NON_COMPLIANT'
 
+# The ARNs of the attached managed policies and the names of the inline policies, in any order.
+def get_attachment_fingerprint(attachedpolicies, inlinepolicies):
+    return (tuple(sorted(policy['PolicyArn'] for policy in attachedpolicies)), tuple(sorted(inlinepolicies)))
+
+def get_role_verdict(role_key, fingerprint):
+    with ROLE_VERDICTS_LOCK:
+        cached_fingerprint, compliance_type, expiration = ROLE_VERDICTS.get(role_key, (None, None, 0))
+        if cached_fingerprint != fingerprint or expiration <= time.time():
+            return None
+        return compliance_type
+
+def put_role_verdict(role_key, fingerprint, compliance_type):
+    with ROLE_VERDICTS_LOCK:
+        ROLE_VERDICTS[role_key] = (fingerprint, compliance_type, time.time() + ROLE_VERDICT_TTL_SECONDS)
+
+def forget_role_verdict(role_key):
+    with ROLE_VERDICTS_LOCK:
+        ROLE_VERDICTS.pop(role_key, None)
+
+def clear_role_verdict_cache():
+    """Forget the verdicts on all the roles, e.g. between two tests."""
+    with ROLE_VERDICTS_LOCK:
+        ROLE_VERDICTS.clear()
+
 def is_a_role_inline_policy_allow_logging(roleName, inlinepolicies):
 
     for policy in inlinepolicies:
         getrolepolicy = IAM_CLIENT.get_role_policy(RoleName=roleName, PolicyName=policy)
-        statements = getrolepolicy['PolicyDocument']['Statement']
-        if are_statements_allow_logging(statements):
+        if is_policy_allow_logging(getrolepolicy['PolicyDocument']):
             return True
 
     return False
@@ -124,229 +178,106 @@ def is_a_role_inline_policy_allow_logging(roleName, inlinepolicies):
 def is_a_role_managed_policy_allow_logging(managedpolicies):
 
     for policy in managedpolicies:
-        getrolepolicy = IAM_CLIENT.get_policy(PolicyArn=policy['PolicyArn'])
-        getpolicyversion = IAM_CLIENT.get_policy_version(PolicyArn=policy['PolicyArn'], VersionId=getrolepolicy['Policy']['DefaultVersionId'])
-        statements = getpolicyversion['PolicyVersion']['Document']['Statement']
+        # The documents of the policies attached to many roles are got once, see rdk_runtime/policy_cache.py.
+        policy_document = rdk_runtime.get_managed_policy_document(IAM_CLIENT, policy['PolicyArn'])
 
-        if are_statements_allow_logging(statements):
+        if is_policy_allow_logging(policy_document):
             return True
 
     return False
 
-def are_statements_allow_logging(statements):
+# The verdict of a document is computed once for all the roles sharing it, see rdk_runtime/policy_engine.py.
+def is_policy_allow_logging(policy_document):
+    return rdk_runtime.compile_policy(policy_document).evaluate(are_statements_allow_logging)
+
+def are_statements_allow_logging(policy):
 
     is_createloggroup_present = False
     is_createlogstream_present = False
     is_putlogevents_present = False
 
-    for statement in statements:
+    for statement in policy.statements:
         if not is_effect_allow(statement) or not is_resource_element_ok(statement):
             continue
 
-        if isinstance(statement['Action'], list):
-            for action in statement['Action']:
-                if action == "*" or action == "log:*":
-                    return True
-                elif action == "logs:CreateLogGroup":
-                    is_createloggroup_present = True
-                elif action == "logs:CreateLogStream":
-                    is_createlogstream_present = True
-                elif action == "logs:PutLogEvents":
-                    is_putlogevents_present = True
-        else:
-            if statement['Action'] == "*" or statement['Action'] == "log:*":
+        for action in statement.actions:
+            if action == "*" or action == "log:*":
                 return True
-            elif statement['Action'] == "logs:CreateLogGroup":
+            elif action == "logs:CreateLogGroup":
                 is_createloggroup_present = True
-            elif statement['Action'] == "logs:CreateLogStream":
+            elif action == "logs:CreateLogStream":
                 is_createlogstream_present = True
-            elif statement['Action'] == "logs:PutLogEvents":
+            elif action == "logs:PutLogEvents":
                 is_putlogevents_present = True
-    
+
     return is_createloggroup_present and is_createlogstream_present and is_putlogevents_present
 
 def is_effect_allow(statement):
-    return statement['Effect'] == "Allow"
+    return statement.is_allow()
 
 def is_resource_element_ok(statement):
-    if isinstance(statement['Resource'], list):
-        for resource in statement['Resource']:
-            if "arn:aws:logs" in resource or "*" in resource:
-                return True
-        return False
-    return fnmatch.fnmatch(statement['Resource'], 'arn:aws:logs:*') or statement['Resource'] == "*"
-
-# USE AS IS
-# Helper function to check if rule parameters exist
-def parameters_exist(parameters):
-    return len(parameters) != 0
-
-# Helper function used to validate input
-def check_defined(reference, referenceName):
-    if not reference:
-        raise Exception('Error: ', referenceName, 'is not defined')
-    return reference
-
-# Check whether the message is OversizedConfigurationItemChangeNotification or not
-def is_oversized_changed_notification(messageType):
-    check_defined(messageType, 'messageType')
-    return messageType == 'OversizedConfigurationItemChangeNotification'
-
-# Check whether the message is a ScheduledNotification or not.
-def is_scheduled_notification(messageType):
-    check_defined(messageType, 'messageType')
-    return messageType == 'ScheduledNotification'
-
-# Get configurationItem using getResourceConfigHistory API
-# in case of OversizedConfigurationItemChangeNotification
-def get_configuration(resourceType, resourceId, configurationCaptureTime):
-    result = AWS_CONFIG_CLIENT.get_resource_config_history(
-        resourceType=resourceType,
-        resourceId=resourceId,
-        laterTime=configurationCaptureTime,
-        limit=1)
-    configurationItem = result['configurationItems'][0]
-    return convert_api_configuration(configurationItem)
-
-# Convert from the API model to the original invocation model
-def convert_api_configuration(configurationItem):
-    for k, v in configurationItem.items():
-        if isinstance(v, datetime.datetime):
-            configurationItem[k] = str(v)
-    configurationItem['awsAccountId'] = configurationItem['accountId']
-    configurationItem['ARN'] = configurationItem['arn']
-    configurationItem['configurationStateMd5Hash'] = configurationItem['configurationItemMD5Hash']
-    configurationItem['configurationItemVersion'] = configurationItem['version']
-    configurationItem['configuration'] = json.loads(configurationItem['configuration'])
-    if 'relationships' in configurationItem:
-        for i in range(len(configurationItem['relationships'])):
-            configurationItem['relationships'][i]['name'] = configurationItem['relationships'][i]['relationshipName']
-    return configurationItem
-
-# Based on the type of message get the configuration item
-# either from configurationItem in the invoking event
-# or using the getResourceConfigHistiry API in getConfiguration function.
-def get_configuration_item(invokingEvent):
-    check_defined(invokingEvent, 'invokingEvent')
-    if is_oversized_changed_notification(invokingEvent['messageType']):
-        configurationItemSummary = check_defined(invokingEvent['configurationItemSummary'], 'configurationItemSummary')
-        return get_configuration(configurationItemSummary['resourceType'], configurationItemSummary['resourceId'], configurationItemSummary['configurationItemCaptureTime'])
-    elif is_scheduled_notification(invokingEvent['messageType']):
-        return None
-    return check_defined(invokingEvent['configurationItem'], 'configurationItem')
-
-# Check whether the resource has been deleted. If it has, then the evaluation is unnecessary.
-def is_applicable(configurationItem, event):
-    check_defined(configurationItem, 'configurationItem')
-    check_defined(event, 'event')
-    status = configurationItem['configurationItemStatus']
-    eventLeftScope = event['eventLeftScope']
-    if status == 'ResourceDeleted':
-        print("Resource Deleted, setting Compliance Status to NOT_APPLICABLE.")
-    return (status == 'OK' or status == 'ResourceDiscovered') and not eventLeftScope
+    for resource in statement.resources:
+        if resource == "*" or rdk_runtime.get_wildcard_matcher('arn:aws:logs:*')(resource):
+            return True
+    return False
 
 # This gets the client after assuming the Config service role
 # either in the same AWS account or cross-account.
-def get_client(service, event=None):
-    if not event:
-        return boto3.client(service)
-    credentials = get_assume_role_credentials(event["executionRoleArn"])
-    return boto3.client(service, aws_access_key_id=credentials['AccessKeyId'],
-                        aws_secret_access_key=credentials['SecretAccessKey'],
-                        aws_session_token=credentials['SessionToken']
-                       )
-
-def get_assume_role_credentials(role_arn):
-    sts_client = boto3.client('sts')
-    try:
-        assume_role_response = sts_client.assume_role(RoleArn=role_arn, RoleSessionName="configLambdaExecution")
-        return assume_role_response['Credentials']
-    except botocore.exceptions.ClientError as ex:
-        # Scrub error message for any internal account info leaks
-        if 'AccessDenied' in ex.response['Error']['Code']:
-            ex.response['Error']['Message'] = "AWS Config does not have permission to assume the IAM role."
-        else:
-            ex.response['Error']['Message'] = "InternalError"
-            ex.response['Error']['Code'] = "InternalError"
-        raise ex
-
-# This generate an evaluation for config
-def build_evaluation(resource_id, compliance_type, timestamp, resource_type=DEFAULT_RESOURCE_TYPE, annotation=None):
-    eval = {}
-    if annotation:
-        eval['Annotation'] = annotation
-    eval['ComplianceResourceType'] = resource_type
-    eval['ComplianceResourceId'] = resource_id
-    eval['ComplianceType'] = compliance_type
-    eval['OrderingTimestamp'] = timestamp
-    return eval
+def get_client(service, event, region=None):
+    """Return the service boto client. It should be used instead of directly calling the client.
+
+    Keyword arguments:
+    service -- the service name used for calling the boto.client()
+    event -- the event variable given in the lambda handler
+    region -- the region where the client is called (default: None)
+    """
+    return rdk_runtime.get_client(service, event, region, assume_role=ASSUME_ROLE_MODE)
 
 def build_evaluation_from_config_item(configuration_item, compliance_type, annotation=None):
-    eval_ci = {}
-    if annotation:
-        eval_ci['Annotation'] = annotation
-    eval_ci['ComplianceResourceType'] = configuration_item['resourceType']
-    eval_ci['ComplianceResourceId'] = configuration_item['resourceId']
-    eval_ci['ComplianceType'] = compliance_type
-    eval_ci['OrderingTimestamp'] = configuration_item['configurationItemCaptureTime']
-    return eval_ci
+    return rdk_runtime.build_evaluation_from_config_item(configuration_item, compliance_type, annotation)
 
 # This decorates the lambda_handler in rule_code with the actual PutEvaluation call
 def lambda_handler(event, context):
+    # Like rdk_runtime.lambda_handler, log the API calls of the invocation as an EMF record, also when the rule failed.
+    rdk_runtime.metrics.reset_api_metrics()
+    try:
+        return handle_event(event, context)
+    finally:
+        rdk_runtime.metrics.print_api_metrics(event or {})
+
+def handle_event(event, context):
 
-    global AWS_CONFIG_CLIENT
-    if ASSUME_ROLE_MODE:
-        AWS_CONFIG_CLIENT = get_client('config', event)
+    config_client = get_client('config', event)
 
     global IAM_CLIENT
     IAM_CLIENT = get_client('iam', event)
 
+    global ACCOUNT_ID
+    ACCOUNT_ID = event['accountId']
+
     evaluations = []
 
-    #print(event)
-    check_defined(event, 'event')
-    invokingEvent = json.loads(event['invokingEvent'])
+    rdk_runtime.check_defined(event, 'event')
+    invoking_event = json.loads(event['invokingEvent'])
     rule_parameters = {}
     if 'ruleParameters' in event:
         rule_parameters = json.loads(event['ruleParameters'])
 
-    configuration_item = get_configuration_item(invokingEvent)
+    configuration_item = rdk_runtime.get_configuration_item(config_client, invoking_event)
+
+    # A change of the role, e.g. of an inline policy, invalidates the verdict this container reuses for its functions.
+    if configuration_item['resourceType'] == ROLE_RESOURCE_TYPE:
+        forget_role_verdict((ACCOUNT_ID, configuration_item['resourceName']))
+        return evaluations
 
-    if is_applicable(configuration_item, event):
+    if rdk_runtime.is_applicable(configuration_item, event):
         compliance_result = evaluate_compliance(configuration_item, rule_parameters)
     else:
         compliance_result = "NOT_APPLICABLE"
 
-    if isinstance(compliance_result, str):
-        evaluations.append(build_evaluation_from_config_item(configuration_item, compliance_result))
-    elif isinstance(compliance_result, list):
-        for evaluation in compliance_result:
-            missing_fields = False
-            for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-                if field not in evaluation:
-                    print("Missing " + field + " from custom evaluation.")
-                    missing_fields = True
-
-            if not missing_fields:
-                evaluations.append(evaluation)
-    elif isinstance(compliance_result, dict):
-        missing_fields = False
-        for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-            if field not in compliance_result:
-                print("Missing " + field + " from custom evaluation.")
-                missing_fields = True
-        if not missing_fields:
-            evaluations.append(compliance_result)
-    else:
-        evaluations.append(build_evaluation_from_config_item(configuration_item, 'NOT_APPLICABLE'))
-
-    # Put together the request that reports the evaluation status
-    resultToken = event['resultToken']
-    testMode = False
-    if resultToken == 'TESTMODE':
-        # Used solely for RDK test to skip actual put_evaluation API call
-        testMode = True
-    # Invoke the Config API to report the result of the evaluation
-    AWS_CONFIG_CLIENT.put_evaluations(Evaluations=evaluations, ResultToken=resultToken, TestMode=testMode)
+    evaluations.append(build_evaluation_from_config_item(configuration_item, compliance_result))
+
+    rdk_runtime.put_evaluations(config_client, evaluations, event['resultToken'])
+
     # Used solely for RDK test to be able to test Lambda function
     return evaluations
@@ -8,9 +8,9 @@ import sys
 import json
 import unittest
 try:
-    from unittest.mock import MagicMock
+    from unittest.mock import MagicMock, patch
 except ImportError:
-    from mock import MagicMock
+    from mock import MagicMock, patch
 
 CONFIG_CLIENT_MOCK = MagicMock()
 IAM_CLIENT_MOCK = MagicMock()
@@ -144,7 +144,20 @@ class TestScenario1DeletedRole(unittest.TestCase):
         resp_expected = "NOT_APPLICABLE"
         assert_successful_evaluation(self, response, resp_expected)
 
+class TestApiCallMetrics(unittest.TestCase):
+    def test_metrics_printed_on_every_invocation(self):
+        lambdaEvent = build_lambda_event(invokingEvent=build_invoking_event("ResourceDeleted"))
+        with patch.object(rule.rdk_runtime.metrics, 'reset_api_metrics') as reset_api_metrics, \
+                patch.object(rule.rdk_runtime.metrics, 'print_api_metrics') as print_api_metrics:
+            rule.lambda_handler(lambdaEvent, {})
+        reset_api_metrics.assert_called_once_with()
+        print_api_metrics.assert_called_once_with(lambdaEvent)
+
 class TestScenario2AWSManagedRole(unittest.TestCase):
+
+    def setUp(self):
+        rule.clear_role_verdict_cache()
+
     def test_COMPLIANT_AWSLambdaBasicExecution_attached_on_role(self):
         list_attached_role_pl = {
             "AttachedPolicies": [
@@ -161,6 +174,10 @@ class TestScenario2AWSManagedRole(unittest.TestCase):
         assert_successful_evaluation(self, response, resp_expected)
 
 class TestScenario3NoPolicyOnRole(unittest.TestCase):
+
+    def setUp(self):
+        rule.clear_role_verdict_cache()
+
     def test_NON_COMPLIANT_no_policy_attached_on_role_case(self):
         list_attached_role_pl = {"AttachedPolicies": []}
         IAM_CLIENT_MOCK.list_attached_role_policies = MagicMock(return_value=list_attached_role_pl)
@@ -171,6 +188,10 @@ class TestScenario3NoPolicyOnRole(unittest.TestCase):
   
 class TestScenario4ActionStar(unittest.TestCase):
 
+    def setUp(self):
+        rule.rdk_runtime.clear_policy_document_cache()
+        rule.clear_role_verdict_cache()
+
     def test_COMPLIANT_action_star_allow_string_inline(self):
         get_pl = gen_policy_api()
         list_attached_role_pl = {"AttachedPolicies": []}
@@ -273,6 +294,10 @@ class TestScenario4ActionStar(unittest.TestCase):
 
 class TestScenario5LogStar(unittest.TestCase):
     
+    def setUp(self):
+        rule.rdk_runtime.clear_policy_document_cache()
+        rule.clear_role_verdict_cache()
+
     def test_COMPLIANT_action_logstar_allow_string_inline(self):
         get_pl = gen_policy_api(statement_list=gen_statement_list(gen_statement(action="log:*")))
         list_attached_role_pl = {"AttachedPolicies": []}
@@ -384,6 +409,10 @@ class TestScenario6LogExactActions(unittest.TestCase):
     statement_list_all_in_three_with_deny = gen_statement_list(CreateLogGroup, CreateLogStream, PutLogEventsDeny)
     statement_list_all_in_three_with_bad_resource = gen_statement_list(CreateLogGroup, CreateLogStream, PutLogEventsBadResource)
 
+    def setUp(self):
+        rule.rdk_runtime.clear_policy_document_cache()
+        rule.clear_role_verdict_cache()
+
     def test_COMPLIANT_action_logexactaction_inline(self):
         for state in [self.statement_list_all_in_one, self.statement_list_all_in_three]:
             get_pl = gen_policy_api(statement_list=state)
@@ -439,3 +468,83 @@ class TestScenario6LogExactActions(unittest.TestCase):
             response = rule.lambda_handler(lambdaEvent, {})
             resp_expected = "NON_COMPLIANT"
             assert_successful_evaluation(self, response, resp_expected)
+
+class TestRoleVerdictCache(unittest.TestCase):
+
+    def setUp(self):
+        rule.rdk_runtime.clear_policy_document_cache()
+        rule.clear_role_verdict_cache()
+        IAM_CLIENT_MOCK.list_attached_role_policies = MagicMock(return_value={"AttachedPolicies": []})
+        IAM_CLIENT_MOCK.list_role_policies = MagicMock(return_value={"PolicyNames": ["some-inline-name-policy"]})
+        IAM_CLIENT_MOCK.get_role_policy = MagicMock(return_value=gen_policy_api())
+
+    def test_role_analysed_once_for_its_functions(self):
+        for _ in range(3):
+            response = rule.lambda_handler(build_lambda_event(), {})
+            assert_successful_evaluation(self, response, "COMPLIANT")
+        IAM_CLIENT_MOCK.get_role_policy.assert_called_once_with(RoleName="some_role", PolicyName="some-inline-name-policy")
+
+    def test_role_analysed_again_when_attachments_change(self):
+        rule.lambda_handler(build_lambda_event(), {})
+        IAM_CLIENT_MOCK.list_role_policies = MagicMock(return_value={"PolicyNames": ["other-inline-name-policy"]})
+        IAM_CLIENT_MOCK.get_role_policy = MagicMock(return_value=gen_policy_api(statement_list=gen_statement_list(gen_statement(effect="Deny"))))
+        response = rule.lambda_handler(build_lambda_event(), {})
+        assert_successful_evaluation(self, response, "NON_COMPLIANT")
+
+    def test_role_change_forgets_verdict(self):
+        rule.lambda_handler(build_lambda_event(), {})
+        IAM_CLIENT_MOCK.get_role_policy = MagicMock(return_value=gen_policy_api(statement_list=gen_statement_list(gen_statement(effect="Deny"))))
+        response = rule.lambda_handler(build_lambda_event(invokingEvent=build_role_invoking_event()), {})
+        self.assertEqual([], response)
+        response = rule.lambda_handler(build_lambda_event(), {})
+        assert_successful_evaluation(self, response, "NON_COMPLIANT")
+
+    def test_role_of_the_same_name_analysed_by_account(self):
+        rule.lambda_handler(build_lambda_event(), {})
+        IAM_CLIENT_MOCK.get_role_policy = MagicMock(return_value=gen_policy_api(statement_list=gen_statement_list(gen_statement(effect="Deny"))))
+        response = rule.lambda_handler(build_lambda_event_of_account("OtherID"), {})
+        assert_successful_evaluation(self, response, "NON_COMPLIANT")
+        response = rule.lambda_handler(build_lambda_event(), {})
+        assert_successful_evaluation(self, response, "COMPLIANT")
+
+    def test_role_change_forgets_verdict_of_its_account(self):
+        rule.lambda_handler(build_lambda_event(), {})
+        rule.lambda_handler(build_lambda_event_of_account("OtherID"), {})
+        IAM_CLIENT_MOCK.get_role_policy = MagicMock(return_value=gen_policy_api(statement_list=gen_statement_list(gen_statement(effect="Deny"))))
+        rule.lambda_handler(build_lambda_event_of_account("OtherID", invokingEvent=build_role_invoking_event()), {})
+        response = rule.lambda_handler(build_lambda_event(), {})
+        assert_successful_evaluation(self, response, "COMPLIANT")
+        response = rule.lambda_handler(build_lambda_event_of_account("OtherID"), {})
+        assert_successful_evaluation(self, response, "NON_COMPLIANT")
+
+    def test_verdict_expires(self):
+        ttl = rule.ROLE_VERDICT_TTL_SECONDS
+        rule.ROLE_VERDICT_TTL_SECONDS = 0
+        self.addCleanup(setattr, rule, 'ROLE_VERDICT_TTL_SECONDS', ttl)
+        rule.lambda_handler(build_lambda_event(), {})
+        rule.lambda_handler(build_lambda_event(), {})
+        self.assertEqual(2, IAM_CLIENT_MOCK.get_role_policy.call_count)
+
+def build_lambda_event_of_account(account_id, invokingEvent=build_invoking_event()):
+    lambda_event = build_lambda_event(invokingEvent=invokingEvent)
+    lambda_event["accountId"] = account_id
+    return lambda_event
+
+def build_role_invoking_event():
+    invoking_event = {
+        "messageType": "ConfigurationItemChangeNotification",
+        "notificationCreationTime": "SomeTime",
+        "recordVersion": "SomeVersion",
+        "configurationItem": {
+            "relationships": [],
+            "configurationItemCaptureTime": "2018-05-11T17:55:48.872Z",
+            "configurationItemStatus": "OK",
+            "configurationStateId": "1526061348872",
+            "arn": "arn:aws:iam::823362693882:role/some_role",
+            "resourceType": "AWS::IAM::Role",
+            "resourceId": "AROAIDFOUX2OSRO6DO7XM",
+            "resourceName": "some_role",
+            "configuration": {"roleName": "some_role"}
+        }
+    }
+    return json.dumps(invoking_event)
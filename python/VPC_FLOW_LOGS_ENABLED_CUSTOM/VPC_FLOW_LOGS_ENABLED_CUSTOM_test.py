@@ -291,6 +291,24 @@ class ComplianceTests(unittest.TestCase):
         print(resp_expected)
         assert_successful_evaluation(self, response, resp_expected, 5)
 
+    # Check that the VPCs are paginated and that their flow logs are got by chunks of VPC ids
+    def test_VPC_paginated_and_flow_logs_by_chunks(self):
+        ec2_client_mock.reset_mock(return_value=True)
+
+        vpc_ids = ['vpc-{:08x}'.format(number) for number in range(450)]
+        ec2_client_mock.describe_vpcs = MagicMock(side_effect=[
+            {"Vpcs": [{"VpcId": vpc_id} for vpc_id in vpc_ids[:300]], "NextToken": "page-2"},
+            {"Vpcs": [{"VpcId": vpc_id} for vpc_id in vpc_ids[300:]]}])
+        # The VPCs of even number have a flow log
+        ec2_client_mock.describe_flow_logs = MagicMock(side_effect=lambda Filters, MaxResults: {"FlowLogs": [
+            {"ResourceId": vpc_id, "TrafficType": "ALL"} for vpc_id in Filters[0]['Values'] if int(vpc_id[4:], 16) % 2 == 0]})
+
+        response = rule.lambda_handler(build_lambda_scheduled_event(), {})
+        self.assertEqual(vpc_ids, [evaluation['ComplianceResourceId'] for evaluation in response])
+        self.assertEqual(['COMPLIANT', 'NON_COMPLIANT'] * 225, [evaluation['ComplianceType'] for evaluation in response])
+        ec2_client_mock.describe_vpcs.assert_called_with(NextToken="page-2", MaxResults=1000)
+        self.assertEqual([200, 200, 50], sorted([len(call[1]['Filters'][0]['Values']) for call in ec2_client_mock.describe_flow_logs.call_args_list], reverse=True))
+
 ####################
 # Helper Functions #
 ####################
@@ -74,10 +74,17 @@ Scenarios:
 	 Then: Return COMPLIANT
  '''
 
-import json
-import datetime
-import boto3
-import botocore
+import os
+import sys
+import bisect
+import functools
+
+try:
+    import rdk_runtime
+except ImportError:
+    # Outside of a Lambda layer, the runtime is the rdk_runtime directory next to the rule directory.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import rdk_runtime
 
 ##############
 # Parameters #
@@ -89,8 +96,8 @@ DEFAULT_RESOURCE_TYPE = 'AWS::EC2::SecurityGroup'
 # Set to True to get the lambda to assume the Role attached on the Config Service (useful for cross-account).
 ASSUME_ROLE_MODE = False
 
-# Other parameters (no change needed)
-CONFIG_ROLE_TIMEOUT_SECONDS = 900
+# Number of distinct parameter values whose authorized ports are kept parsed, for the next invocations of a warm container.
+MAX_PARSED_PARAMETERS = 64
 
 #############
 # Main Code #
@@ -98,25 +105,28 @@ CONFIG_ROLE_TIMEOUT_SECONDS = 900
 
 def evaluate_compliance(event, configuration_item, valid_rule_parameters):
     is_any_open_allowed = False
+    # protocol -> the ranges of ports open to 0.0.0.0/0 and not authorized, for all the ingress rules
+    unauthorized_ranges = {'UDP': [], 'TCP': []}
 
     for rule in configuration_item['configuration']['ipPermissions']:
+        if not any(ip_range['cidrIp'] == '0.0.0.0/0' for ip_range in rule['ipv4Ranges']):
+            continue
+
+        is_any_open_allowed = True
         rule_range = PortRange(rule.get('fromPort', 0), rule.get('toPort', 65535))
-        for ip_range in rule['ipv4Ranges']:
-            if not ip_range['cidrIp'] == '0.0.0.0/0':
-                continue
+        protocol = rule['ipProtocol']
 
-            is_any_open_allowed = True
-            protocol = rule['ipProtocol']
+        if protocol in ['udp', '-1']:
+            unauthorized_ranges['UDP'].extend(get_unauthorized_ranges('authorizedUdpPorts', valid_rule_parameters, rule_range))
 
-            if protocol in ['udp', '-1']:
-                non_compliant_annotation = get_non_compliant_annotation('UDP', 'authorizedUdpPorts', valid_rule_parameters, rule_range)
-                if non_compliant_annotation:
-                    return build_evaluation_from_config_item(configuration_item, 'NON_COMPLIANT', annotation=non_compliant_annotation)
+        if protocol in ['tcp', '-1']:
+            unauthorized_ranges['TCP'].extend(get_unauthorized_ranges('authorizedTcpPorts', valid_rule_parameters, rule_range))
 
-            if protocol in ['tcp', '-1']:
-                non_compliant_annotation = get_non_compliant_annotation('TCP', 'authorizedTcpPorts', valid_rule_parameters, rule_range)
-                if non_compliant_annotation:
-                    return build_evaluation_from_config_item(configuration_item, 'NON_COMPLIANT', annotation=non_compliant_annotation)
+    non_compliant_annotations = [get_non_compliant_annotation(protocol, parameter_name, valid_rule_parameters, unauthorized_ranges[protocol])
+                                 for protocol, parameter_name in [('UDP', 'authorizedUdpPorts'), ('TCP', 'authorizedTcpPorts')]
+                                 if unauthorized_ranges[protocol]]
+    if non_compliant_annotations:
+        return build_evaluation_from_config_item(configuration_item, 'NON_COMPLIANT', annotation=' '.join(non_compliant_annotations))
 
     if is_any_open_allowed:
         return build_evaluation_from_config_item(configuration_item, 'COMPLIANT')
@@ -125,18 +135,21 @@ def evaluate_compliance(event, configuration_item, valid_rule_parameters):
 def evaluate_parameters(rule_parameters):
     valid_rule_parameters = {}
     if 'authorizedTcpPorts' in rule_parameters:
-        valid_rule_parameters['authorizedTcpPorts'] = evaluate_port(rule_parameters['authorizedTcpPorts'])
+        valid_rule_parameters['authorizedTcpPorts'] = get_authorized_ports(rule_parameters['authorizedTcpPorts'])
     if 'authorizedUdpPorts' in rule_parameters:
-        valid_rule_parameters['authorizedUdpPorts'] = evaluate_port(rule_parameters['authorizedUdpPorts'])
+        valid_rule_parameters['authorizedUdpPorts'] = get_authorized_ports(rule_parameters['authorizedUdpPorts'])
     return valid_rule_parameters
 
-def get_non_compliant_annotation(protocol, parameter_name, valid_rule_parameters, rule_range):
+def get_unauthorized_ranges(parameter_name, valid_rule_parameters, rule_range):
+    if not parameter_name in valid_rule_parameters:
+        return [rule_range]
+    return valid_rule_parameters[parameter_name].get_unauthorized_ranges(rule_range)
+
+def get_non_compliant_annotation(protocol, parameter_name, valid_rule_parameters, unauthorized_ranges):
     if not parameter_name in valid_rule_parameters:
         return 'No {} port is authorized to be open, according to the {} parameter.'.format(protocol, parameter_name)
-    authorized_ports = valid_rule_parameters[parameter_name]
-    if not rule_range.included_in_one_of_the_ranges(authorized_ports):
-        return 'One or more {} ports ({}) are not in range of the {} parameter ({}).'.format(protocol, rule_range.get_str(), parameter_name, get_str_range_list(authorized_ports))
-    return None
+    return 'One or more {} ports ({}) are not in range of the {} parameter ({}).'.format(protocol, get_str_range_list(merge_port_ranges(unauthorized_ranges)),
+                                                                                        parameter_name, valid_rule_parameters[parameter_name].get_str())
 
 class PortRange:
     begin = None
@@ -152,21 +165,56 @@ class PortRange:
             return str(self.begin)
         return '{}-{}'.format(self.begin, self.end)
 
-    def included_in_one_of_the_ranges(self, range_list):
-        for port_range in range_list:
-            if port_range.begin <= self.begin <= port_range.end and port_range.begin <= self.end <= port_range.end:
-                return True
-        return False
+class AuthorizedPorts:
+    """The ports authorized by a parameter, kept as sorted, merged and disjoint ranges.
 
-def get_str_range_list(range_list):
-    range_str = ''
-    for range_obj in range_list:
-        if not range_str:
-            range_str = range_obj.get_str()
+    Keyword arguments:
+    port_ranges -- the PortRange of the parameter, in any order and possibly overlapping
+    """
+
+    def __init__(self, port_ranges):
+        # The ranges as given in the parameter, for the annotations.
+        self.port_ranges = tuple(port_ranges)
+        merged_ranges = merge_port_ranges(port_ranges)
+        self.begins = [port_range.begin for port_range in merged_ranges]
+        self.ends = [port_range.end for port_range in merged_ranges]
+
+    def get_str(self):
+        return get_str_range_list(self.port_ranges)
+
+    def get_unauthorized_ranges(self, port_range):
+        """Return the PortRange of the ports of port_range not authorized, in order: none when port_range is included in the authorized ports."""
+        unauthorized_ranges = []
+        begin = port_range.begin
+        # The first authorized range not ending before the beginning of port_range.
+        index = bisect.bisect_left(self.ends, begin)
+        while begin <= port_range.end:
+            if index == len(self.begins) or self.begins[index] > port_range.end:
+                unauthorized_ranges.append(PortRange(begin, port_range.end))
+                break
+            if self.begins[index] > begin:
+                unauthorized_ranges.append(PortRange(begin, self.begins[index] - 1))
+            begin = self.ends[index] + 1
+            index += 1
+        return unauthorized_ranges
+
+# The parameters are parsed once per distinct value.
+@functools.lru_cache(maxsize=MAX_PARSED_PARAMETERS)
+def get_authorized_ports(ports_string):
+    return AuthorizedPorts(evaluate_port(ports_string))
+
+# Sort the ranges and merge the overlapping or adjacent ones, e.g. 80-90 and 91-100 into 80-100.
+def merge_port_ranges(port_ranges):
+    merged_ranges = []
+    for port_range in sorted(port_ranges, key=lambda port_range: (port_range.begin, port_range.end)):
+        if merged_ranges and port_range.begin <= merged_ranges[-1].end + 1:
+            merged_ranges[-1] = PortRange(merged_ranges[-1].begin, max(merged_ranges[-1].end, port_range.end))
         else:
-            range_str += ','
-            range_str += range_obj.get_str()
-    return range_str
+            merged_ranges.append(PortRange(port_range.begin, port_range.end))
+    return merged_ranges
+
+def get_str_range_list(range_list):
+    return ','.join(range_obj.get_str() for range_obj in range_list)
 
 def evaluate_port(ports_string):
     port_list = [each_port.strip() for each_port in ports_string.split(',')]
@@ -200,18 +248,6 @@ def evaluate_port(ports_string):
 # Helper Functions #
 ####################
 
-# Build an error to be displayed in the logs when the parameter is invalid.
-def build_parameters_value_error_response(ex):
-    """Return an error dictionary when the evaluate_parameters() raises a ValueError.
-
-    Keyword arguments:
-    ex -- Exception text
-    """
-    return  build_error_response(internal_error_message="Parameter value is invalid",
-                                 internal_error_details="An ValueError was raised during the validation of the Parameter value",
-                                 customer_error_code="InvalidParameterValueException",
-                                 customer_error_message=str(ex))
-
 # This gets the client after assuming the Config service role
 # either in the same AWS account or cross-account.
 def get_client(service, event, region=None):
@@ -222,14 +258,7 @@ def get_client(service, event, region=None):
     event -- the event variable given in the lambda handler
     region -- the region where the client is called (default: None)
     """
-    if not ASSUME_ROLE_MODE:
-        return boto3.client(service, region)
-    credentials = get_assume_role_credentials(event["executionRoleArn"], region)
-    return boto3.client(service, aws_access_key_id=credentials['AccessKeyId'],
-                        aws_secret_access_key=credentials['SecretAccessKey'],
-                        aws_session_token=credentials['SessionToken'],
-                        region_name=region
-                       )
+    return rdk_runtime.get_client(service, event, region, assume_role=ASSUME_ROLE_MODE)
 
 # This generate an evaluation for config
 def build_evaluation(resource_id, compliance_type, event, resource_type=DEFAULT_RESOURCE_TYPE, annotation=None):
@@ -242,14 +271,7 @@ def build_evaluation(resource_id, compliance_type, event, resource_type=DEFAULT_
     resource_type -- the CloudFormation resource type (or AWS::::Account) to report on the rule (default DEFAULT_RESOURCE_TYPE)
     annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
     """
-    eval_cc = {}
-    if annotation:
-        eval_cc['Annotation'] = build_annotation(annotation)
-    eval_cc['ComplianceResourceType'] = resource_type
-    eval_cc['ComplianceResourceId'] = resource_id
-    eval_cc['ComplianceType'] = compliance_type
-    eval_cc['OrderingTimestamp'] = str(json.loads(event['invokingEvent'])['notificationCreationTime'])
-    return eval_cc
+    return rdk_runtime.build_evaluation(resource_id, compliance_type, event, resource_type, annotation)
 
 def build_evaluation_from_config_item(configuration_item, compliance_type, annotation=None):
     """Form an evaluation as a dictionary. Usually suited to report on configuration change rules.
@@ -259,243 +281,12 @@ def build_evaluation_from_config_item(configuration_item, compliance_type, annot
     compliance_type -- either COMPLIANT, NON_COMPLIANT or NOT_APPLICABLE
     annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
     """
-    eval_ci = {}
-    if annotation:
-        eval_ci['Annotation'] = build_annotation(annotation)
-    eval_ci['ComplianceResourceType'] = configuration_item['resourceType']
-    eval_ci['ComplianceResourceId'] = configuration_item['resourceId']
-    eval_ci['ComplianceType'] = compliance_type
-    eval_ci['OrderingTimestamp'] = configuration_item['configurationItemCaptureTime']
-    return eval_ci
+    return rdk_runtime.build_evaluation_from_config_item(configuration_item, compliance_type, annotation)
 
 ####################
 # Boilerplate Code #
 ####################
 
-# Build annotation within Service constraints
-def build_annotation(annotation_string):
-    if len(annotation_string) > 256:
-        return annotation_string[:244] + " [truncated]"
-    return annotation_string
-
-# Helper function used to validate input
-def check_defined(reference, reference_name):
-    if not reference:
-        raise Exception('Error: ', reference_name, 'is not defined')
-    return reference
-
-# Check whether the message is OversizedConfigurationItemChangeNotification or not
-def is_oversized_changed_notification(message_type):
-    check_defined(message_type, 'messageType')
-    return message_type == 'OversizedConfigurationItemChangeNotification'
-
-# Check whether the message is a ScheduledNotification or not.
-def is_scheduled_notification(message_type):
-    check_defined(message_type, 'messageType')
-    return message_type == 'ScheduledNotification'
-
-# Get configurationItem using getResourceConfigHistory API
-# in case of OversizedConfigurationItemChangeNotification
-def get_configuration(resource_type, resource_id, configuration_capture_time):
-    result = AWS_CONFIG_CLIENT.get_resource_config_history(
-        resourceType=resource_type,
-        resourceId=resource_id,
-        laterTime=configuration_capture_time,
-        limit=1)
-    configuration_item = result['configurationItems'][0]
-    return convert_api_configuration(configuration_item)
-
-# Convert from the API model to the original invocation model
-def convert_api_configuration(configuration_item):
-    for k, v in configuration_item.items():
-        if isinstance(v, datetime.datetime):
-            configuration_item[k] = str(v)
-    configuration_item['awsAccountId'] = configuration_item['accountId']
-    configuration_item['ARN'] = configuration_item['arn']
-    configuration_item['configurationStateMd5Hash'] = configuration_item['configurationItemMD5Hash']
-    configuration_item['configurationItemVersion'] = configuration_item['version']
-    configuration_item['configuration'] = json.loads(configuration_item['configuration'])
-    if 'relationships' in configuration_item:
-        for i in range(len(configuration_item['relationships'])):
-            configuration_item['relationships'][i]['name'] = configuration_item['relationships'][i]['relationshipName']
-    return configuration_item
-
-# Based on the type of message get the configuration item
-# either from configurationItem in the invoking event
-# or using the getResourceConfigHistiry API in getConfiguration function.
-def get_configuration_item(invoking_event):
-    check_defined(invoking_event, 'invokingEvent')
-    if is_oversized_changed_notification(invoking_event['messageType']):
-        configuration_item_summary = check_defined(invoking_event['configuration_item_summary'], 'configurationItemSummary')
-        return get_configuration(configuration_item_summary['resourceType'], configuration_item_summary['resourceId'], configuration_item_summary['configurationItemCaptureTime'])
-    if is_scheduled_notification(invoking_event['messageType']):
-        return None
-    return check_defined(invoking_event['configurationItem'], 'configurationItem')
-
-# Check whether the resource has been deleted. If it has, then the evaluation is unnecessary.
-def is_applicable(configuration_item, event):
-    try:
-        check_defined(configuration_item, 'configurationItem')
-        check_defined(event, 'event')
-    except:
-        return True
-    status = configuration_item['configurationItemStatus']
-    event_left_scope = event['eventLeftScope']
-    if status == 'ResourceDeleted':
-        print("Resource Deleted, setting Compliance Status to NOT_APPLICABLE.")
-
-    return status in ('OK', 'ResourceDiscovered') and not event_left_scope
-
-
-def get_assume_role_credentials(role_arn, region=None):
-    sts_client = boto3.client('sts', region)
-    try:
-        assume_role_response = sts_client.assume_role(RoleArn=role_arn,
-                                                      RoleSessionName="configLambdaExecution",
-                                                      DurationSeconds=CONFIG_ROLE_TIMEOUT_SECONDS)
-        return assume_role_response['Credentials']
-    except botocore.exceptions.ClientError as ex:
-        # Scrub error message for any internal account info leaks
-        print(str(ex))
-        if 'AccessDenied' in ex.response['Error']['Code']:
-            ex.response['Error']['Message'] = "AWS Config does not have permission to assume the IAM role."
-        else:
-            ex.response['Error']['Message'] = "InternalError"
-            ex.response['Error']['Code'] = "InternalError"
-        raise ex
-
-# This removes older evaluation (usually useful for periodic rule not reporting on AWS::::Account).
-def clean_up_old_evaluations(latest_evaluations, event):
-
-    cleaned_evaluations = []
-
-    old_eval = AWS_CONFIG_CLIENT.get_compliance_details_by_config_rule(
-        ConfigRuleName=event['configRuleName'],
-        ComplianceTypes=['COMPLIANT', 'NON_COMPLIANT'],
-        Limit=100)
-
-    old_eval_list = []
-
-    while True:
-        for old_result in old_eval['EvaluationResults']:
-            old_eval_list.append(old_result)
-        if 'NextToken' in old_eval:
-            next_token = old_eval['NextToken']
-            old_eval = AWS_CONFIG_CLIENT.get_compliance_details_by_config_rule(
-                ConfigRuleName=event['configRuleName'],
-                ComplianceTypes=['COMPLIANT', 'NON_COMPLIANT'],
-                Limit=100,
-                NextToken=next_token)
-        else:
-            break
-
-    for old_eval in old_eval_list:
-        old_resource_id = old_eval['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
-        newer_founded = False
-        for latest_eval in latest_evaluations:
-            if old_resource_id == latest_eval['ComplianceResourceId']:
-                newer_founded = True
-        if not newer_founded:
-            cleaned_evaluations.append(build_evaluation(old_resource_id, "NOT_APPLICABLE", event))
-
-    return cleaned_evaluations + latest_evaluations
-
+# The evaluation and the reporting to Config are done by the shared runtime, see rdk_runtime/README.md.
 def lambda_handler(event, context):
-
-    global AWS_CONFIG_CLIENT
-
-    #print(event)
-    check_defined(event, 'event')
-    invoking_event = json.loads(event['invokingEvent'])
-    rule_parameters = {}
-    if 'ruleParameters' in event:
-        rule_parameters = json.loads(event['ruleParameters'])
-
-    try:
-        valid_rule_parameters = evaluate_parameters(rule_parameters)
-    except ValueError as ex:
-        return build_parameters_value_error_response(ex)
-
-    try:
-        AWS_CONFIG_CLIENT = get_client('config', event)
-        if invoking_event['messageType'] in ['ConfigurationItemChangeNotification', 'ScheduledNotification', 'OversizedConfigurationItemChangeNotification']:
-            configuration_item = get_configuration_item(invoking_event)
-            if is_applicable(configuration_item, event):
-                compliance_result = evaluate_compliance(event, configuration_item, valid_rule_parameters)
-            else:
-                compliance_result = "NOT_APPLICABLE"
-        else:
-            return build_internal_error_response('Unexpected message type', str(invoking_event))
-    except botocore.exceptions.ClientError as ex:
-        if is_internal_error(ex):
-            return build_internal_error_response("Unexpected error while completing API request", str(ex))
-        return build_error_response("Customer error while making API request", str(ex), ex.response['Error']['Code'], ex.response['Error']['Message'])
-    except ValueError as ex:
-        return build_internal_error_response(str(ex), str(ex))
-
-    evaluations = []
-    latest_evaluations = []
-
-    if not compliance_result:
-        latest_evaluations.append(build_evaluation(event['accountId'], "NOT_APPLICABLE", event, resource_type='AWS::::Account'))
-        evaluations = clean_up_old_evaluations(latest_evaluations, event)
-    elif isinstance(compliance_result, str):
-        if configuration_item:
-            evaluations.append(build_evaluation_from_config_item(configuration_item, compliance_result))
-        else:
-            evaluations.append(build_evaluation(event['accountId'], compliance_result, event, resource_type=DEFAULT_RESOURCE_TYPE))
-    elif isinstance(compliance_result, list):
-        for evaluation in compliance_result:
-            missing_fields = False
-            for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-                if field not in evaluation:
-                    print("Missing " + field + " from custom evaluation.")
-                    missing_fields = True
-
-            if not missing_fields:
-                latest_evaluations.append(evaluation)
-        evaluations = clean_up_old_evaluations(latest_evaluations, event)
-    elif isinstance(compliance_result, dict):
-        missing_fields = False
-        for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
-            if field not in compliance_result:
-                print("Missing " + field + " from custom evaluation.")
-                missing_fields = True
-        if not missing_fields:
-            evaluations.append(compliance_result)
-    else:
-        evaluations.append(build_evaluation_from_config_item(configuration_item, 'NOT_APPLICABLE'))
-
-    # Put together the request that reports the evaluation status
-    result_token = event['resultToken']
-    test_mode = False
-    if result_token == 'TESTMODE':
-        # Used solely for RDK test to skip actual put_evaluation API call
-        test_mode = True
-
-    # Invoke the Config API to report the result of the evaluation
-    evaluation_copy = []
-    evaluation_copy = evaluations[:]
-    while evaluation_copy:
-        AWS_CONFIG_CLIENT.put_evaluations(Evaluations=evaluation_copy[:100], ResultToken=result_token, TestMode=test_mode)
-        del evaluation_copy[:100]
-
-    # Used solely for RDK test to be able to test Lambda function
-    return evaluations
-
-def is_internal_error(exception):
-    return ((not isinstance(exception, botocore.exceptions.ClientError)) or exception.response['Error']['Code'].startswith('5')
-            or 'InternalError' in exception.response['Error']['Code'] or 'ServiceError' in exception.response['Error']['Code'])
-
-def build_internal_error_response(internal_error_message, internal_error_details=None):
-    return build_error_response(internal_error_message, internal_error_details, 'InternalError', 'InternalError')
-
-def build_error_response(internal_error_message, internal_error_details=None, customer_error_code=None, customer_error_message=None):
-    error_response = {
-        'internalErrorMessage': internal_error_message,
-        'internalErrorDetails': internal_error_details,
-        'customerErrorMessage': customer_error_message,
-        'customerErrorCode': customer_error_code
-    }
-    print(error_response)
-    return error_response
+    return rdk_runtime.lambda_handler(event, context, sys.modules[__name__])
@@ -10,6 +10,7 @@
 # the specific language governing permissions and limitations under the License.
 
 import sys
+import json
 import unittest
 from unittest.mock import MagicMock
 import botocore
@@ -115,6 +116,31 @@ class ComplianceTest(unittest.TestCase):
         resp_expected.append(build_expected_response('COMPLIANT', resource_id))
         assert_successful_evaluation(self, response, resp_expected)
 
+    def test_all_unauthorized_ranges_reported(self):
+        invoking_event = build_invoking_event([build_ip_permission('tcp', 70, 100), build_ip_permission('tcp', 22, 22),
+                                               build_ip_permission('tcp', 85, 99), build_ip_permission('udp', 53, 53)])
+        rule_parameters = '{"authorizedTcpPorts": "91-95,80-90","authorizedUdpPorts": "500"}'
+        response = RULE.lambda_handler(build_lambda_configurationchange_event(invoking_event, rule_parameters), context={})
+        resp_expected = []
+        resp_expected.append(build_expected_response('NON_COMPLIANT', 'sg-01', annotation='One or more UDP ports (53) are not in range of the authorizedUdpPorts parameter (500). '
+                                                     'One or more TCP ports (22,70-79,96-100) are not in range of the authorizedTcpPorts parameter (91-95,80-90).'))
+        assert_successful_evaluation(self, response, resp_expected)
+
+    def test_tcp_open_authorized_by_adjacent_ranges(self):
+        invoking_event = build_invoking_event([build_ip_permission('tcp', 85, 95)])
+        rule_parameters = '{"authorizedTcpPorts": "80-90,91-100"}'
+        response = RULE.lambda_handler(build_lambda_configurationchange_event(invoking_event, rule_parameters), context={})
+        resp_expected = []
+        resp_expected.append(build_expected_response('COMPLIANT', 'sg-01'))
+        assert_successful_evaluation(self, response, resp_expected)
+
+    def test_authorized_ports_parsed_once(self):
+        authorized_ports = RULE.get_authorized_ports('443, 8080-8090, 22')
+        self.assertIs(authorized_ports, RULE.get_authorized_ports('443, 8080-8090, 22'))
+        self.assertEqual(([22, 443, 8080], [22, 443, 8090]), (authorized_ports.begins, authorized_ports.ends))
+        self.assertEqual([], authorized_ports.get_unauthorized_ranges(RULE.PortRange(8081, 8090)))
+        self.assertEqual(['444-8079'], [port_range.get_str() for port_range in authorized_ports.get_unauthorized_ranges(RULE.PortRange(443, 8080))])
+
 ####################
 # Helper Functions #
 ####################
@@ -133,6 +159,24 @@ def build_lambda_configurationchange_event(invoking_event, rule_parameters=None)
         event_to_return['ruleParameters'] = rule_parameters
     return event_to_return
 
+def build_invoking_event(ip_permissions):
+    configuration_item = {
+        'relatedEvents': [],
+        'relationships': [],
+        'configuration': {'groupName': 'testconfig', 'groupId': 'sg-01', 'ipPermissions': ip_permissions, 'vpcId': 'vpc-4540bc2d'},
+        'configurationItemCaptureTime': '2018-09-07T05:26:45.866Z',
+        'awsAccountId': '970012433126',
+        'configurationItemStatus': 'OK',
+        'resourceType': DEFAULT_RESOURCE_TYPE,
+        'resourceId': 'sg-01',
+        'resourceName': 'testconfig'
+    }
+    return json.dumps({'configurationItem': configuration_item, 'notificationCreationTime': '2018-09-07T09:52:39.472Z', 'messageType': 'ConfigurationItemChangeNotification'})
+
+def build_ip_permission(protocol, from_port, to_port, cidr_ip='0.0.0.0/0'):
+    return {'fromPort': from_port, 'ipProtocol': protocol, 'toPort': to_port, 'ipv6Ranges': [], 'prefixListIds': [], 'userIdGroupPairs': [],
+            'ipv4Ranges': [{'cidrIp': cidr_ip}], 'ipRanges': [cidr_ip]}
+
 def build_lambda_scheduled_event(rule_parameters=None):
     invoking_event = '{"messageType":"ScheduledNotification","notificationCreationTime":"2017-12-23T22:11:18.158Z"}'
     event_to_return = {
@@ -11,40 +11,89 @@
 
 
 import json
+import time
 import boto3
 
 
 APPLICABLE_RESOURCES = ["AWS::EC2::Instance"]
 
+# Time during which the ingress rules of a security group are not described
+# again, for the instances sharing it.
+SECURITY_GROUP_TTL_SECONDS = 30
+
+# group id -> (ip permissions, time of the description)
+SECURITY_GROUP_CACHE = {}
+
 
 def expand_range(ports):
     if "-" in ports:
-        return range(int(ports.split("-")[0]), int(ports.split("-")[1])+1)
+        return (int(ports.split("-")[0]), int(ports.split("-")[1]))
     else:
-        return [int(ports)]
+        return (int(ports), int(ports))
+
+
+# Sort the port ranges and merge the overlapping or adjacent ones.
+def merge_ranges(port_ranges):
+    merged_ranges = []
+    for begin, end in sorted(port_ranges):
+        if merged_ranges and begin <= merged_ranges[-1][1] + 1:
+            merged_ranges[-1] = (merged_ranges[-1][0],
+                                 max(merged_ranges[-1][1], end))
+        else:
+            merged_ranges.append((begin, end))
+    return merged_ranges
 
 
 def find_exposed_ports(ip_permissions):
-    exposed_ports = []
+    exposed_ranges = []
     for permission in ip_permissions:
         if next((r for r in permission["IpRanges"]
                 if "0.0.0.0/0" in r["CidrIp"]), None):
-                    exposed_ports.extend(range(permission["FromPort"],
-                                               permission["ToPort"]+1))
-    return exposed_ports
+                    # The rules of all protocols have no port range.
+                    exposed_ranges.append((permission.get("FromPort", 0),
+                                           permission.get("ToPort", 65535)))
+    return merge_ranges(exposed_ranges)
+
+
+# Walk the two sorted lists of disjoint ranges together.
+def ranges_intersect(ranges, other_ranges):
+    i = j = 0
+    while i < len(ranges) and j < len(other_ranges):
+        if ranges[i][0] <= other_ranges[j][1] and other_ranges[j][0] <= ranges[i][1]:
+            return True
+        if ranges[i][1] < other_ranges[j][1]:
+            i += 1
+        else:
+            j += 1
+    return False
 
 
 def find_violation(ip_permissions, forbidden_ports):
-    exposed_ports = find_exposed_ports(ip_permissions)
-    for forbidden in forbidden_ports:
-        ports = expand_range(forbidden_ports[forbidden])
-        for port in ports:
-            if port in exposed_ports:
-                return "A forbidden port is exposed to the internet."
+    exposed_ranges = find_exposed_ports(ip_permissions)
+    forbidden_ranges = merge_ranges([expand_range(forbidden_ports[forbidden])
+                                     for forbidden in forbidden_ports])
+    if ranges_intersect(exposed_ranges, forbidden_ranges):
+        return "A forbidden port is exposed to the internet."
 
     return None
 
 
+# Describe, in one call, the groups of the instance not described in the
+# last SECURITY_GROUP_TTL_SECONDS.
+def get_ip_permissions(group_ids):
+    now = time.time()
+    missing_group_ids = [group_id for group_id in group_ids
+                         if SECURITY_GROUP_CACHE.get(group_id, (None, 0))[1] +
+                         SECURITY_GROUP_TTL_SECONDS <= now]
+    if missing_group_ids:
+        response = boto3.client("ec2").describe_security_groups(
+            GroupIds=missing_group_ids)
+        for group in response["SecurityGroups"]:
+            SECURITY_GROUP_CACHE[group["GroupId"]] = (group["IpPermissions"],
+                                                      now)
+    return [SECURITY_GROUP_CACHE[group_id][0] for group_id in group_ids]
+
+
 def evaluate_compliance(configuration_item, rule_parameters):
     if configuration_item["resourceType"] not in APPLICABLE_RESOURCES:
         return {
@@ -67,12 +116,9 @@ def evaluate_compliance(configuration_item, rule_parameters):
             "annotation": "The instance doesn't pertain to any security groups."
         }
 
-    ec2 = boto3.resource("ec2")
-    for security_group in security_groups:
-        ip_permissions = ec2.SecurityGroup(
-                                           security_group["groupId"]
-                                          ).ip_permissions
-
+    group_ids = [security_group["groupId"]
+                 for security_group in security_groups]
+    for ip_permissions in get_ip_permissions(group_ids):
         violation = find_violation(
             ip_permissions,
             rule_parameters
@@ -0,0 +1,135 @@
+#
+# This file made available under CC0 1.0 Universal (https://creativecommons.org/publicdomain/zero/1.0/legalcode)
+#
+import os
+import sys
+import unittest
+import importlib.util
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+EC2_CLIENT_MOCK = MagicMock()
+CONFIG_CLIENT_MOCK = MagicMock()
+
+class Boto3Mock():
+    @staticmethod
+    def client(client_name, *args, **kwargs):
+        if client_name == 'ec2':
+            return EC2_CLIENT_MOCK
+        if client_name == 'config':
+            return CONFIG_CLIENT_MOCK
+        raise Exception("Attempting to create an unknown client")
+
+sys.modules['boto3'] = Boto3Mock()
+
+# The name of the module is not a Python identifier.
+SPEC = importlib.util.spec_from_file_location('ec2_exposed_instance', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ec2-exposed-instance.py'))
+RULE = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(RULE)
+
+class MergeRangesTest(unittest.TestCase):
+
+    def test_overlapping_and_adjacent_ranges_merged(self):
+        self.assertEqual([(20, 25), (80, 90)], RULE.merge_ranges([(80, 85), (22, 25), (20, 22), (84, 90)]))
+        self.assertEqual([(1, 1024)], RULE.merge_ranges([(1, 1024), (22, 22), (443, 443), (1024, 1024)]))
+        self.assertEqual([(20, 30)], RULE.merge_ranges([(20, 25), (26, 30)]))
+
+    def test_disjoint_ranges_kept(self):
+        self.assertEqual([(22, 22), (24, 24)], RULE.merge_ranges([(24, 24), (22, 22)]))
+        self.assertEqual([], RULE.merge_ranges([]))
+
+    def test_exposed_ports(self):
+        ip_permissions = [
+            build_permission(80, 80),
+            build_permission(443, 443, cidr='10.0.0.0/8'),
+            build_permission(79, 81),
+            # The rules of all protocols have no port range.
+            {'IpProtocol': '-1', 'IpRanges': [{'CidrIp': '10.0.0.0/8'}]}]
+        self.assertEqual([(79, 81)], RULE.find_exposed_ports(ip_permissions))
+        ip_permissions.append({'IpProtocol': '-1', 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]})
+        self.assertEqual([(0, 65535)], RULE.find_exposed_ports(ip_permissions))
+
+class ForbiddenPortsTest(unittest.TestCase):
+
+    forbidden_ports = {'examplePort1': '8080', 'exampleRange1': '1-1024', 'examplePort2': '2375'}
+
+    def test_intersection_of_sorted_ranges(self):
+        self.assertTrue(RULE.ranges_intersect([(10, 20), (100, 200)], [(5, 9), (150, 150)]))
+        self.assertTrue(RULE.ranges_intersect([(10, 20)], [(20, 30)]))
+        self.assertFalse(RULE.ranges_intersect([(10, 20), (100, 200)], [(21, 99), (201, 300)]))
+        self.assertFalse(RULE.ranges_intersect([], [(1, 65535)]))
+
+    def test_forbidden_port_exposed(self):
+        self.assertIsNotNone(RULE.find_violation([build_permission(8000, 8100)], self.forbidden_ports))
+        self.assertIsNotNone(RULE.find_violation([build_permission(2375, 2375)], self.forbidden_ports))
+        self.assertIsNotNone(RULE.find_violation([build_permission(1024, 2000)], self.forbidden_ports))
+
+    def test_no_forbidden_port_exposed(self):
+        self.assertIsNone(RULE.find_violation([build_permission(1025, 2374), build_permission(2376, 8079)], self.forbidden_ports))
+        self.assertIsNone(RULE.find_violation([build_permission(8080, 8080, cidr='10.0.0.0/8')], self.forbidden_ports))
+        self.assertIsNone(RULE.find_violation([], self.forbidden_ports))
+
+class SecurityGroupLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        RULE.SECURITY_GROUP_CACHE.clear()
+        EC2_CLIENT_MOCK.reset_mock()
+        EC2_CLIENT_MOCK.describe_security_groups = MagicMock(side_effect=describe_security_groups)
+
+    def test_one_lookup_for_the_groups_of_an_instance(self):
+        response = RULE.evaluate_compliance(build_configuration_item('sg-1', 'sg-2', 'sg-3'), {'examplePort1': '22'})
+        self.assertEqual('COMPLIANT', response['compliance_type'])
+        EC2_CLIENT_MOCK.describe_security_groups.assert_called_once_with(GroupIds=['sg-1', 'sg-2', 'sg-3'])
+
+    def test_groups_shared_by_instances_described_once(self):
+        for group_ids in [('sg-1', 'sg-2'), ('sg-2', 'sg-1'), ('sg-1',), ('sg-2', 'sg-3')]:
+            RULE.evaluate_compliance(build_configuration_item(*group_ids), {'examplePort1': '22'})
+        self.assertEqual([{'GroupIds': ['sg-1', 'sg-2']}, {'GroupIds': ['sg-3']}],
+                         [call[1] for call in EC2_CLIENT_MOCK.describe_security_groups.call_args_list])
+
+    def test_cache_hit_until_expiry(self):
+        with patch.object(RULE.time, 'time', MagicMock(return_value=1000.0)):
+            RULE.get_ip_permissions(['sg-1'])
+            RULE.get_ip_permissions(['sg-1'])
+        self.assertEqual(1, EC2_CLIENT_MOCK.describe_security_groups.call_count)
+        with patch.object(RULE.time, 'time', MagicMock(return_value=1000.0 + RULE.SECURITY_GROUP_TTL_SECONDS - 1)):
+            RULE.get_ip_permissions(['sg-1'])
+        self.assertEqual(1, EC2_CLIENT_MOCK.describe_security_groups.call_count)
+        with patch.object(RULE.time, 'time', MagicMock(return_value=1000.0 + RULE.SECURITY_GROUP_TTL_SECONDS)):
+            RULE.get_ip_permissions(['sg-1'])
+        self.assertEqual(2, EC2_CLIENT_MOCK.describe_security_groups.call_count)
+
+    def test_forbidden_port_exposed_by_a_cached_group(self):
+        RULE.evaluate_compliance(build_configuration_item('sg-3'), {'examplePort1': '22'})
+        response = RULE.evaluate_compliance(build_configuration_item('sg-1', 'sg-3'), {'exampleRange1': '1-1024'})
+        self.assertEqual('NON_COMPLIANT', response['compliance_type'])
+        self.assertEqual(2, EC2_CLIENT_MOCK.describe_security_groups.call_count)
+        EC2_CLIENT_MOCK.describe_security_groups.assert_called_with(GroupIds=['sg-1'])
+
+####################
+# Helper Functions #
+####################
+
+def build_permission(from_port, to_port, cidr='0.0.0.0/0'):
+    return {'IpProtocol': 'tcp', 'FromPort': from_port, 'ToPort': to_port, 'IpRanges': [{'CidrIp': cidr}]}
+
+# sg-1 and sg-2 expose 443 to the internet, sg-3 exposes 80 to the internet and 22 to a private network.
+IP_PERMISSIONS = {
+    'sg-1': [build_permission(443, 443)],
+    'sg-2': [build_permission(443, 443)],
+    'sg-3': [build_permission(80, 80), build_permission(22, 22, cidr='10.0.0.0/8')]
+}
+
+def describe_security_groups(GroupIds):
+    return {'SecurityGroups': [{'GroupId': group_id, 'IpPermissions': IP_PERMISSIONS[group_id]} for group_id in GroupIds]}
+
+def build_configuration_item(*group_ids):
+    return {
+        'resourceType': 'AWS::EC2::Instance',
+        'resourceId': 'i-0123456789abcdef0',
+        'configurationItemStatus': 'OK',
+        'configurationItemCaptureTime': '2020-01-01T00:00:00.000Z',
+        'configuration': {'securityGroups': [{'groupId': group_id} for group_id in group_ids]}
+    }
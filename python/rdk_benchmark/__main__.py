@@ -0,0 +1,64 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Command line of the benchmark, see README.md:
+
+    python -m rdk_benchmark [--scenario NAME ...] [--scale 0.1] [--latency-ms 5] [--repeat 3] [--output results.jsonl] [--baseline baseline.jsonl]
+'''
+import sys
+import json
+import argparse
+
+from rdk_benchmark.runner import run_scenario, compare_results
+from rdk_benchmark.scenarios import SCENARIOS
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(prog='python -m rdk_benchmark', description='Benchmark the rules against synthetic accounts.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='scenario to run, all of them by default')
+    parser.add_argument('--scale', type=float, default=1.0, help='factor applied to the number of resources of the accounts')
+    parser.add_argument('--latency-ms', type=float, default=0, help='latency of every API call, in milliseconds')
+    parser.add_argument('--repeat', type=int, default=1, help='number of timed runs of each scenario')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--output', help='JSON lines file where the results are written')
+    parser.add_argument('--baseline', help='JSON lines file of previous results: exit with 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative increase of the wall time and memory tolerated')
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            for line in baseline_file:
+                if line.strip():
+                    result = json.loads(line)
+                    baseline[result['scenario']] = result
+
+    results = []
+    regressions = []
+    for name in args.scenario or sorted(SCENARIOS):
+        result = run_scenario(name, SCENARIOS[name], args.scale, args.latency_ms, args.repeat, not args.no_memory)
+        results.append(result)
+        print('{scenario}: {wall_time_median_s}s, {api_calls} API calls, {evaluations} evaluations, {peak_memory_mb} MB'.format(**result))
+        if name in baseline:
+            regressions.extend(compare_results(baseline[name], result, args.tolerance))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            for result in results:
+                output_file.write(json.dumps(result) + '\n')
+
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
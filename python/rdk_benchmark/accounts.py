@@ -0,0 +1,276 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Generator of synthetic AWS accounts.
+
+The resources are generated in the shape of the API responses, from a seed, so that two runs of a benchmark
+see the same account. A share of the resources is made non compliant with the rules exercised by the scenarios
+(no MFA device, unrestricted policies, methods without authorizer, unencrypted log groups, ports open to the
+world), so that the rules go through all their code paths.
+'''
+import random
+import datetime
+
+##############
+# Parameters #
+##############
+
+DEFAULT_ACCOUNT_ID = '123456789012'
+DEFAULT_REGION = 'us-east-1'
+
+# Number of IAM users per group.
+USERS_PER_GROUP = 50
+
+# Number of customer managed policies shared by the users and groups.
+MANAGED_POLICY_COUNT = 200
+
+CREATE_DATE = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+HTTP_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+#############
+# Main Code #
+#############
+
+class SyntheticAccount():
+    """The resources of a synthetic account, as returned by the AWS APIs.
+
+    Keyword arguments:
+    iam_users -- the number of IAM users, with their groups, inline and managed policies (default 0)
+    security_groups -- the number of EC2 security groups (default 0)
+    rest_apis -- the number of API Gateway REST APIs (default 0)
+    log_groups -- the number of CloudWatch Logs log groups (default 0)
+    seed -- the seed of the generator (default 0)
+    account_id -- the id of the account (default DEFAULT_ACCOUNT_ID)
+    region -- the region of the resources (default DEFAULT_REGION)
+    """
+
+    def __init__(self, iam_users=0, security_groups=0, rest_apis=0, log_groups=0, seed=0, account_id=DEFAULT_ACCOUNT_ID, region=DEFAULT_REGION):
+        self.account_id = account_id
+        self.region = region
+        self.random = random.Random(seed)
+
+        # IAM, indexed by user, group and policy name or ARN
+        self.users = []
+        self.user_policies = {}
+        self.attached_user_policies = {}
+        self.groups_for_user = {}
+        self.mfa_devices = {}
+        self.groups = {}
+        self.group_policies = {}
+        self.attached_group_policies = {}
+        self.managed_policies = {}
+        if iam_users:
+            self.generate_iam(iam_users)
+
+        self.security_groups = [self.build_security_group(i) for i in range(security_groups)]
+
+        # API Gateway: rest API id -> resources, (rest API id, resource id) -> {http method: method}
+        self.rest_apis = []
+        self.api_resources = {}
+        self.api_methods = {}
+        for i in range(rest_apis):
+            self.generate_rest_api(i)
+
+        self.log_groups = [self.build_log_group(i) for i in range(log_groups)]
+
+    def get_size(self):
+        return {
+            'iam_users': len(self.users),
+            'security_groups': len(self.security_groups),
+            'rest_apis': len(self.rest_apis),
+            'log_groups': len(self.log_groups)
+        }
+
+    def generate_iam(self, user_count):
+        for i in range(MANAGED_POLICY_COUNT):
+            arn = 'arn:aws:iam::{}:policy/policy-{:05d}'.format(self.account_id, i)
+            self.managed_policies[arn] = {
+                'PolicyName': 'policy-{:05d}'.format(i),
+                'PolicyId': 'ANPA{:017d}'.format(i),
+                'Arn': arn,
+                'Path': '/',
+                'DefaultVersionId': 'v1',
+                'AttachmentCount': 0,
+                'IsAttachable': True,
+                'CreateDate': CREATE_DATE,
+                'UpdateDate': CREATE_DATE,
+                'Document': self.build_policy_document()
+            }
+        policy_arns = sorted(self.managed_policies)
+
+        for i in range((user_count + USERS_PER_GROUP - 1) // USERS_PER_GROUP):
+            group_name = 'group-{:05d}'.format(i)
+            self.groups[group_name] = {
+                'Path': '/',
+                'GroupName': group_name,
+                'GroupId': 'AGPA{:017d}'.format(i),
+                'Arn': 'arn:aws:iam::{}:group/{}'.format(self.account_id, group_name),
+                'CreateDate': CREATE_DATE
+            }
+            self.group_policies[group_name] = {'inline-{}'.format(group_name): self.build_policy_document()}
+            self.attached_group_policies[group_name] = self.pick_attached_policies(policy_arns, 2)
+
+        for i in range(user_count):
+            user_name = 'user-{:06d}'.format(i)
+            self.users.append({
+                'Path': '/',
+                'UserName': user_name,
+                'UserId': 'AIDA{:017d}'.format(i),
+                'Arn': 'arn:aws:iam::{}:user/{}'.format(self.account_id, user_name),
+                'CreateDate': CREATE_DATE
+            })
+            self.user_policies[user_name] = {}
+            if self.random.random() < 0.5:
+                self.user_policies[user_name]['inline-{}'.format(user_name)] = self.build_policy_document()
+            self.attached_user_policies[user_name] = self.pick_attached_policies(policy_arns, 2)
+            self.groups_for_user[user_name] = ['group-{:05d}'.format(i // USERS_PER_GROUP)]
+            self.mfa_devices[user_name] = []
+            if self.random.random() < 0.8:
+                self.mfa_devices[user_name].append({
+                    'UserName': user_name,
+                    'SerialNumber': 'arn:aws:iam::{}:mfa/{}'.format(self.account_id, user_name),
+                    'EnableDate': CREATE_DATE
+                })
+
+    def pick_attached_policies(self, policy_arns, max_count):
+        attached = []
+        for arn in self.random.sample(policy_arns, self.random.randint(0, max_count)):
+            self.managed_policies[arn]['AttachmentCount'] += 1
+            attached.append({'PolicyName': self.managed_policies[arn]['PolicyName'], 'PolicyArn': arn})
+        return attached
+
+    def build_policy_document(self):
+        draw = self.random.random()
+        if draw < 0.05:
+            # Full star
+            return {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': '*', 'Resource': '*'}]}
+        if draw < 0.4:
+            # IP restricted
+            return {'Version': '2012-10-17', 'Statement': [{
+                'Effect': 'Allow',
+                'Action': ['s3:GetObject', 's3:PutObject'],
+                'Resource': '*',
+                'Condition': {'IpAddress': {'aws:SourceIp': ['10.0.{}.0/24'.format(self.random.randint(0, 255))]}}}]}
+        return {'Version': '2012-10-17', 'Statement': [{
+            'Effect': 'Allow',
+            'Action': ['ec2:Describe*', 'logs:CreateLogStream', 'logs:PutLogEvents'],
+            'Resource': '*'}]}
+
+    def build_security_group(self, number):
+        ip_permissions = []
+        for port in self.random.sample((22, 80, 443, 3306, 3389, 5432, 8080), self.random.randint(1, 3)):
+            cidr = '0.0.0.0/0' if self.random.random() < 0.3 else '10.{}.0.0/16'.format(self.random.randint(0, 255))
+            ip_permissions.append({
+                'IpProtocol': 'tcp',
+                'FromPort': port,
+                'ToPort': port,
+                'IpRanges': [{'CidrIp': cidr}],
+                'Ipv6Ranges': [],
+                'PrefixListIds': [],
+                'UserIdGroupPairs': []
+            })
+        return {
+            'GroupId': 'sg-{:017x}'.format(number),
+            'GroupName': 'security-group-{:05d}'.format(number),
+            'Description': 'Synthetic security group',
+            'OwnerId': self.account_id,
+            'VpcId': 'vpc-{:017x}'.format(number // 100),
+            'IpPermissions': ip_permissions,
+            'IpPermissionsEgress': []
+        }
+
+    def generate_rest_api(self, number):
+        api_id = '{:010x}'.format(number)
+        self.rest_apis.append({
+            'id': api_id,
+            'name': 'rest-api-{:05d}'.format(number),
+            'createdDate': CREATE_DATE,
+            'endpointConfiguration': {'types': ['REGIONAL']}
+        })
+        resources = [{'id': 'root{:06d}'.format(number), 'path': '/'}]
+        for i in range(self.random.randint(1, 5)):
+            resources.append({'id': 'res{:03d}{:06d}'.format(i, number), 'parentId': resources[0]['id'], 'path': '/resource-{}'.format(i), 'pathPart': 'resource-{}'.format(i)})
+        self.api_resources[api_id] = resources
+        for resource in resources[1:]:
+            methods = {}
+            for http_method in self.random.sample(HTTP_METHODS, self.random.randint(1, len(HTTP_METHODS))):
+                authorization_type = 'NONE' if self.random.random() < 0.2 else 'AWS_IAM'
+                methods[http_method] = {'httpMethod': http_method, 'authorizationType': authorization_type, 'apiKeyRequired': False}
+            self.api_methods[(api_id, resource['id'])] = methods
+
+    def build_log_group(self, number):
+        log_group_name = '/aws/lambda/function-{:06d}'.format(number)
+        log_group = {
+            'logGroupName': log_group_name,
+            'creationTime': 1577836800000,
+            'metricFilterCount': 0,
+            'arn': 'arn:aws:logs:{}:{}:log-group:{}:*'.format(self.region, self.account_id, log_group_name),
+            'storedBytes': 0
+        }
+        if self.random.random() < 0.7:
+            log_group['kmsKeyId'] = 'arn:aws:kms:{}:{}:key/{:08d}'.format(self.region, self.account_id, number % 10)
+        return log_group
+
+    # The configuration item recorded by Config for a security group, as given in the invoking event.
+    def build_security_group_configuration_item(self, security_group):
+        ip_permissions = []
+        for ip_permission in security_group['IpPermissions']:
+            ip_permissions.append({
+                'ipProtocol': ip_permission['IpProtocol'],
+                'fromPort': ip_permission['FromPort'],
+                'toPort': ip_permission['ToPort'],
+                'ipv4Ranges': [{'cidrIp': ip_range['CidrIp']} for ip_range in ip_permission['IpRanges']],
+                'ipv6Ranges': [],
+                'prefixListIds': [],
+                'userIdGroupPairs': []
+            })
+        return self.build_configuration_item('AWS::EC2::SecurityGroup', security_group['GroupId'], {
+            'groupId': security_group['GroupId'],
+            'groupName': security_group['GroupName'],
+            'vpcId': security_group['VpcId'],
+            'ipPermissions': ip_permissions,
+            'ipPermissionsEgress': []
+        })
+
+    def build_rest_api_configuration_item(self, rest_api):
+        return self.build_configuration_item('AWS::ApiGateway::RestApi', rest_api['id'], {'id': rest_api['id'], 'name': rest_api['name']})
+
+    # Lambda functions and buckets are only described by their configuration items, e.g. for the replay of change notifications.
+    def build_lambda_function_configuration_item(self, number):
+        function_name = 'function-{:06d}'.format(number)
+        configuration_item = self.build_configuration_item('AWS::Lambda::Function', function_name, {'functionName': function_name, 'runtime': 'python3.8'})
+        if self.random.random() < 0.7:
+            configuration_item['supplementaryConfiguration']['Concurrency'] = {'reservedConcurrentExecutions': self.random.randint(1, 100)}
+        return configuration_item
+
+    def build_bucket_configuration_item(self, number):
+        bucket_name = '{}-bucket-{:06d}'.format(self.random.choice(('apps', 'logs', 'test')), number)
+        configuration_item = self.build_configuration_item('AWS::S3::Bucket', bucket_name, {'name': bucket_name})
+        configuration_item['resourceName'] = bucket_name
+        return configuration_item
+
+    def build_configuration_item(self, resource_type, resource_id, configuration):
+        return {
+            'configurationItemVersion': '1.3',
+            'configurationItemCaptureTime': '2020-01-01T00:00:00.000Z',
+            'configurationStateId': 1,
+            'awsAccountId': self.account_id,
+            'configurationItemStatus': 'OK',
+            'resourceType': resource_type,
+            'resourceId': resource_id,
+            'ARN': 'arn:aws:{}:{}:{}:{}'.format(resource_type.split('::')[1].lower(), self.region, self.account_id, resource_id),
+            'awsRegion': self.region,
+            'configuration': configuration,
+            'supplementaryConfiguration': {},
+            'relationships': [],
+            'tags': {}
+        }
@@ -0,0 +1,139 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import botocore.exceptions
+import rdk_runtime.clients
+from rdk_benchmark.accounts import SyntheticAccount
+from rdk_benchmark.fakes import FakeBoto3
+from rdk_benchmark.runner import run_scenario, compare_results
+from rdk_benchmark.replay import read_events, replay, summarize, percentile, write_synthetic_events
+from rdk_benchmark.scenarios import SCENARIOS
+
+class TestSyntheticAccount(unittest.TestCase):
+
+    def test_same_seed_same_account(self):
+        account_1 = SyntheticAccount(iam_users=20, security_groups=5, seed=7)
+        account_2 = SyntheticAccount(iam_users=20, security_groups=5, seed=7)
+        self.assertEqual(account_1.users, account_2.users)
+        self.assertEqual(account_1.attached_user_policies, account_2.attached_user_policies)
+        self.assertEqual(account_1.security_groups, account_2.security_groups)
+
+    def test_size(self):
+        account = SyntheticAccount(iam_users=120, security_groups=3, rest_apis=2, log_groups=10)
+        self.assertEqual({'iam_users': 120, 'security_groups': 3, 'rest_apis': 2, 'log_groups': 10}, account.get_size())
+        self.assertEqual(3, len(account.groups))
+
+class TestFakeApis(unittest.TestCase):
+
+    def setUp(self):
+        self.account = SyntheticAccount(iam_users=250, rest_apis=30)
+        self.fake_boto3 = FakeBoto3(self.account)
+
+    def test_iam_pagination(self):
+        iam_client = self.fake_boto3.client('iam')
+        paginator = iam_client.get_paginator('list_users')
+        pages = list(paginator.paginate())
+        self.assertEqual([100, 100, 50], [len(page['Users']) for page in pages])
+        self.assertEqual(self.account.users, [user for page in pages for user in page['Users']])
+
+    def test_apigateway_pagination(self):
+        apigw_client = self.fake_boto3.client('apigateway')
+        response = apigw_client.get_rest_apis()
+        self.assertEqual(25, len(response['items']))
+        response = apigw_client.get_rest_apis(position=response['position'])
+        self.assertEqual(5, len(response['items']))
+        self.assertNotIn('position', response)
+
+    def test_policy_document_decoded(self):
+        iam_client = self.fake_boto3.client('iam')
+        group_name = sorted(self.account.groups)[0]
+        policy_name = sorted(self.account.group_policies[group_name])[0]
+        response = iam_client.get_group_policy(GroupName=group_name, PolicyName=policy_name)
+        self.assertEqual(self.account.group_policies[group_name][policy_name], response['PolicyDocument'])
+
+    def test_error(self):
+        iam_client = self.fake_boto3.client('iam')
+        with self.assertRaises(botocore.exceptions.ClientError) as context:
+            iam_client.list_mfa_devices(UserName='unknown-user')
+        self.assertEqual('NoSuchEntity', context.exception.response['Error']['Code'])
+
+    def test_parameters_validated(self):
+        iam_client = self.fake_boto3.client('iam')
+        with self.assertRaises(botocore.exceptions.ParamValidationError):
+            iam_client.list_mfa_devices(UserName=1)
+
+class TestRunner(unittest.TestCase):
+
+    def test_run_scenario(self):
+        original_boto3 = rdk_runtime.clients.boto3
+        result = run_scenario('iam-user-mfa-enabled', SCENARIOS['iam-user-mfa-enabled'], scale=0.01, repeat=2)
+        self.assertEqual(100, result['evaluations'])
+        # 1 ListUsers page, the credential report generated by the first run, 1 previous results page, 1 PutEvaluations batch
+        self.assertEqual({'config.GetComplianceDetailsByConfigRule': 1, 'config.PutEvaluations': 1, 'iam.GetCredentialReport': 1, 'iam.ListUsers': 1},
+                         result['api_calls_by_operation'])
+        self.assertEqual(2, len(result['wall_time_s']))
+        self.assertTrue(result['peak_memory_mb'] > 0)
+        self.assertIs(original_boto3, rdk_runtime.clients.boto3)
+
+    def test_compare_results(self):
+        baseline = {'scenario': 'scenario', 'api_calls': 100, 'wall_time_median_s': 1.0, 'peak_memory_mb': 10}
+        self.assertEqual([], compare_results(baseline, dict(baseline, wall_time_median_s=1.1)))
+        self.assertEqual(1, len(compare_results(baseline, dict(baseline, api_calls=101))))
+        self.assertEqual(1, len(compare_results(baseline, dict(baseline, wall_time_median_s=1.5))))
+        self.assertEqual(1, len(compare_results(baseline, dict(baseline, peak_memory_mb=13))))
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.events_file = tempfile.NamedTemporaryFile(mode='w', suffix='.jsonl', delete=False)
+        self.events_file.close()
+
+    def tearDown(self):
+        os.remove(self.events_file.name)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(7, percentile([7], 95))
+
+    def test_events_routed_by_resource_type(self):
+        write_synthetic_events(self.events_file.name, 6)
+        events = read_events(self.events_file.name, ['LAMBDA_CONCURRENCY_CHECK', 'S3_BUCKET_NAMING_CONVENTION'])
+        self.assertEqual(['LAMBDA_CONCURRENCY_CHECK', 'S3_BUCKET_NAMING_CONVENTION'] * 2, [rule_name for rule_name, event in events])
+        self.assertEqual({'regexPattern': '.*test.*'}, json.loads(events[1][1]['ruleParameters']))
+
+    def test_lambda_event_routed_by_rule_name(self):
+        configuration_item = SyntheticAccount().build_bucket_configuration_item(1)
+        with open(self.events_file.name, 'w') as events_file:
+            events_file.write(json.dumps({'configRuleName': 'S3_BUCKET_NAMING_CONVENTION', 'ruleParameters': '{"regexPattern": "^apps-"}',
+                                          'invokingEvent': json.dumps({'messageType': 'ConfigurationItemChangeNotification', 'configurationItem': configuration_item})}) + '\n')
+        events = read_events(self.events_file.name, ['S3_BUCKET_NAMING_CONVENTION', 'LAMBDA_CONCURRENCY_CHECK'])
+        self.assertEqual(1, len(events))
+        self.assertEqual('{"regexPattern": "^apps-"}', events[0][1]['ruleParameters'])
+        self.assertEqual('TESTMODE', events[0][1]['resultToken'])
+
+    def test_replay(self):
+        write_synthetic_events(self.events_file.name, 12)
+        events = read_events(self.events_file.name, ['VPC_SG_OPEN_ONLY_TO_AUTHORIZED_PORTS', 'LAMBDA_CONCURRENCY_CHECK', 'S3_BUCKET_NAMING_CONVENTION'])
+        invocations = replay(events, workers=2, container_invocations=3)
+        self.assertEqual([], [invocation for invocation in invocations if invocation['error']])
+        report = summarize(invocations)
+        self.assertEqual(4, report['S3_BUCKET_NAMING_CONVENTION']['invocations'])
+        # 12 invocations by containers replaced after 3 invocations
+        self.assertEqual(4, len([invocation for invocation in invocations if invocation['cold']]))
+        self.assertIn('latency_ms_p99', report['LAMBDA_CONCURRENCY_CHECK'])
@@ -0,0 +1,271 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Replay of recorded change notifications through the lambda_handler of change-triggered rules.
+
+The events are read from a JSON lines file and given to the rules whose SourceEvents (parameters.json) include
+the resource type of their configuration item, either at a target rate or as fast as a pool of workers allows.
+Every worker is a process standing for a Lambda container: it starts cold (Python start-up, import of the rule,
+first clients built), then stays warm for CONTAINER_INVOCATIONS invocations before being replaced by a cold one.
+The Config APIs are the fakes of fakes.py, with an injected latency.
+
+Usage, from the python directory:
+
+    python -m rdk_benchmark.replay events.jsonl --rule VPC_SG_OPEN_ONLY_TO_AUTHORIZED_PORTS --workers 10 [--rate 200] [--container-invocations 500]
+    python -m rdk_benchmark.replay events.jsonl --generate 10000
+'''
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import multiprocessing
+
+# The rules are in the parent directory, next to the runtime they import.
+RULES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+if RULES_DIRECTORY not in sys.path:
+    sys.path.append(RULES_DIRECTORY)
+
+##############
+# Parameters #
+##############
+
+# The rules replayed when none is given.
+DEFAULT_RULES = ('VPC_SG_OPEN_ONLY_TO_AUTHORIZED_PORTS', 'LAMBDA_CONCURRENCY_CHECK', 'S3_BUCKET_NAMING_CONVENTION')
+
+# Number of invocations handled by a container before it is replaced by a cold one; None to keep the containers warm.
+CONTAINER_INVOCATIONS = None
+
+PERCENTILES = (50, 95, 99)
+
+# State of the container, i.e. of the worker process.
+CONTAINER = {}
+
+#############
+# Main Code #
+#############
+
+def get_source_events(rule_name):
+    """Return the resource types triggering the rule, according to its parameters.json."""
+    with open(os.path.join(RULES_DIRECTORY, rule_name, 'parameters.json')) as parameters_file:
+        parameters = json.load(parameters_file)['Parameters']
+    return set(resource_type.strip() for resource_type in parameters.get('SourceEvents', '').split(',') if resource_type.strip())
+
+def get_input_parameters(rule_name):
+    with open(os.path.join(RULES_DIRECTORY, rule_name, 'parameters.json')) as parameters_file:
+        parameters = json.load(parameters_file)['Parameters']
+    return json.loads(parameters.get('InputParameters') or '{}')
+
+def read_events(path, rule_names):
+    """Return the (rule name, Lambda event) to replay, in the order of the file.
+
+    A line of the file is either a Lambda event, an invoking event or a configuration item. A Lambda event naming
+    one of the rules (configRuleName) is only given to that rule; the other lines are given to every rule triggered
+    by the resource type of their configuration item.
+
+    Keyword arguments:
+    path -- the JSON lines file
+    rule_names -- the rules to replay the events to
+    """
+    source_events = {rule_name: get_source_events(rule_name) for rule_name in rule_names}
+    input_parameters = {rule_name: get_input_parameters(rule_name) for rule_name in rule_names}
+    events = []
+    with open(path) as events_file:
+        for line in events_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'invokingEvent' in record:
+                invoking_event = record['invokingEvent']
+                if isinstance(invoking_event, str):
+                    invoking_event = json.loads(invoking_event)
+            elif 'messageType' in record:
+                invoking_event = record
+            else:
+                invoking_event = {'messageType': 'ConfigurationItemChangeNotification', 'configurationItem': record,
+                                  'notificationCreationTime': record.get('configurationItemCaptureTime')}
+            resource_type = invoking_event.get('configurationItem', {}).get('resourceType')
+            for rule_name in rule_names:
+                if record.get('configRuleName') in rule_names and record['configRuleName'] != rule_name:
+                    continue
+                if record.get('configRuleName') != rule_name and resource_type not in source_events[rule_name]:
+                    continue
+                events.append((rule_name, build_replay_event(rule_name, record, invoking_event, input_parameters[rule_name])))
+    return events
+
+def build_replay_event(rule_name, record, invoking_event, rule_parameters):
+    configuration_item = invoking_event.get('configurationItem', {})
+    event = {
+        'configRuleName': rule_name,
+        'executionRoleArn': 'arn:aws:iam::{}:role/config-role'.format(configuration_item.get('awsAccountId', '123456789012')),
+        'accountId': configuration_item.get('awsAccountId', '123456789012'),
+        'eventLeftScope': False,
+        'ruleParameters': json.dumps(rule_parameters),
+        # PutEvaluations is called in test mode
+        'resultToken': 'TESTMODE'
+    }
+    # A recorded Lambda event keeps its own fields, but its evaluations are not sent with its result token.
+    event.update({key: value for key, value in record.items() if key in ('accountId', 'eventLeftScope', 'ruleParameters', 'executionRoleArn')} if 'invokingEvent' in record else {})
+    event['invokingEvent'] = json.dumps(invoking_event)
+    return event
+
+def start_container(latency_ms):
+    """Initializer of a worker process: a cold Lambda container, whose clients call the fake APIs."""
+    start = time.time()
+    sys.stdout = open(os.devnull, 'w')
+    import rdk_runtime.clients
+    from rdk_benchmark.accounts import SyntheticAccount
+    from rdk_benchmark.fakes import FakeBoto3
+    rdk_runtime.clients.boto3 = FakeBoto3(SyntheticAccount(), latency_ms)
+    CONTAINER['rules'] = {}
+    CONTAINER['init_ms'] = (time.time() - start) * 1000
+    CONTAINER['invocations'] = 0
+
+def invoke(rule_name, event, due):
+    """Call the lambda_handler of the rule in the container and return the timing of the invocation."""
+    from rdk_benchmark.runner import load_rule, FakeContext
+    start = time.time()
+    # Without a target rate, the latency is the time spent in the container.
+    due = due or start
+    cold = CONTAINER['invocations'] == 0
+    init_ms = CONTAINER['init_ms'] if cold else 0
+    if rule_name not in CONTAINER['rules']:
+        CONTAINER['rules'][rule_name] = load_rule(rule_name)
+        # Importing the rule is part of the cold start of its function.
+        init_ms += (time.time() - start) * 1000
+    error = None
+    handler_start = time.time()
+    try:
+        response = CONTAINER['rules'][rule_name].lambda_handler(event, FakeContext(rule_name))
+        if isinstance(response, dict) and 'customerErrorCode' in response:
+            error = response['customerErrorCode']
+    except Exception as ex:
+        error = type(ex).__name__
+    end = time.time()
+    CONTAINER['invocations'] += 1
+    return {'rule': rule_name, 'due': due, 'end': end, 'duration_ms': (end - handler_start) * 1000, 'cold': cold, 'init_ms': init_ms, 'error': error}
+
+def replay(events, workers=1, rate=None, container_invocations=CONTAINER_INVOCATIONS, latency_ms=0):
+    """Replay the events and return the timing of every invocation.
+
+    Keyword arguments:
+    events -- the (rule name, Lambda event) to replay
+    workers -- the number of containers, i.e. the concurrency of the function (default 1)
+    rate -- the number of events sent per second; None to send them as fast as the workers take them (default None)
+    container_invocations -- the invocations of a container before it is replaced by a cold one (default CONTAINER_INVOCATIONS)
+    latency_ms -- the latency of the fake APIs, in milliseconds (default 0)
+    """
+    # A new interpreter per container, as in Lambda: nothing is inherited from this process.
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(workers, initializer=start_container, initargs=(latency_ms,), maxtasksperchild=container_invocations)
+    try:
+        start = time.time()
+        pending = []
+        for i, (rule_name, event) in enumerate(events):
+            due = None
+            if rate:
+                due = start + i / float(rate)
+                wait = due - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+            pending.append(pool.apply_async(invoke, (rule_name, event, due)))
+        invocations = [result.get() for result in pending]
+    finally:
+        pool.close()
+        pool.join()
+    return invocations
+
+def summarize(invocations):
+    """Return the report of the replay, by rule.
+
+    The latency of an invocation runs from the time its event was due to its end, including the wait for a free
+    container (at a target rate only) and the cold start; its duration is the time spent in the lambda_handler.
+    """
+    report = {}
+    for rule_name in sorted(set(invocation['rule'] for invocation in invocations)):
+        rule_invocations = [invocation for invocation in invocations if invocation['rule'] == rule_name]
+        first_due = min(invocation['due'] for invocation in rule_invocations)
+        last_end = max(invocation['end'] for invocation in rule_invocations)
+        latencies = [(invocation['end'] - invocation['due']) * 1000 for invocation in rule_invocations]
+        durations = [invocation['duration_ms'] for invocation in rule_invocations]
+        cold_starts = [invocation['init_ms'] for invocation in rule_invocations if invocation['cold'] or invocation['init_ms']]
+        rule_report = {
+            'invocations': len(rule_invocations),
+            'errors': len([invocation for invocation in rule_invocations if invocation['error']]),
+            'throughput_per_s': round(len(rule_invocations) / max(last_end - first_due, 1e-6), 1),
+            'cold_starts': len(cold_starts),
+            'init_ms_p50': round(percentile(cold_starts, 50), 1) if cold_starts else None
+        }
+        for p in PERCENTILES:
+            rule_report['latency_ms_p{}'.format(p)] = round(percentile(latencies, p), 1)
+        for p in PERCENTILES:
+            rule_report['duration_ms_p{}'.format(p)] = round(percentile(durations, p), 2)
+        report[rule_name] = rule_report
+    return report
+
+def write_synthetic_events(path, count, seed=0):
+    """Write count configuration items of security groups, Lambda functions and buckets, interleaved as in a deployment."""
+    from rdk_benchmark.accounts import SyntheticAccount
+    account = SyntheticAccount(security_groups=(count + 2) // 3, seed=seed)
+    with open(path, 'w') as events_file:
+        for i in range(count):
+            if i % 3 == 0:
+                configuration_item = account.build_security_group_configuration_item(account.security_groups[i // 3])
+            elif i % 3 == 1:
+                configuration_item = account.build_lambda_function_configuration_item(i // 3)
+            else:
+                configuration_item = account.build_bucket_configuration_item(i // 3)
+            events_file.write(json.dumps({'messageType': 'ConfigurationItemChangeNotification',
+                                          'notificationCreationTime': '2020-01-01T00:00:00.000Z',
+                                          'configurationItem': configuration_item}) + '\n')
+
+####################
+# Helper Functions #
+####################
+
+# Nearest-rank percentile.
+def percentile(values, p):
+    ordered = sorted(values)
+    rank = max(int(math.ceil(p / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(prog='python -m rdk_benchmark.replay', description='Replay change notifications through change-triggered rules.')
+    parser.add_argument('events', help='JSON lines file of Lambda events, invoking events or configuration items')
+    parser.add_argument('--rule', action='append', help='rule to replay the events to (can be repeated), by default ' + ', '.join(DEFAULT_RULES))
+    parser.add_argument('--workers', type=int, default=1, help='number of concurrent containers')
+    parser.add_argument('--rate', type=float, help='events sent per second, as fast as the workers allow by default')
+    parser.add_argument('--container-invocations', type=int, help='invocations of a container before a cold start, never by default')
+    parser.add_argument('--latency-ms', type=float, default=0, help='latency of every API call, in milliseconds')
+    parser.add_argument('--generate', type=int, metavar='COUNT', help='write COUNT synthetic configuration items to the events file and exit')
+    parser.add_argument('--output', help='JSON file where the report is written')
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    if args.generate:
+        write_synthetic_events(args.events, args.generate)
+        return 0
+
+    events = read_events(args.events, args.rule or list(DEFAULT_RULES))
+    invocations = replay(events, args.workers, args.rate, args.container_invocations, args.latency_ms)
+    report = summarize(invocations)
+    for rule_name, rule_report in report.items():
+        print('{}: {invocations} invocations, {errors} errors, {throughput_per_s}/s, {cold_starts} cold starts, latency p50 {latency_ms_p50} ms, '
+              'p95 {latency_ms_p95} ms, p99 {latency_ms_p99} ms, duration p50 {duration_ms_p50} ms, p99 {duration_ms_p99} ms'.format(rule_name, **rule_report))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
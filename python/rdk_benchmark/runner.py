@@ -0,0 +1,203 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Run of the lambda_handler of the rules against the fake APIs, measuring the wall time, the API calls
+(counted by rdk_runtime.metrics) and the peak memory allocated by Python.
+'''
+import os
+import sys
+import json
+import time
+import statistics
+import contextlib
+import importlib.util
+import tracemalloc
+
+# The rules are in the parent directory, next to the runtime they import.
+RULES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+if RULES_DIRECTORY not in sys.path:
+    sys.path.append(RULES_DIRECTORY)
+
+import rdk_runtime
+import rdk_runtime.clients
+import rdk_runtime.metrics
+
+from rdk_benchmark.fakes import FakeBoto3
+
+##############
+# Parameters #
+##############
+
+# Timeout of the fake Lambda function, as told by the context.
+LAMBDA_TIMEOUT_SECONDS = 900
+
+#############
+# Main Code #
+#############
+
+def load_rule(rule_name):
+    """Import the module of the rule from its directory."""
+    if rule_name in sys.modules:
+        return sys.modules[rule_name]
+    path = os.path.join(RULES_DIRECTORY, rule_name, rule_name + '.py')
+    spec = importlib.util.spec_from_file_location(rule_name, path)
+    rule = importlib.util.module_from_spec(spec)
+    sys.modules[rule_name] = rule
+    spec.loader.exec_module(rule)
+    return rule
+
+def build_scheduled_event(rule_name, account, rule_parameters=None):
+    return build_event(rule_name, account, {'messageType': 'ScheduledNotification', 'notificationCreationTime': '2020-01-01T00:00:00.000Z'}, rule_parameters)
+
+def build_change_event(rule_name, account, configuration_item, rule_parameters=None):
+    invoking_event = {
+        'messageType': 'ConfigurationItemChangeNotification',
+        'notificationCreationTime': '2020-01-01T00:00:00.000Z',
+        'configurationItem': configuration_item
+    }
+    return build_event(rule_name, account, invoking_event, rule_parameters)
+
+def build_event(rule_name, account, invoking_event, rule_parameters=None):
+    return {
+        'configRuleName': rule_name,
+        'configRuleArn': 'arn:aws:config:{}:{}:config-rule/config-rule-benchmark'.format(account.region, account.account_id),
+        'executionRoleArn': 'arn:aws:iam::{}:role/config-role'.format(account.account_id),
+        'accountId': account.account_id,
+        'eventLeftScope': False,
+        'invokingEvent': json.dumps(invoking_event),
+        'ruleParameters': json.dumps(rule_parameters or {}),
+        # PutEvaluations is called in test mode
+        'resultToken': 'TESTMODE'
+    }
+
+class FakeContext():
+    """The context of a Lambda invocation, telling the time left before the timeout."""
+
+    def __init__(self, function_name, timeout_seconds=LAMBDA_TIMEOUT_SECONDS):
+        self.function_name = function_name
+        self.memory_limit_in_mb = 128
+        self.deadline = time.time() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.time()) * 1000)
+
+@contextlib.contextmanager
+def fake_aws(fake_boto3):
+    """Within the block, the clients returned by rdk_runtime.get_client() call the fake APIs.
+
+    The caches of a warm Lambda container (clients, credential report) are cleared on entry and exit.
+    """
+    original_boto3 = rdk_runtime.clients.boto3
+    rdk_runtime.clients.boto3 = fake_boto3
+    rdk_runtime.clear_client_cache()
+    rdk_runtime.clear_credential_report_cache()
+    try:
+        yield
+    finally:
+        rdk_runtime.clear_client_cache()
+        rdk_runtime.clear_credential_report_cache()
+        rdk_runtime.clients.boto3 = original_boto3
+
+def run_rule(rule, events, fake_boto3, trace_memory=False):
+    """Call the lambda_handler of the rule on each event, with new clients, and return the measures of the run.
+
+    Keyword arguments:
+    rule -- the module of the rule
+    events -- the events given to the lambda_handler, one invocation each
+    fake_boto3 -- the FakeBoto3 serving the account
+    trace_memory -- True to measure the peak memory, which slows down the run (default False)
+    """
+    api_calls = {}
+    evaluation_count = 0
+    with fake_aws(fake_boto3), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        for event in events:
+            response = rule.lambda_handler(event, FakeContext(event['configRuleName']))
+            if isinstance(response, list):
+                evaluation_count += len(response)
+            elif isinstance(response, dict) and 'customerErrorCode' in response:
+                raise RuntimeError('The rule failed: {}'.format(response))
+            elif response:
+                evaluation_count += 1
+            # The handler resets the metrics on every invocation.
+            for (service, operation), counters in rdk_runtime.metrics.API_CALL_METRICS.operations.items():
+                key = service + '.' + operation
+                api_calls[key] = api_calls.get(key, 0) + counters['calls']
+        wall_time = time.perf_counter() - start
+        peak_memory = None
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        'wall_time_s': round(wall_time, 4),
+        'evaluations': evaluation_count,
+        'api_calls': sum(api_calls.values()),
+        'api_calls_by_operation': dict(sorted(api_calls.items())),
+        'peak_memory_mb': round(peak_memory / 1024.0 / 1024.0, 2) if peak_memory is not None else None
+    }
+
+def run_scenario(name, scenario, scale=1.0, latency_ms=0, repeat=1, trace_memory=True):
+    """Generate the account of the scenario, then run its rule repeat times and return the result of the benchmark.
+
+    The wall time is measured without tracing the memory; the peak memory is measured by an additional run.
+
+    Keyword arguments:
+    name -- the name of the scenario
+    scenario -- the scenario, see scenarios.py
+    scale -- the factor applied to the number of resources of the scenario (default 1.0)
+    latency_ms -- the latency of the fake APIs, in milliseconds (default 0)
+    repeat -- the number of timed runs (default 1)
+    trace_memory -- True to measure the peak memory (default True)
+    """
+    account = scenario['build_account'](scale)
+    rule = load_rule(scenario['rule'])
+    events = scenario['build_events'](account)
+    fake_boto3 = FakeBoto3(account, latency_ms)
+
+    runs = [run_rule(rule, events, fake_boto3) for _ in range(max(repeat, 1))]
+    result = {
+        'scenario': name,
+        'rule': scenario['rule'],
+        'account': account.get_size(),
+        'invocations': len(events),
+        'latency_ms': latency_ms,
+        'wall_time_s': [run['wall_time_s'] for run in runs],
+        'wall_time_median_s': round(statistics.median(run['wall_time_s'] for run in runs), 4),
+        'evaluations': runs[-1]['evaluations'],
+        'api_calls': runs[-1]['api_calls'],
+        'api_calls_by_operation': runs[-1]['api_calls_by_operation'],
+        'peak_memory_mb': None
+    }
+    if trace_memory:
+        result['peak_memory_mb'] = run_rule(rule, events, fake_boto3, trace_memory=True)['peak_memory_mb']
+    return result
+
+def compare_results(baseline, result, tolerance=0.2):
+    """Return the regressions of a result compared to the result of the same scenario in a baseline.
+
+    Any increase of the API calls is a regression; the wall time and the peak memory may grow within the tolerance.
+
+    Keyword arguments:
+    baseline -- the result of a previous benchmark of the scenario
+    result -- the result of the benchmark of the scenario
+    tolerance -- the relative increase of the wall time and peak memory tolerated (default 0.2)
+    """
+    regressions = []
+    if result['api_calls'] > baseline['api_calls']:
+        regressions.append('{}: {} API calls instead of {}'.format(result['scenario'], result['api_calls'], baseline['api_calls']))
+    if result['wall_time_median_s'] > baseline['wall_time_median_s'] * (1 + tolerance):
+        regressions.append('{}: {}s instead of {}s'.format(result['scenario'], result['wall_time_median_s'], baseline['wall_time_median_s']))
+    if result['peak_memory_mb'] and baseline.get('peak_memory_mb') and result['peak_memory_mb'] > baseline['peak_memory_mb'] * (1 + tolerance):
+        regressions.append('{}: {} MB instead of {} MB'.format(result['scenario'], result['peak_memory_mb'], baseline['peak_memory_mb']))
+    return regressions
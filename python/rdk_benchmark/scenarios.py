@@ -0,0 +1,58 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+The benchmark scenarios: a rule, the account it is run against and the events it is given.
+
+The sizes of the accounts are the ones of a large account; the --scale option of the benchmark reduces them.
+'''
+from rdk_benchmark.accounts import SyntheticAccount
+from rdk_benchmark.runner import build_scheduled_event, build_change_event
+
+#############
+# Main Code #
+#############
+
+def scaled(count, scale):
+    return max(int(count * scale), 1)
+
+SCENARIOS = {
+    'iam-ip-restriction': {
+        'rule': 'IAM_IP_RESTRICTION',
+        'build_account': lambda scale: SyntheticAccount(iam_users=scaled(10000, scale)),
+        'build_events': lambda account: [build_scheduled_event('IAM_IP_RESTRICTION', account, {'maxIpNums': '20'})]
+    },
+    'iam-user-mfa-enabled': {
+        'rule': 'IAM_USER_MFA_ENABLED',
+        'build_account': lambda scale: SyntheticAccount(iam_users=scaled(10000, scale)),
+        'build_events': lambda account: [build_scheduled_event('IAM_USER_MFA_ENABLED', account)]
+    },
+    # Change-triggered: one invocation per security group, as when the rule is deployed.
+    'vpc-sg-open-only-to-authorized-ports': {
+        'rule': 'VPC_SG_OPEN_ONLY_TO_AUTHORIZED_PORTS',
+        'build_account': lambda scale: SyntheticAccount(security_groups=scaled(5000, scale)),
+        'build_events': lambda account: [
+            build_change_event('VPC_SG_OPEN_ONLY_TO_AUTHORIZED_PORTS', account, account.build_security_group_configuration_item(security_group),
+                               {'authorizedTcpPorts': '80,443'})
+            for security_group in account.security_groups]
+    },
+    # Change-triggered, but every REST API of the region is evaluated on each change.
+    'api-gw-authorizer-in-place': {
+        'rule': 'API_GW_AUTHORIZER_IN_PLACE',
+        'build_account': lambda scale: SyntheticAccount(rest_apis=scaled(2000, scale)),
+        'build_events': lambda account: [
+            build_change_event('API_GW_AUTHORIZER_IN_PLACE', account, account.build_rest_api_configuration_item(account.rest_apis[0]))]
+    },
+    'cloudwatch-log-group-encrypted': {
+        'rule': 'CLOUDWATCH_LOG_GROUP_ENCRYPTED',
+        'build_account': lambda scale: SyntheticAccount(log_groups=scaled(100000, scale)),
+        'build_events': lambda account: [build_scheduled_event('CLOUDWATCH_LOG_GROUP_ENCRYPTED', account)]
+    }
+}
@@ -0,0 +1,29 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Runtime shared by the RDK rules of this directory.
+
+It holds the code which used to be copied in the "Boilerplate Code" section of every rule. See README.md.
+'''
+from rdk_runtime.clients import get_client, get_assume_role_credentials, get_execution_role_arn, clear_client_cache
+from rdk_runtime.evaluations import build_annotation, build_evaluation, build_evaluation_from_config_item, clean_up_old_evaluations
+from rdk_runtime.handler import (lambda_handler, build_parameters_value_error_response, build_error_response,
+                                 build_internal_error_response, is_internal_error, check_defined,
+                                 get_configuration_item, is_applicable)
+from rdk_runtime.submission import put_evaluations
+from rdk_runtime.checkpoint import get_cursor, LocalFileCursorStore, S3CursorStore
+from rdk_runtime.metrics import instrument_client, ApiCallMetrics
+from rdk_runtime.credential_report import get_credential_report, clear_credential_report_cache, CredentialReport
+from rdk_runtime.authorization_details import get_authorization_snapshot, AuthorizationSnapshot
+from rdk_runtime.policy_cache import get_managed_policy_document, clear_policy_document_cache, PolicyDocumentCache, POLICY_DOCUMENT_CACHE
+from rdk_runtime.policy_engine import compile_policy, clear_compiled_policies, get_wildcard_matcher, CompiledPolicy, POLICY_COMPILER
+from rdk_runtime.recorded_policies import has_recorded_policies, iter_recorded_policies
+from rdk_runtime.route_tables import get_route_table_index, clear_route_table_cache, RouteTableIndex
@@ -0,0 +1,108 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Snapshot of the IAM authorization details of an account.
+
+GetAccountAuthorizationDetails returns, by pages of up to 1000 entities, the users, groups and roles of the
+account with their inline policies and attached managed policies, and the managed policies with their versions.
+A periodic rule evaluating every entity of a type builds the snapshot once, in a few dozen calls, instead of
+calling ListXPolicies, GetXPolicy, ListAttachedXPolicies, GetPolicy and GetPolicyVersion for each entity.
+
+Only the default version of each managed policy is kept.
+'''
+from rdk_runtime.policy_cache import get_managed_policy_document
+
+##############
+# Parameters #
+##############
+
+# The entity types of the snapshot, and the filter of GetAccountAuthorizationDetails returning them.
+ENTITY_FILTERS = {
+    'AWS::IAM::User': 'User',
+    'AWS::IAM::Group': 'Group',
+    'AWS::IAM::Role': 'Role'
+}
+
+# The managed policies attached to the entities.
+POLICY_FILTERS = ['LocalManagedPolicy', 'AWSManagedPolicy']
+
+# The fields of the details of each entity type: list of the response, name, id, inline policies.
+ENTITY_FIELDS = {
+    'AWS::IAM::User': ('UserDetailList', 'UserName', 'UserId', 'UserPolicyList'),
+    'AWS::IAM::Group': ('GroupDetailList', 'GroupName', 'GroupId', 'GroupPolicyList'),
+    'AWS::IAM::Role': ('RoleDetailList', 'RoleName', 'RoleId', 'RolePolicyList')
+}
+
+PAGE_SIZE = 1000
+
+#############
+# Main Code #
+#############
+
+def get_authorization_snapshot(iam_client, resource_types, include_policies=True):
+    """Return the AuthorizationSnapshot of the entities of the given types, with the managed policies.
+
+    Keyword arguments:
+    iam_client -- the IAM boto client
+    resource_types -- the entity types to get, among AWS::IAM::User, AWS::IAM::Group and AWS::IAM::Role
+    include_policies -- False to skip the managed policies, e.g. when only the details of the entities are read (default True)
+    """
+    snapshot = AuthorizationSnapshot()
+    filters = [ENTITY_FILTERS[resource_type] for resource_type in resource_types]
+    if include_policies:
+        filters += POLICY_FILTERS
+    response = iam_client.get_account_authorization_details(Filter=filters, MaxItems=PAGE_SIZE)
+    while True:
+        snapshot.add_page(response)
+        if not response.get('IsTruncated'):
+            break
+        response = iam_client.get_account_authorization_details(Filter=filters, MaxItems=PAGE_SIZE, Marker=response['Marker'])
+    return snapshot
+
+class AuthorizationSnapshot():
+    """The users, groups and roles of an account, with the default version of its managed policies."""
+
+    def __init__(self):
+        # resource type -> list of the details of the entities, as returned by the API
+        self.entities = {resource_type: [] for resource_type in ENTITY_FIELDS}
+        # policy ARN -> (policy name, document of the default version)
+        self.managed_policies = {}
+
+    def add_page(self, response):
+        for resource_type, fields in ENTITY_FIELDS.items():
+            self.entities[resource_type].extend(response.get(fields[0], []))
+        for policy in response.get('Policies', []):
+            for version in policy['PolicyVersionList']:
+                if version['IsDefaultVersion']:
+                    self.managed_policies[policy['Arn']] = (policy['PolicyName'], version['Document'])
+
+    def iter_entities(self, resource_type):
+        """Yield the (name, id, details) of the entities of the type."""
+        name_field, id_field = ENTITY_FIELDS[resource_type][1:3]
+        for entity in self.entities[resource_type]:
+            yield entity[name_field], entity[id_field], entity
+
+    def iter_policies(self, resource_type, entity, iam_client):
+        """Yield the (policy type, policy name, document) of the inline policies of the entity, then of its managed policies.
+
+        Keyword arguments:
+        resource_type -- the type of the entity
+        entity -- the details of the entity
+        iam_client -- the IAM boto client getting a managed policy missing from the snapshot, e.g. attached since, through the policy document cache
+        """
+        for policy in entity.get(ENTITY_FIELDS[resource_type][3], []):
+            yield 'inline', policy['PolicyName'], policy['PolicyDocument']
+        for attached_policy in entity.get('AttachedManagedPolicies', []):
+            policy_arn = attached_policy['PolicyArn']
+            if policy_arn not in self.managed_policies:
+                self.managed_policies[policy_arn] = (attached_policy['PolicyName'], get_managed_policy_document(iam_client, policy_arn))
+            policy_name, document = self.managed_policies[policy_arn]
+            yield 'managed', policy_name, document
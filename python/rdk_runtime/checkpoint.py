@@ -0,0 +1,234 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Checkpoint and resume of the rules which cannot evaluate the whole account within the Lambda timeout.
+
+A rule setting CHECKPOINT_MODE = True, whose evaluate_compliance() is a generator, is interrupted a little
+before its Lambda function times out (CHECKPOINT_MARGIN_SECONDS, default MARGIN_SECONDS). The evaluations
+yielded so far are sent, then a cursor is saved in the cursor store of the rule: the pagination marker set by
+the rule and the resources already evaluated. The next invocation of the rule loads the cursor, the rule lists
+its resources again from the marker and skips the resources already evaluated. The resources previously reported
+and not evaluated again are cleaned up once a run completes, and the cursor is then deleted.
+
+The cursor must be saved in a store shared by all the containers of the Lambda function: a periodic rule is
+rarely invoked again in the same container. The rule sets CHECKPOINT_STORE, or the RDK_CHECKPOINT_BUCKET
+environment variable names the bucket of an S3CursorStore. Without a store, the rule is not checkpointed.
+
+The rule reads the cursor of the current invocation with get_cursor().
+'''
+import os
+import json
+import time
+import threading
+
+from rdk_runtime.clients import get_client
+
+##############
+# Parameters #
+##############
+
+# Time kept to send the last evaluations and save the cursor before the Lambda function times out, in seconds.
+MARGIN_SECONDS = 20
+
+# A cursor older than this is ignored: the run it belongs to is started again from scratch. It must exceed the
+# period of the rule (at most 24 hours), as the run is resumed by the next periodic invocation.
+CURSOR_MAX_AGE_SECONDS = 48 * 3600
+
+# Environment variable naming the bucket of the S3CursorStore used when the rule sets no CHECKPOINT_STORE.
+BUCKET_VARIABLE = 'RDK_CHECKPOINT_BUCKET'
+
+# Cursor of the invocation being handled by the thread, see get_cursor().
+CURRENT = threading.local()
+
+#############
+# Main Code #
+#############
+
+def is_checkpointing(rule):
+    return getattr(rule, 'CHECKPOINT_MODE', False)
+
+def get_checkpoint_margin(rule):
+    return getattr(rule, 'CHECKPOINT_MARGIN_SECONDS', MARGIN_SECONDS)
+
+def get_cursor_max_age(rule):
+    return getattr(rule, 'CHECKPOINT_CURSOR_MAX_AGE_SECONDS', CURSOR_MAX_AGE_SECONDS)
+
+def get_cursor_store(rule, event):
+    """Return the CHECKPOINT_STORE of the rule, else an S3CursorStore in RDK_CHECKPOINT_BUCKET, else None."""
+    store = getattr(rule, 'CHECKPOINT_STORE', None)
+    if store is None and os.environ.get(BUCKET_VARIABLE):
+        # The bucket belongs to the account of the Lambda function: the Config role is not assumed.
+        store = S3CursorStore(get_client('s3', event), os.environ[BUCKET_VARIABLE])
+    return store
+
+def get_cursor():
+    """Return the cursor of the invocation being handled.
+
+    Outside of a checkpointed invocation (e.g. when evaluate_compliance() is called by the unit tests of the rule),
+    a new cursor is returned: nothing is processed yet and the marker it is given is not saved.
+    """
+    cursor = getattr(CURRENT, 'cursor', None)
+    if cursor is None:
+        return Cursor()
+    return cursor
+
+# Called on every invocation, so that get_cursor() never returns the cursor of a previous invocation.
+def open_checkpoint(rule, event, context):
+    """Return the Checkpoint of the invocation when the rule is in CHECKPOINT_MODE, None otherwise.
+
+    Keyword arguments:
+    rule -- the module of the rule
+    event -- the event variable given in the lambda handler
+    context -- the context variable given in the lambda handler
+    """
+    checkpoint = None
+    if is_checkpointing(rule):
+        store = get_cursor_store(rule, event)
+        if store is None:
+            print("Checkpoint: no CHECKPOINT_STORE nor {} set, the rule evaluates every resource in one invocation.".format(BUCKET_VARIABLE))
+        else:
+            checkpoint = Checkpoint(store, get_cursor_key(event), context, get_checkpoint_margin(rule), get_cursor_max_age(rule))
+    CURRENT.cursor = checkpoint.cursor if checkpoint else None
+    return checkpoint
+
+def get_cursor_key(event):
+    return '{}-{}'.format(event['accountId'], event['configRuleName'])
+
+class Cursor():
+    """Position of a rule in the listing of its resources.
+
+    The rule sets marker to the pagination token of the page it is evaluating (None for the first page) and calls
+    is_processed() to skip the resources evaluated by a previous invocation. The marker can be any JSON value.
+    """
+
+    def __init__(self, marker=None, processed=(), saved_at=None):
+        self.marker = marker
+        # (resource type, resource id) of the resources evaluated by the previous invocations of the run
+        self.processed = set(tuple(key) for key in processed)
+        self.saved_at = saved_at
+
+    def is_resumed(self):
+        return self.saved_at is not None
+
+    def is_processed(self, resource_type, resource_id):
+        return (resource_type, resource_id) in self.processed
+
+    def to_dict(self):
+        return {'marker': self.marker, 'processed': sorted(self.processed), 'saved_at': self.saved_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('marker'), data.get('processed', []), data.get('saved_at'))
+
+class Checkpoint():
+    """The cursor of an invocation, its store and the time left to the Lambda function."""
+
+    def __init__(self, store, key, context, margin_seconds=MARGIN_SECONDS, max_age_seconds=CURSOR_MAX_AGE_SECONDS):
+        self.store = store
+        self.key = key
+        self.margin_millis = margin_seconds * 1000
+        # The context given by a local test harness may not tell the time left.
+        self.get_remaining_time_in_millis = getattr(context, 'get_remaining_time_in_millis', None)
+        self.cursor = store.load(key)
+        if self.cursor and time.time() - self.cursor.saved_at > max_age_seconds:
+            print("Checkpoint: ignoring the cursor saved at {}, started again from scratch.".format(self.cursor.saved_at))
+            self.cursor = None
+        if self.cursor:
+            print("Checkpoint: resuming from marker {}, {} resource(s) already evaluated.".format(self.cursor.marker, len(self.cursor.processed)))
+        else:
+            self.cursor = Cursor()
+
+    def is_due(self):
+        """Return True when the evaluation must stop to leave time to save the cursor."""
+        if self.get_remaining_time_in_millis is None:
+            return False
+        return self.get_remaining_time_in_millis() < self.margin_millis
+
+    def save(self, processed):
+        """Save the cursor for the next invocation.
+
+        Keyword arguments:
+        processed -- the keys of the resources evaluated since the start of the run, including by the previous invocations
+        """
+        self.cursor.processed = set(processed)
+        self.cursor.saved_at = time.time()
+        self.store.save(self.key, self.cursor)
+        CURRENT.cursor = None
+        print("Checkpoint: interrupted at marker {}, {} resource(s) evaluated so far.".format(self.cursor.marker, len(self.cursor.processed)))
+
+    def complete(self):
+        """Delete the cursor once the run evaluated every resource."""
+        if self.cursor.is_resumed():
+            self.store.delete(self.key)
+        CURRENT.cursor = None
+
+class LocalFileCursorStore():
+    """Cursors saved as JSON files in a local directory.
+
+    In Lambda, the directory must be under /tmp: the cursor is then only found by an invocation running in the
+    same container, which a periodic rule rarely gets. It is meant for the tests and the local runs of the rules;
+    in Lambda, use a store shared by the containers, e.g. an S3CursorStore.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def load(self, key):
+        try:
+            with open(self.get_path(key)) as cursor_file:
+                return Cursor.from_dict(json.load(cursor_file))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, key, cursor):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # Written aside then renamed, so that an interrupted write does not leave a truncated cursor.
+        temporary_path = self.get_path(key) + '.tmp'
+        with open(temporary_path, 'w') as cursor_file:
+            json.dump(cursor.to_dict(), cursor_file)
+        os.rename(temporary_path, self.get_path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+class S3CursorStore():
+    """Cursors saved as JSON objects in an S3 bucket, shared by all the containers of the rule.
+
+    Keyword arguments:
+    s3_client -- the S3 boto client, with the permissions to get, put and delete the objects under the prefix
+    bucket -- the name of the bucket
+    prefix -- the prefix of the keys of the cursors (default 'rdk-checkpoints/')
+    """
+
+    def __init__(self, s3_client, bucket, prefix='rdk-checkpoints/'):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def load(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.prefix + key + '.json')
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return Cursor.from_dict(json.loads(response['Body'].read()))
+
+    def save(self, key, cursor):
+        self.s3_client.put_object(Bucket=self.bucket, Key=self.prefix + key + '.json', Body=json.dumps(cursor.to_dict()))
+
+    def delete(self, key):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self.prefix + key + '.json')
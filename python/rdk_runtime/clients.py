@@ -0,0 +1,167 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Boto client factory shared by the rules.
+
+Clients are kept at module level, keyed by service, region and execution role, so that a warm
+Lambda container reuses the clients (and the service models loaded by the boto3 default session)
+built by the previous invocations instead of building them again on every call. Likewise, the
+credentials of an assumed role are kept until shortly before they expire, and shared by the
+clients of every service built on that role.
+
+Every client is instrumented to count its API calls, see metrics.py.
+'''
+import os
+import sys
+import json
+import datetime
+import threading
+import boto3
+import botocore.exceptions
+
+from rdk_runtime.metrics import instrument_client
+
+try:
+    import liblogging
+except ImportError:
+    pass
+
+##############
+# Parameters #
+##############
+
+# Duration of the session opened on the role assumed in cross-account mode.
+CONFIG_ROLE_TIMEOUT_SECONDS = 900
+
+# Assumed-role credentials (and the clients built on them) are renewed when they expire within this delay.
+CREDENTIALS_EXPIRY_MARGIN = datetime.timedelta(minutes=2)
+
+# (service, region, role_arn) -> (client, expiration of its credentials or None)
+CLIENT_CACHE = {}
+
+# Building a client on the boto3 default session is not thread-safe.
+CLIENT_CACHE_LOCK = threading.RLock()
+
+# role_arn -> credentials returned by STS AssumeRole
+CREDENTIALS_CACHE = {}
+
+# Only one thread assumes a given role at a time, the others wait for its credentials.
+CREDENTIALS_CACHE_LOCK = threading.RLock()
+
+#############
+# Main Code #
+#############
+
+# This gets the client after assuming the Config service role
+# either in the same AWS account or cross-account.
+def get_client(service, event, region=None, assume_role=False, role_arn=None):
+    """Return the service boto client, reusing the one built by a previous call when possible.
+
+    Keyword arguments:
+    service -- the service name used for calling the boto.client()
+    event -- the event variable given in the lambda handler
+    region -- the region where the client is called (default: None)
+    assume_role -- True to assume the role given by the Config rule, i.e. the ASSUME_ROLE_MODE of the rule (default: False)
+    role_arn -- the role to assume instead of the executionRoleArn of the event (default: None)
+    """
+    if assume_role:
+        role_arn = role_arn or event['executionRoleArn']
+    else:
+        role_arn = None
+    key = (service, region or get_default_region(), role_arn)
+
+    with CLIENT_CACHE_LOCK:
+        if key in CLIENT_CACHE:
+            client, expiration = CLIENT_CACHE[key]
+            if not is_expiring(expiration):
+                return client
+            del CLIENT_CACHE[key]
+
+        if not assume_role:
+            client = instrument_client(boto3.client(service, region_name=region))
+            CLIENT_CACHE[key] = (client, None)
+            return client
+
+        credentials = get_assume_role_credentials(role_arn, region)
+        client = instrument_client(boto3.client(service, aws_access_key_id=credentials['AccessKeyId'],
+                                                aws_secret_access_key=credentials['SecretAccessKey'],
+                                                aws_session_token=credentials['SessionToken'],
+                                                region_name=region
+                                               ))
+        # Only credentials with a known expiration can be safely reused.
+        expiration = credentials.get('Expiration')
+        if isinstance(expiration, datetime.datetime):
+            CLIENT_CACHE[key] = (client, expiration)
+        return client
+
+# Return the credentials of the role, assuming it only if the cached ones are missing or about to expire.
+def get_assume_role_credentials(role_arn, region=None):
+    with CREDENTIALS_CACHE_LOCK:
+        credentials = CREDENTIALS_CACHE.get(role_arn)
+        if credentials and not is_expiring(credentials['Expiration']):
+            return credentials
+
+        credentials = request_assume_role_credentials(role_arn, region)
+        # Only credentials with a known expiration can be safely reused.
+        if isinstance(credentials.get('Expiration'), datetime.datetime):
+            CREDENTIALS_CACHE[role_arn] = credentials
+        return credentials
+
+def request_assume_role_credentials(role_arn, region=None):
+    sts_client = get_client('sts', None, region)
+    try:
+        assume_role_response = sts_client.assume_role(RoleArn=role_arn,
+                                                      RoleSessionName="configLambdaExecution",
+                                                      DurationSeconds=CONFIG_ROLE_TIMEOUT_SECONDS)
+        if 'liblogging' in sys.modules:
+            liblogging.logSession(role_arn, assume_role_response)
+        return assume_role_response['Credentials']
+    except botocore.exceptions.ClientError as ex:
+        # Scrub error message for any internal account info leaks
+        print(str(ex))
+        if 'AccessDenied' in ex.response['Error']['Code']:
+            ex.response['Error']['Message'] = "AWS Config does not have permission to assume the IAM role."
+        else:
+            ex.response['Error']['Message'] = "InternalError"
+            ex.response['Error']['Code'] = "InternalError"
+        raise ex
+
+# Use the role named by the ExecutionRoleName parameter, if any, instead of the one given by Config.
+def get_execution_role_arn(event):
+    role_arn = None
+    if 'ruleParameters' in event:
+        rule_params = json.loads(event['ruleParameters'])
+        role_name = rule_params.get("ExecutionRoleName")
+        if role_name:
+            execution_role_prefix = event["executionRoleArn"].split("/")[0]
+            role_arn = "{}/{}".format(execution_role_prefix, role_name)
+
+    if not role_arn:
+        role_arn = event['executionRoleArn']
+
+    return role_arn
+
+def get_default_region():
+    return os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION')
+
+def is_expiring(expiration):
+    if expiration is None:
+        return False
+    if expiration.tzinfo is None:
+        expiration = expiration.replace(tzinfo=datetime.timezone.utc)
+    return expiration - CREDENTIALS_EXPIRY_MARGIN <= datetime.datetime.now(datetime.timezone.utc)
+
+def clear_client_cache():
+    """Forget every cached client and credentials, e.g. between two tests swapping the boto3 module."""
+    with CLIENT_CACHE_LOCK:
+        CLIENT_CACHE.clear()
+    with CREDENTIALS_CACHE_LOCK:
+        CREDENTIALS_CACHE.clear()
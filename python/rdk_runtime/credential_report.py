@@ -0,0 +1,214 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+IAM credential report shared by the rules evaluating the IAM users.
+
+The credential report gives, in one CSV document, the password, MFA and access key activity of every user of
+the account. It replaces the ListAccessKeys, GetAccessKeyLastUsed and ListMFADevices calls the rules would make
+for each user. The report is generated by IAM at most every 4 hours: a report older than the maximum age of the
+rule is generated again, and the rule falls back to its per-user calls when no fresh report can be obtained
+(no permission, generation still in progress after GENERATION_TIMEOUT_SECONDS). A user created after the report
+was generated is missing from it, and is evaluated with the per-user calls too.
+
+The parsed report is kept at module level, by account, for the next invocations of a warm Lambda container.
+'''
+import io
+import csv
+import time
+import datetime
+import threading
+import dateutil.parser
+import botocore.exceptions
+
+##############
+# Parameters #
+##############
+
+# Age of the report after which it is generated again, the report generated by IAM being at most 4 hours old.
+MAX_AGE_SECONDS = 4 * 3600
+
+# Time waited for IAM to generate the report, before falling back to the per-user calls.
+GENERATION_TIMEOUT_SECONDS = 30
+GENERATION_POLL_SECONDS = 2
+
+# The errors of GetCredentialReport telling that a report must be generated first.
+REPORT_MISSING_ERROR_CODES = ('ReportNotPresent', 'ReportExpired', 'ReportInProgress')
+
+# The values of the report telling that a date is unknown.
+NO_DATE_VALUES = ('N/A', 'no_information', 'not_supported', '')
+
+# accountId -> CredentialReport
+REPORT_CACHE = {}
+
+# Only one thread downloads the report of an account at a time.
+REPORT_CACHE_LOCK = threading.RLock()
+
+#############
+# Main Code #
+#############
+
+def get_credential_report(iam_client, event=None, max_age_seconds=MAX_AGE_SECONDS):
+    """Return the CredentialReport of the account, or None when no report generated within max_age_seconds is available.
+
+    Keyword arguments:
+    iam_client -- the IAM boto client
+    event -- the event variable given in the lambda handler, whose accountId keys the cached report (default None)
+    max_age_seconds -- the maximum age of the report; 0 to never use it (default MAX_AGE_SECONDS)
+    """
+    if not max_age_seconds:
+        return None
+    key = event.get('accountId') if event else None
+    with REPORT_CACHE_LOCK:
+        report = REPORT_CACHE.get(key)
+        if report and not report.is_stale(max_age_seconds):
+            return report
+
+        try:
+            report = download_credential_report(iam_client)
+            if report is None or report.is_stale(max_age_seconds):
+                report = None
+                if wait_for_credential_report(iam_client):
+                    report = download_credential_report(iam_client)
+        except (botocore.exceptions.ClientError, UnsupportedReportError) as ex:
+            # e.g. AccessDenied: the rule can still evaluate the users one by one.
+            print('Credential report not available: {}'.format(ex))
+            return None
+
+        if report is None or report.is_stale(max_age_seconds):
+            print('No credential report generated in the last {} seconds, the users are evaluated one by one.'.format(max_age_seconds))
+            return None
+        REPORT_CACHE[key] = report
+        return report
+
+def download_credential_report(iam_client):
+    try:
+        response = iam_client.get_credential_report()
+    except botocore.exceptions.ClientError as ex:
+        if ex.response['Error']['Code'] in REPORT_MISSING_ERROR_CODES:
+            return None
+        raise
+    if response.get('ReportFormat') != 'text/csv':
+        raise UnsupportedReportError('Unsupported credential report format: {}'.format(response.get('ReportFormat')))
+    return CredentialReport.from_csv(response['Content'].decode('utf-8'), response['GeneratedTime'])
+
+# Ask IAM for a new report, and wait for it to be generated.
+def wait_for_credential_report(iam_client):
+    deadline = time.time() + GENERATION_TIMEOUT_SECONDS
+    while True:
+        if iam_client.generate_credential_report()['State'] == 'COMPLETE':
+            return True
+        if time.time() + GENERATION_POLL_SECONDS > deadline:
+            return False
+        time.sleep(GENERATION_POLL_SECONDS)
+
+def clear_credential_report_cache():
+    """Forget the cached reports, e.g. between two tests."""
+    with REPORT_CACHE_LOCK:
+        REPORT_CACHE.clear()
+
+class UnsupportedReportError(Exception):
+    pass
+
+class CredentialReport():
+    """The credential report of an account, indexed by user name.
+
+    Keyword arguments:
+    users -- the CredentialReportUser of every user of the report
+    generated_time -- the time the report was generated at
+    """
+
+    def __init__(self, users, generated_time):
+        self.users = {user.user_name: user for user in users}
+        self.generated_time = as_utc(generated_time)
+
+    @classmethod
+    def from_csv(cls, content, generated_time):
+        users = []
+        for row in csv.DictReader(io.StringIO(content)):
+            # The root user is not an IAM user.
+            if row['user'] != '<root_account>':
+                users.append(CredentialReportUser.from_row(row))
+        return cls(users, generated_time)
+
+    def get_age_seconds(self):
+        return (datetime.datetime.now(datetime.timezone.utc) - self.generated_time).total_seconds()
+
+    def is_stale(self, max_age_seconds):
+        return self.get_age_seconds() > max_age_seconds
+
+    def get_user(self, user):
+        """Return the CredentialReportUser of a user returned by ListUsers, or None if the report does not know this user.
+
+        A user created after the report was generated is missing from the report; a user deleted and created again
+        with the same name since then has another creation time.
+        """
+        report_user = self.users.get(user['UserName'])
+        if report_user is None or report_user.creation_time is None:
+            return None
+        if abs((report_user.creation_time - as_utc(user['CreateDate'])).total_seconds()) >= 1:
+            return None
+        return report_user
+
+class CredentialReportUser():
+    """The row of a user in the credential report. The dates are timezone aware, or None when unknown."""
+
+    def __init__(self, user_name, arn, creation_time, password_enabled, password_last_used, mfa_active, access_keys):
+        self.user_name = user_name
+        self.arn = arn
+        self.creation_time = creation_time
+        self.password_enabled = password_enabled
+        self.password_last_used = password_last_used
+        self.mfa_active = mfa_active
+        self.access_keys = access_keys
+
+    @classmethod
+    def from_row(cls, row):
+        access_keys = [CredentialReportAccessKey(number,
+                                                 parse_boolean(row['access_key_{}_active'.format(number)]),
+                                                 parse_date(row['access_key_{}_last_rotated'.format(number)]),
+                                                 parse_date(row['access_key_{}_last_used_date'.format(number)]))
+                       for number in (1, 2)]
+        return cls(row['user'], row['arn'], parse_date(row['user_creation_time']), parse_boolean(row['password_enabled']),
+                   parse_date(row['password_last_used']), parse_boolean(row['mfa_active']),
+                   [access_key for access_key in access_keys if access_key.last_rotated])
+
+class CredentialReportAccessKey():
+    """One of the two access keys of a user in the credential report, known by its number only.
+
+    Keyword arguments:
+    number -- 1 or 2
+    active -- True if the key is active
+    last_rotated -- the time the key was created or last rotated
+    last_used -- the time the key was last used, or None
+    """
+
+    def __init__(self, number, active, last_rotated, last_used):
+        self.number = number
+        self.active = active
+        self.last_rotated = last_rotated
+        self.last_used = last_used
+
+####################
+# Helper Functions #
+####################
+
+def parse_date(value):
+    if value in NO_DATE_VALUES:
+        return None
+    return as_utc(dateutil.parser.parse(value))
+
+def parse_boolean(value):
+    return value == 'true'
+
+def as_utc(date):
+    if date.tzinfo is None:
+        return date.replace(tzinfo=datetime.timezone.utc)
+    return date.astimezone(datetime.timezone.utc)
@@ -0,0 +1,98 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Delta reporting of the periodic rules.
+
+A rule setting DELTA_REPORTING_MODE = True only reports the evaluations which differ from the
+results Config already holds for the rule: a resource whose ComplianceType and Annotation did not
+change is not sent again, unless its result was recorded more than DELTA_REPORTING_FULL_REFRESH_DAYS
+ago (default FULL_REFRESH_DAYS). Every resource is thus refreshed on that cadence, spread over the
+invocations according to when each result was last recorded.
+'''
+import datetime
+
+from rdk_runtime.evaluations import build_evaluation, get_evaluation_key, iter_old_results
+
+##############
+# Parameters #
+##############
+
+# Maximum age of a result before it is reported again, even if unchanged.
+FULL_REFRESH_DAYS = 7
+
+#############
+# Main Code #
+#############
+
+def is_delta_reporting(rule):
+    return getattr(rule, 'DELTA_REPORTING_MODE', False)
+
+def get_full_refresh_days(rule):
+    return getattr(rule, 'DELTA_REPORTING_FULL_REFRESH_DAYS', FULL_REFRESH_DAYS)
+
+# Delta reporting counterpart of clean_up_old_evaluations().
+def select_changed_evaluations(config_client, latest_evaluations, event, resource_type, full_refresh_days=FULL_REFRESH_DAYS):
+    """Return a NOT_APPLICABLE evaluation for every resource previously reported by the rule and missing from
+    the latest evaluations, followed by the latest evaluations which changed or are due for a refresh.
+
+    Keyword arguments:
+    config_client -- the Config boto client
+    latest_evaluations -- the list of evaluations returned by the rule
+    event -- the event variable given in the lambda handler
+    resource_type -- the resource type of the previous results which do not give one, usually the DEFAULT_RESOURCE_TYPE of the rule
+    full_refresh_days -- the maximum age of a result before it is reported again (default FULL_REFRESH_DAYS)
+    """
+    previous_results = PreviousResults(config_client, event, resource_type, full_refresh_days)
+    latest_keys = set(get_evaluation_key(latest_eval) for latest_eval in latest_evaluations)
+    stale_evaluations = list(previous_results.build_stale_evaluations(latest_keys, event))
+    changed_evaluations = [latest_eval for latest_eval in latest_evaluations if previous_results.has_changed(latest_eval)]
+    previous_results.print_summary()
+    return stale_evaluations + changed_evaluations
+
+class PreviousResults():
+    """The COMPLIANT and NON_COMPLIANT results Config holds for the rule, indexed by resource."""
+
+    def __init__(self, config_client, event, resource_type, full_refresh_days=FULL_REFRESH_DAYS):
+        self.refresh_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=full_refresh_days)
+        self.unchanged_count = 0
+        # (resource type, resource id) -> (compliance type, annotation, time the result was recorded)
+        self.results = {}
+        for old_result in iter_old_results(config_client, event):
+            qualifier = old_result['EvaluationResultIdentifier']['EvaluationResultQualifier']
+            key = (qualifier.get('ResourceType', resource_type), qualifier['ResourceId'])
+            self.results[key] = (old_result.get('ComplianceType'), old_result.get('Annotation'), old_result.get('ResultRecordedTime'))
+
+    def has_changed(self, evaluation):
+        """Return False when the evaluation repeats a recent enough result."""
+        previous = self.results.get(get_evaluation_key(evaluation))
+        if not previous:
+            return True
+        compliance_type, annotation, recorded_time = previous
+        if compliance_type != evaluation['ComplianceType'] or annotation != evaluation.get('Annotation'):
+            return True
+        if not isinstance(recorded_time, datetime.datetime) or is_older(recorded_time, self.refresh_before):
+            return True
+        self.unchanged_count += 1
+        return False
+
+    def build_stale_evaluations(self, reported_keys, event):
+        """Yield a NOT_APPLICABLE evaluation for every previous result whose resource is missing from reported_keys."""
+        for key in self.results:
+            if key not in reported_keys:
+                yield build_evaluation(key[1], "NOT_APPLICABLE", event, key[0])
+
+    def print_summary(self):
+        print("Delta reporting: {} unchanged evaluation(s) not sent again.".format(self.unchanged_count))
+
+def is_older(recorded_time, refresh_before):
+    if recorded_time.tzinfo is None:
+        recorded_time = recorded_time.replace(tzinfo=datetime.timezone.utc)
+    return recorded_time < refresh_before
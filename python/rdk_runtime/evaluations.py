@@ -0,0 +1,107 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Construction of the evaluations reported to AWS Config.
+'''
+import json
+
+# Build annotation within Service constraints
+def build_annotation(annotation_string):
+    if len(annotation_string) > 256:
+        return annotation_string[:244] + " [truncated]"
+    return annotation_string
+
+# This generate an evaluation for config
+def build_evaluation(resource_id, compliance_type, event, resource_type, annotation=None):
+    """Form an evaluation as a dictionary. Usually suited to report on scheduled rules.
+
+    Keyword arguments:
+    resource_id -- the unique id of the resource to report
+    compliance_type -- either COMPLIANT, NON_COMPLIANT or NOT_APPLICABLE
+    event -- the event variable given in the lambda handler
+    resource_type -- the CloudFormation resource type (or AWS::::Account) to report on the rule
+    annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
+    """
+    eval_cc = {}
+    if annotation:
+        eval_cc['Annotation'] = build_annotation(annotation)
+    eval_cc['ComplianceResourceType'] = resource_type
+    eval_cc['ComplianceResourceId'] = resource_id
+    eval_cc['ComplianceType'] = compliance_type
+    eval_cc['OrderingTimestamp'] = str(json.loads(event['invokingEvent'])['notificationCreationTime'])
+    return eval_cc
+
+def build_evaluation_from_config_item(configuration_item, compliance_type, annotation=None):
+    """Form an evaluation as a dictionary. Usually suited to report on configuration change rules.
+
+    Keyword arguments:
+    configuration_item -- the configurationItem dictionary in the invokingEvent
+    compliance_type -- either COMPLIANT, NON_COMPLIANT or NOT_APPLICABLE
+    annotation -- an annotation to be added to the evaluation (default None). It will be truncated to 255 if longer.
+    """
+    eval_ci = {}
+    if annotation:
+        eval_ci['Annotation'] = build_annotation(annotation)
+    eval_ci['ComplianceResourceType'] = configuration_item['resourceType']
+    eval_ci['ComplianceResourceId'] = configuration_item['resourceId']
+    eval_ci['ComplianceType'] = compliance_type
+    eval_ci['OrderingTimestamp'] = configuration_item['configurationItemCaptureTime']
+    return eval_ci
+
+# This removes older evaluation (usually useful for periodic rule not reporting on AWS::::Account).
+def clean_up_old_evaluations(config_client, latest_evaluations, event, resource_type):
+    """Return the latest evaluations preceded by a NOT_APPLICABLE evaluation for every resource
+    previously reported by the rule and missing from the latest evaluations.
+
+    Keyword arguments:
+    config_client -- the Config boto client
+    latest_evaluations -- the list of evaluations returned by the rule
+    event -- the event variable given in the lambda handler
+    resource_type -- the resource type of the previous results which do not give one, usually the DEFAULT_RESOURCE_TYPE of the rule
+    """
+    latest_index = set(get_evaluation_key(latest_eval) for latest_eval in latest_evaluations)
+    cleaned_evaluations = list(build_stale_evaluations(config_client, latest_index, event, resource_type))
+    return cleaned_evaluations + latest_evaluations
+
+def build_stale_evaluations(config_client, reported_keys, event, resource_type):
+    """Yield a NOT_APPLICABLE evaluation for every resource previously reported by the rule and missing from reported_keys.
+
+    Keyword arguments:
+    config_client -- the Config boto client
+    reported_keys -- the set of (ComplianceResourceType, ComplianceResourceId) of the latest evaluations. It is updated with the stale resources.
+    event -- the event variable given in the lambda handler
+    resource_type -- the resource type of the previous results which do not give one, usually the DEFAULT_RESOURCE_TYPE of the rule
+    """
+    for old_result in iter_old_results(config_client, event):
+        qualifier = old_result['EvaluationResultIdentifier']['EvaluationResultQualifier']
+        key = (qualifier.get('ResourceType', resource_type), qualifier['ResourceId'])
+        if key not in reported_keys:
+            # Also protects against a resource reported twice by the previous results.
+            reported_keys.add(key)
+            yield build_evaluation(key[1], "NOT_APPLICABLE", event, key[0])
+
+def get_evaluation_key(evaluation):
+    return (evaluation['ComplianceResourceType'], evaluation['ComplianceResourceId'])
+
+# Yield the COMPLIANT and NON_COMPLIANT results of the rule, one page of the API at a time.
+def iter_old_results(config_client, event):
+    kwargs = {
+        'ConfigRuleName': event['configRuleName'],
+        'ComplianceTypes': ['COMPLIANT', 'NON_COMPLIANT'],
+        'Limit': 100
+    }
+    while True:
+        old_eval = config_client.get_compliance_details_by_config_rule(**kwargs)
+        for old_result in old_eval['EvaluationResults']:
+            yield old_result
+        if 'NextToken' not in old_eval:
+            break
+        kwargs['NextToken'] = old_eval['NextToken']
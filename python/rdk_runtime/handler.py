@@ -0,0 +1,350 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+The RDK boilerplate: it decodes the event given by AWS Config, calls the rule and reports the
+evaluations with PutEvaluations.
+
+The rule is the Python module of the Lambda function. It must define:
+  evaluate_parameters(rule_parameters)
+  evaluate_compliance(event, configuration_item, valid_rule_parameters)
+  get_client(service, event)
+  DEFAULT_RESOURCE_TYPE
+
+evaluate_compliance() may also be a generator of evaluations: they are then reported by batches
+while the rule produces them, instead of once the rule returned all of them.
+
+The rule may also define DELTA_REPORTING_MODE and DELTA_REPORTING_FULL_REFRESH_DAYS, see delta.py,
+and CHECKPOINT_MODE, CHECKPOINT_MARGIN_SECONDS and CHECKPOINT_STORE, see checkpoint.py.
+
+When the rule returns no evaluation, a NOT_APPLICABLE evaluation of the account is reported as a feedback
+that the evaluation took place. The rule may report it on another resource type with EMPTY_RESULT_RESOURCE_TYPE.
+
+The API calls made during the invocation are logged as a CloudWatch EMF record, see metrics.py.
+'''
+import sys
+import json
+import types
+import datetime
+import botocore.exceptions
+
+from rdk_runtime.evaluations import (build_evaluation, build_evaluation_from_config_item, clean_up_old_evaluations,
+                                     build_stale_evaluations, get_evaluation_key)
+from rdk_runtime.submission import put_evaluations, EvaluationSubmitter
+from rdk_runtime.delta import is_delta_reporting, get_full_refresh_days, select_changed_evaluations, PreviousResults
+from rdk_runtime.checkpoint import open_checkpoint
+from rdk_runtime.metrics import reset_api_metrics, print_api_metrics
+
+try:
+    import liblogging
+except ImportError:
+    pass
+
+# Resource type of the NOT_APPLICABLE evaluation reported when the rule returns no evaluation.
+EMPTY_RESULT_RESOURCE_TYPE = 'AWS::::Account'
+
+# Build an error to be displayed in the logs when the parameter is invalid.
+def build_parameters_value_error_response(ex):
+    """Return an error dictionary when the evaluate_parameters() raises a ValueError.
+
+    Keyword arguments:
+    ex -- Exception text
+    """
+    return  build_error_response(internal_error_message="Parameter value is invalid",
+                                 internal_error_details="An ValueError was raised during the validation of the Parameter value",
+                                 customer_error_code="InvalidParameterValueException",
+                                 customer_error_message=str(ex))
+
+# Helper function used to validate input
+def check_defined(reference, reference_name):
+    if not reference:
+        raise Exception('Error: ', reference_name, 'is not defined')
+    return reference
+
+# Check whether the message is OversizedConfigurationItemChangeNotification or not
+def is_oversized_changed_notification(message_type):
+    check_defined(message_type, 'messageType')
+    return message_type == 'OversizedConfigurationItemChangeNotification'
+
+# Check whether the message is a ScheduledNotification or not.
+def is_scheduled_notification(message_type):
+    check_defined(message_type, 'messageType')
+    return message_type == 'ScheduledNotification'
+
+# Get configurationItem using getResourceConfigHistory API
+# in case of OversizedConfigurationItemChangeNotification
+def get_configuration(config_client, resource_type, resource_id, configuration_capture_time):
+    result = config_client.get_resource_config_history(
+        resourceType=resource_type,
+        resourceId=resource_id,
+        laterTime=configuration_capture_time,
+        limit=1)
+    configuration_item = result['configurationItems'][0]
+    return convert_api_configuration(configuration_item)
+
+# Convert from the API model to the original invocation model
+def convert_api_configuration(configuration_item):
+    for k, v in configuration_item.items():
+        if isinstance(v, datetime.datetime):
+            configuration_item[k] = str(v)
+    configuration_item['awsAccountId'] = configuration_item['accountId']
+    configuration_item['ARN'] = configuration_item['arn']
+    configuration_item['configurationStateMd5Hash'] = configuration_item['configurationItemMD5Hash']
+    configuration_item['configurationItemVersion'] = configuration_item['version']
+    configuration_item['configuration'] = json.loads(configuration_item['configuration'])
+    if 'relationships' in configuration_item:
+        for i in range(len(configuration_item['relationships'])):
+            configuration_item['relationships'][i]['name'] = configuration_item['relationships'][i]['relationshipName']
+    return configuration_item
+
+# Based on the type of message get the configuration item
+# either from configurationItem in the invoking event
+# or using the getResourceConfigHistiry API in getConfiguration function.
+def get_configuration_item(config_client, invoking_event):
+    check_defined(invoking_event, 'invokingEvent')
+    if is_oversized_changed_notification(invoking_event['messageType']):
+        configuration_item_summary = check_defined(invoking_event['configurationItemSummary'], 'configurationItemSummary')
+        return get_configuration(config_client, configuration_item_summary['resourceType'], configuration_item_summary['resourceId'], configuration_item_summary['configurationItemCaptureTime'])
+    if is_scheduled_notification(invoking_event['messageType']):
+        return None
+    return check_defined(invoking_event['configurationItem'], 'configurationItem')
+
+# Check whether the resource has been deleted. If it has, then the evaluation is unnecessary.
+def is_applicable(configuration_item, event):
+    try:
+        check_defined(configuration_item, 'configurationItem')
+        check_defined(event, 'event')
+    except:
+        return True
+    status = configuration_item['configurationItemStatus']
+    event_left_scope = event['eventLeftScope']
+    if status == 'ResourceDeleted':
+        print("Resource Deleted, setting Compliance Status to NOT_APPLICABLE.")
+    return status in ('OK', 'ResourceDiscovered') and not event_left_scope
+
+def get_empty_result_resource_type(rule):
+    return getattr(rule, 'EMPTY_RESULT_RESOURCE_TYPE', EMPTY_RESULT_RESOURCE_TYPE)
+
+def has_required_fields(evaluation):
+    missing_fields = False
+    for field in ('ComplianceResourceType', 'ComplianceResourceId', 'ComplianceType', 'OrderingTimestamp'):
+        if field not in evaluation:
+            print("Missing " + field + " from custom evaluation.")
+            missing_fields = True
+    return not missing_fields
+
+# This decorates the lambda_handler in rule_code with the actual PutEvaluation call
+def lambda_handler(event, context, rule):
+    """Evaluate the rule on the event given to its Lambda function and report the evaluations to Config.
+
+    Keyword arguments:
+    event -- the event variable given in the lambda handler
+    context -- the context variable given in the lambda handler
+    rule -- the module of the rule
+    """
+    reset_api_metrics()
+    try:
+        return handle_event(event, context, rule)
+    finally:
+        # Also when the rule failed: the calls made until then are the ones to look at.
+        print_api_metrics(event or {})
+
+def handle_event(event, context, rule):
+    if 'liblogging' in sys.modules:
+        liblogging.logEvent(event)
+
+    check_defined(event, 'event')
+    invoking_event = json.loads(event['invokingEvent'])
+    rule_parameters = {}
+    if 'ruleParameters' in event:
+        rule_parameters = json.loads(event['ruleParameters'])
+
+    try:
+        valid_rule_parameters = rule.evaluate_parameters(rule_parameters)
+    except ValueError as ex:
+        return build_parameters_value_error_response(ex)
+
+    try:
+        config_client = rule.get_client('config', event)
+        if invoking_event['messageType'] in ['ConfigurationItemChangeNotification', 'ScheduledNotification', 'OversizedConfigurationItemChangeNotification']:
+            configuration_item = get_configuration_item(config_client, invoking_event)
+            if is_applicable(configuration_item, event):
+                checkpoint = open_checkpoint(rule, event, context)
+                compliance_result = rule.evaluate_compliance(event, configuration_item, valid_rule_parameters)
+                if isinstance(compliance_result, types.GeneratorType):
+                    previous_results = None
+                    if is_delta_reporting(rule):
+                        previous_results = PreviousResults(config_client, event, rule.DEFAULT_RESOURCE_TYPE, get_full_refresh_days(rule))
+                    # The rule calls the APIs while it is consumed, hence within this try.
+                    return stream_evaluations(config_client, compliance_result, event, rule.DEFAULT_RESOURCE_TYPE, previous_results, checkpoint,
+                                              get_empty_result_resource_type(rule))
+            else:
+                compliance_result = "NOT_APPLICABLE"
+        else:
+            return build_internal_error_response('Unexpected message type', str(invoking_event))
+    except botocore.exceptions.ClientError as ex:
+        if is_internal_error(ex):
+            return build_internal_error_response("Unexpected error while completing API request", str(ex))
+        return build_error_response("Customer error while making API request", str(ex), ex.response['Error']['Code'], ex.response['Error']['Message'])
+    except ValueError as ex:
+        return build_internal_error_response(str(ex), str(ex))
+
+    evaluations = []
+    latest_evaluations = []
+
+    if not compliance_result:
+        latest_evaluations.append(build_evaluation(event['accountId'], "NOT_APPLICABLE", event, resource_type=get_empty_result_resource_type(rule)))
+        evaluations = clean_up(config_client, latest_evaluations, event, rule)
+    elif isinstance(compliance_result, str):
+        if configuration_item:
+            evaluations.append(build_evaluation_from_config_item(configuration_item, compliance_result))
+        else:
+            evaluations.append(build_evaluation(event['accountId'], compliance_result, event, resource_type=rule.DEFAULT_RESOURCE_TYPE))
+    elif isinstance(compliance_result, list):
+        for evaluation in compliance_result:
+            if has_required_fields(evaluation):
+                latest_evaluations.append(evaluation)
+        evaluations = clean_up(config_client, latest_evaluations, event, rule)
+    elif isinstance(compliance_result, dict):
+        if has_required_fields(compliance_result):
+            evaluations.append(compliance_result)
+    else:
+        evaluations.append(build_evaluation_from_config_item(configuration_item, 'NOT_APPLICABLE'))
+
+    put_evaluations(config_client, evaluations, event['resultToken'])
+
+    # Used solely for RDK test to be able to test Lambda function
+    return evaluations
+
+# Add the NOT_APPLICABLE evaluations of the resources no longer reported, and keep only the changes in delta reporting mode.
+def clean_up(config_client, latest_evaluations, event, rule):
+    if is_delta_reporting(rule):
+        return select_changed_evaluations(config_client, latest_evaluations, event, rule.DEFAULT_RESOURCE_TYPE, get_full_refresh_days(rule))
+    return clean_up_old_evaluations(config_client, latest_evaluations, event, rule.DEFAULT_RESOURCE_TYPE)
+
+# Report the evaluations yielded by a generator evaluate_compliance() as they come, then clean up the old ones.
+def stream_evaluations(config_client, evaluations, event, resource_type, previous_results=None, checkpoint=None,
+                       empty_result_resource_type=EMPTY_RESULT_RESOURCE_TYPE):
+    """Send the evaluations by batches of 100 while the rule yields them, then the NOT_APPLICABLE evaluations
+    of the resources previously reported and not yielded this time.
+
+    With a checkpoint, the evaluation stops when the Lambda function is about to time out: the evaluations yielded
+    so far are sent and the cursor is saved, the clean-up being left to the invocation which completes the run.
+
+    The evaluations sent are only kept, and returned, when the resultToken is TESTMODE (e.g. in the RDK tests),
+    so that the memory used does not grow with the number of resources of the account. Otherwise, the number of
+    evaluations sent is returned.
+
+    Keyword arguments:
+    config_client -- the Config boto client
+    evaluations -- the generator returned by evaluate_compliance()
+    event -- the event variable given in the lambda handler
+    resource_type -- the DEFAULT_RESOURCE_TYPE of the rule
+    previous_results -- the PreviousResults of the rule in delta reporting mode, None otherwise (default None)
+    checkpoint -- the Checkpoint of the rule in checkpoint mode, None otherwise (default None)
+    empty_result_resource_type -- the resource type of the NOT_APPLICABLE evaluation sent when the rule yields none (default 'AWS::::Account')
+    """
+    reported_keys = set()
+    already_processed = set()
+    if checkpoint is not None:
+        # The resources evaluated by the previous invocations of the run are not reported again, nor cleaned up.
+        already_processed = checkpoint.cursor.processed
+        reported_keys.update(already_processed)
+    interrupted = False
+    summary = StreamSummary(event['resultToken'] == 'TESTMODE')
+
+    with EvaluationSubmitter(config_client, event['resultToken']) as submitter:
+        for evaluation in evaluations:
+            if not has_required_fields(evaluation):
+                continue
+            key = get_evaluation_key(evaluation)
+            if key in already_processed:
+                continue
+            reported_keys.add(key)
+            if previous_results is None or previous_results.has_changed(evaluation):
+                submitter.add(evaluation)
+                summary.add_sent(evaluation)
+            if checkpoint is not None and checkpoint.is_due():
+                interrupted = True
+                break
+
+        if interrupted:
+            evaluations.close()
+            submitter.close()
+            checkpoint.save(reported_keys)
+            return summary.get_result()
+
+        if not reported_keys:
+            # Feedback that the evaluation took place properly, like for an empty list.
+            shadow_evaluation = build_evaluation(event['accountId'], "NOT_APPLICABLE", event, resource_type=empty_result_resource_type)
+            reported_keys.add(get_evaluation_key(shadow_evaluation))
+            submitter.add(shadow_evaluation)
+            summary.add_sent(shadow_evaluation)
+
+        if previous_results is not None:
+            previous_results.print_summary()
+            stale_source = previous_results.build_stale_evaluations(reported_keys, event)
+        else:
+            stale_source = build_stale_evaluations(config_client, reported_keys, event, resource_type)
+        for evaluation in stale_source:
+            submitter.add(evaluation)
+            summary.add_stale(evaluation)
+
+        submitter.close()
+
+    if checkpoint is not None:
+        checkpoint.complete()
+
+    return summary.get_result()
+
+class StreamSummary:
+    """What stream_evaluations() returns: the evaluations sent in test mode, their number otherwise."""
+
+    def __init__(self, keep_evaluations):
+        self.keep_evaluations = keep_evaluations
+        self.sent_count = 0
+        self.stale_count = 0
+        # Used solely for RDK test to be able to test Lambda function. Only the evaluations are kept,
+        # not the resources described by the rule to build them.
+        self.sent_evaluations = []
+        self.stale_evaluations = []
+
+    def add_sent(self, evaluation):
+        self.sent_count += 1
+        if self.keep_evaluations:
+            self.sent_evaluations.append(evaluation)
+
+    def add_stale(self, evaluation):
+        self.stale_count += 1
+        if self.keep_evaluations:
+            self.stale_evaluations.append(evaluation)
+
+    def get_result(self):
+        if self.keep_evaluations:
+            # In the same order as clean_up_old_evaluations()
+            return self.stale_evaluations + self.sent_evaluations
+        return {'evaluationsSent': self.sent_count, 'staleEvaluationsSent': self.stale_count}
+
+def is_internal_error(exception):
+    return ((not isinstance(exception, botocore.exceptions.ClientError)) or exception.response['Error']['Code'].startswith('5')
+            or 'InternalError' in exception.response['Error']['Code'] or 'ServiceError' in exception.response['Error']['Code'])
+
+def build_internal_error_response(internal_error_message, internal_error_details=None):
+    return build_error_response(internal_error_message, internal_error_details, 'InternalError', 'InternalError')
+
+def build_error_response(internal_error_message, internal_error_details=None, customer_error_code=None, customer_error_message=None):
+    error_response = {
+        'internalErrorMessage': internal_error_message,
+        'internalErrorDetails': internal_error_details,
+        'customerErrorMessage': customer_error_message,
+        'customerErrorCode': customer_error_code
+    }
+    print(error_response)
+    return error_response
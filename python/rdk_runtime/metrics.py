@@ -0,0 +1,239 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Accounting of the AWS API calls made by the rules.
+
+Every client returned by get_client() is instrumented through the botocore event system. The calls are
+counted by service and operation: number of calls, follow-up pages of a paginated listing, retries, throttled
+attempts, errors, bytes sent and received, and a latency histogram. The latency of a call includes its retries.
+
+The counters cover one invocation: the handler resets them, then prints them as a single CloudWatch Embedded
+Metric Format (EMF) record once the evaluations are reported. The record holds the totals of the invocation as
+metrics, with the rule name as dimension, and the counters of each operation as properties, e.g. to rank the
+rules and their most expensive operations with CloudWatch Logs Insights.
+'''
+import json
+import time
+import threading
+
+##############
+# Parameters #
+##############
+
+# CloudWatch namespace of the metrics of the EMF record.
+METRICS_NAMESPACE = 'RDK/ConfigRules'
+
+# Upper bounds of the buckets of the latency histogram, in milliseconds. The last bucket is unbounded.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Request parameters continuing a paginated listing: a call carrying one of them is a follow-up page.
+PAGINATION_PARAMETERS = ('NextToken', 'nextToken', 'Marker', 'marker', 'position', 'ContinuationToken', 'PaginationToken', 'NextPageToken')
+
+THROTTLING_ERROR_CODES = ('ThrottlingException', 'Throttling', 'TooManyRequestsException', 'RequestLimitExceeded',
+                          'RequestThrottled', 'RequestThrottledException', 'SlowDown', 'ProvisionedThroughputExceededException')
+
+#############
+# Main Code #
+#############
+
+class ApiCallMetrics():
+    """Counters of the API calls, by (service, operation). The calls may come from several threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+
+    def get_counters(self, service, operation):
+        # To be called with the lock held.
+        key = (service, operation)
+        if key not in self.operations:
+            self.operations[key] = {
+                'calls': 0,
+                'pages': 0,
+                'retries': 0,
+                'throttles': 0,
+                'errors': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                'latency_ms': 0,
+                'latency_histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            }
+        return self.operations[key]
+
+    def record_call(self, service, operation, latency_ms, is_page=False, retries=0, bytes_sent=0, bytes_received=0, is_error=False):
+        with self.lock:
+            counters = self.get_counters(service, operation)
+            counters['calls'] += 1
+            counters['pages'] += int(is_page)
+            counters['retries'] += retries
+            counters['errors'] += int(is_error)
+            counters['bytes_sent'] += bytes_sent
+            counters['bytes_received'] += bytes_received
+            counters['latency_ms'] += latency_ms
+            counters['latency_histogram'][get_latency_bucket(latency_ms)] += 1
+
+    def record_throttle(self, service, operation):
+        with self.lock:
+            self.get_counters(service, operation)['throttles'] += 1
+
+    def get_totals(self):
+        totals = {'calls': 0, 'pages': 0, 'retries': 0, 'throttles': 0, 'errors': 0, 'bytes_sent': 0, 'bytes_received': 0, 'latency_ms': 0}
+        with self.lock:
+            for counters in self.operations.values():
+                for name in totals:
+                    totals[name] += counters[name]
+        return totals
+
+    def build_emf_record(self, rule_name, timestamp=None):
+        """Return the CloudWatch EMF record of the counters.
+
+        Keyword arguments:
+        rule_name -- the name of the Config rule, used as dimension of the metrics
+        timestamp -- the time of the record, in seconds since the epoch (default: now)
+        """
+        totals = self.get_totals()
+        with self.lock:
+            operations = {}
+            for (service, operation), counters in sorted(self.operations.items()):
+                operation_counters = dict(counters)
+                operation_counters['latency_histogram'] = build_histogram(counters['latency_histogram'])
+                operations[service + '.' + operation] = operation_counters
+        return {
+            '_aws': {
+                'Timestamp': int((timestamp or time.time()) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['RuleName']],
+                    'Metrics': [
+                        {'Name': 'ApiCalls', 'Unit': 'Count'},
+                        {'Name': 'ApiPages', 'Unit': 'Count'},
+                        {'Name': 'ApiRetries', 'Unit': 'Count'},
+                        {'Name': 'ApiThrottles', 'Unit': 'Count'},
+                        {'Name': 'ApiErrors', 'Unit': 'Count'},
+                        {'Name': 'ApiBytes', 'Unit': 'Bytes'},
+                        {'Name': 'ApiLatency', 'Unit': 'Milliseconds'}
+                    ]
+                }]
+            },
+            'RuleName': rule_name,
+            'ApiCalls': totals['calls'],
+            'ApiPages': totals['pages'],
+            'ApiRetries': totals['retries'],
+            'ApiThrottles': totals['throttles'],
+            'ApiErrors': totals['errors'],
+            'ApiBytes': totals['bytes_sent'] + totals['bytes_received'],
+            'ApiLatency': totals['latency_ms'],
+            'Operations': operations
+        }
+
+# The counters of the invocation being handled. A Lambda container handles one invocation at a time.
+API_CALL_METRICS = ApiCallMetrics()
+
+def reset_api_metrics():
+    API_CALL_METRICS.reset()
+
+# Print the EMF record of the invocation: CloudWatch Logs extracts its metrics.
+def print_api_metrics(event):
+    print(json.dumps(API_CALL_METRICS.build_emf_record(event.get('configRuleName'))))
+
+def instrument_client(client, metrics=API_CALL_METRICS):
+    """Register the handlers counting the calls of the client in metrics.
+
+    Keyword arguments:
+    client -- the boto client
+    metrics -- the ApiCallMetrics where the calls are counted (default API_CALL_METRICS)
+    """
+    service = client.meta.service_model.service_name
+    events = client.meta.events
+
+    # Emitted with the parameters given to the client method.
+    def before_parameter_build(params, model, context, **kwargs):
+        context['rdk_metrics'] = {
+            'start': time.time(),
+            'operation': model.name,
+            'is_page': any(params.get(name) for name in PAGINATION_PARAMETERS),
+            'bytes_sent': 0
+        }
+
+    # Emitted with the serialized request.
+    def before_call(params, context, **kwargs):
+        call = context.get('rdk_metrics')
+        if call:
+            call['bytes_sent'] = get_body_size(params.get('body'))
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        call = context.get('rdk_metrics')
+        if not call:
+            return
+        metadata = parsed.get('ResponseMetadata', {}) if isinstance(parsed, dict) else {}
+        metrics.record_call(service, call['operation'], get_elapsed_ms(call['start']), is_page=call['is_page'],
+                            retries=metadata.get('RetryAttempts', 0), bytes_sent=call['bytes_sent'],
+                            bytes_received=get_body_size(getattr(http_response, 'content', None)),
+                            is_error='Error' in parsed if isinstance(parsed, dict) else False)
+
+    def after_call_error(exception, context, **kwargs):
+        call = context.get('rdk_metrics')
+        if not call:
+            return
+        metrics.record_call(service, call['operation'], get_elapsed_ms(call['start']), is_page=call['is_page'],
+                            bytes_sent=call['bytes_sent'], is_error=True)
+
+    # Emitted after every attempt, before botocore decides whether to retry it.
+    def needs_retry(response, operation, **kwargs):
+        if response is None:
+            return None
+        parsed = response[1]
+        if isinstance(parsed, dict) and parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            metrics.record_throttle(service, operation.name)
+        return None
+
+    events.register('before-parameter-build', before_parameter_build, unique_id='rdk-metrics-before-parameter-build')
+    events.register('before-call', before_call, unique_id='rdk-metrics-before-call')
+    events.register('after-call', after_call, unique_id='rdk-metrics-after-call')
+    events.register('after-call-error', after_call_error, unique_id='rdk-metrics-after-call-error')
+    events.register('needs-retry', needs_retry, unique_id='rdk-metrics-needs-retry')
+    return client
+
+####################
+# Helper Functions #
+####################
+
+def get_latency_bucket(latency_ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+def build_histogram(counts):
+    histogram = {}
+    for i, count in enumerate(counts):
+        if i < len(LATENCY_BUCKETS_MS):
+            histogram['le_' + str(LATENCY_BUCKETS_MS[i])] = count
+        else:
+            histogram['gt_' + str(LATENCY_BUCKETS_MS[-1])] = count
+    return histogram
+
+def get_elapsed_ms(start):
+    return int((time.time() - start) * 1000)
+
+def get_body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    if isinstance(body, dict):
+        # Query protocol: the parameters are form-encoded later on.
+        return len(json.dumps(body))
+    return 0
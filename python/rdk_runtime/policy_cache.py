@@ -0,0 +1,174 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Cache of the managed policy documents shared by the rules.
+
+The same managed policies (e.g. AdministratorAccess) are attached to many users, groups and roles: a rule
+evaluating them one by one would call GetPolicy and GetPolicyVersion for each attachment. The documents are
+kept at module level, keyed by (PolicyArn, DefaultVersionId), for the whole run and the next invocations of a
+warm Lambda container:
+
+* a policy version is immutable, so its document is kept until it is evicted, the least recently used first,
+  when the cache holds MAX_DOCUMENTS documents;
+* the default version of a policy can change, so the DefaultVersionId returned by GetPolicy is only trusted
+  for DEFAULT_VERSION_TTL_SECONDS.
+
+When several threads need the same document, only one of them calls IAM, the others wait for its result.
+'''
+import time
+import threading
+import collections
+import concurrent.futures
+
+##############
+# Parameters #
+##############
+
+# Maximum number of documents kept.
+MAX_DOCUMENTS = 1000
+
+# Time during which the default version of a policy is not asked to IAM again.
+DEFAULT_VERSION_TTL_SECONDS = 300
+
+#############
+# Main Code #
+#############
+
+class PolicyDocumentCache():
+    """Bounded cache of the managed policy documents, keyed by (PolicyArn, DefaultVersionId).
+
+    Keyword arguments:
+    max_documents -- the maximum number of documents kept (default MAX_DOCUMENTS)
+    default_version_ttl_seconds -- the time during which the default version of a policy is trusted (default DEFAULT_VERSION_TTL_SECONDS)
+    """
+
+    def __init__(self, max_documents=MAX_DOCUMENTS, default_version_ttl_seconds=DEFAULT_VERSION_TTL_SECONDS):
+        self.max_documents = max_documents
+        self.default_version_ttl_seconds = default_version_ttl_seconds
+        self.lock = threading.Lock()
+        # (policy ARN, version id) -> document, the least recently used first
+        self.documents = collections.OrderedDict()
+        # policy ARN -> (default version id, expiration time)
+        self.default_versions = {}
+        # key -> Future of the call in progress
+        self.in_flight = {}
+        self.counters = collections.Counter()
+
+    def get_document(self, iam_client, policy_arn, default_version_id=None):
+        """Return the document of the default version of a managed policy.
+
+        Keyword arguments:
+        iam_client -- the IAM boto client
+        policy_arn -- the ARN of the policy
+        default_version_id -- the default version of the policy, if already known, e.g. from a configuration item (default None)
+        """
+        if default_version_id is None:
+            default_version_id = self.get_default_version_id(iam_client, policy_arn)
+        key = (policy_arn, default_version_id)
+        return self.load(('document',) + key, lambda: self.lookup_document(key),
+                         lambda: iam_client.get_policy_version(PolicyArn=policy_arn, VersionId=default_version_id)['PolicyVersion']['Document'],
+                         lambda document: self.store_document(key, document))
+
+    def get_default_version_id(self, iam_client, policy_arn):
+        return self.load(('default_version', policy_arn), lambda: self.lookup_default_version_id(policy_arn),
+                         lambda: iam_client.get_policy(PolicyArn=policy_arn)['Policy']['DefaultVersionId'],
+                         lambda default_version_id: self.store_default_version_id(policy_arn, default_version_id))
+
+    # Return the cached value, or call IAM once for all the threads asking for it at the same time.
+    def load(self, key, lookup, request, store):
+        with self.lock:
+            value = lookup()
+            if value is not None:
+                self.counters['hits'] += 1
+                return value
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                self.counters['misses'] += 1
+                future = concurrent.futures.Future()
+                self.in_flight[key] = future
+            else:
+                self.counters['shared'] += 1
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            value = request()
+        except Exception as ex:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(ex)
+            raise
+        with self.lock:
+            store(value)
+            del self.in_flight[key]
+        future.set_result(value)
+        return value
+
+    # The lookups and stores are called with the lock held.
+    def lookup_document(self, key):
+        document = self.documents.get(key)
+        if document is not None:
+            self.documents.move_to_end(key)
+        return document
+
+    def store_document(self, key, document):
+        self.documents[key] = document
+        self.documents.move_to_end(key)
+        while len(self.documents) > self.max_documents:
+            self.documents.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def lookup_default_version_id(self, policy_arn):
+        default_version_id, expiration = self.default_versions.get(policy_arn, (None, 0))
+        if expiration <= time.time():
+            return None
+        return default_version_id
+
+    def store_default_version_id(self, policy_arn, default_version_id):
+        self.default_versions[policy_arn] = (default_version_id, time.time() + self.default_version_ttl_seconds)
+
+    def peek_document(self, policy_arn):
+        """Return the cached document of the default version of a policy, or None when its default version or document is not cached."""
+        with self.lock:
+            default_version_id = self.lookup_default_version_id(policy_arn)
+            document = self.lookup_document((policy_arn, default_version_id)) if default_version_id else None
+            if document is not None:
+                self.counters['hits'] += 1
+            return document
+
+    def put_document(self, policy_arn, default_version_id, document):
+        """Cache the document of the default version of a policy got from elsewhere than IAM, e.g. from its configuration item."""
+        with self.lock:
+            self.store_default_version_id(policy_arn, default_version_id)
+            self.store_document((policy_arn, default_version_id), document)
+
+    def get_counters(self):
+        """Return the hits, misses (calls to IAM), calls shared with another thread and evictions, since the cache was built or cleared."""
+        with self.lock:
+            return {name: self.counters[name] for name in ('hits', 'misses', 'shared', 'evictions')}
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.default_versions.clear()
+            self.counters.clear()
+
+POLICY_DOCUMENT_CACHE = PolicyDocumentCache()
+
+def get_managed_policy_document(iam_client, policy_arn, default_version_id=None):
+    """Return the document of the default version of a managed policy, from the cache shared by the rules, see PolicyDocumentCache.get_document()."""
+    return POLICY_DOCUMENT_CACHE.get_document(iam_client, policy_arn, default_version_id)
+
+def clear_policy_document_cache():
+    """Forget the cached documents and reset the counters, e.g. between two tests."""
+    POLICY_DOCUMENT_CACHE.clear()
@@ -0,0 +1,200 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Compiled IAM policy documents, and memoization of the checks of the rules on them.
+
+A policy document is compiled once: its statements are normalized (Statement, Action, NotAction, Resource,
+NotResource and the values of each Condition are always lists, kept as tuples), the action strings are interned
+and the wildcard patterns are compiled into regular expressions. The compiled policies are kept by content hash,
+so the same inline policy stamped onto thousands of roles, or a managed policy attached to all of them, is
+compiled once.
+
+The check of a rule is a function of the CompiledPolicy (and of hashable arguments, e.g. the parameters of the
+rule), whose result is memoized by the policy:
+
+    rdk_runtime.compile_policy(policy_document).evaluate(is_full_star_allowed)
+
+so that it runs once per distinct document.
+'''
+import re
+import sys
+import json
+import hashlib
+import functools
+import threading
+import collections
+
+##############
+# Parameters #
+##############
+
+# Maximum number of compiled policies kept, the least recently used being forgotten first.
+MAX_POLICIES = 10000
+
+# Maximum number of compiled wildcard patterns kept.
+MAX_PATTERNS = 4096
+
+#############
+# Main Code #
+#############
+
+class CompiledStatement():
+    """A normalized statement of a policy.
+
+    Keyword arguments:
+    statement -- the statement, as found in the document
+    """
+
+    def __init__(self, statement):
+        self.sid = statement.get('Sid')
+        self.effect = statement.get('Effect')
+        self.actions = tuple(sys.intern(action) for action in as_list(statement.get('Action')))
+        self.not_actions = tuple(sys.intern(action) for action in as_list(statement.get('NotAction')))
+        self.resources = tuple(as_list(statement.get('Resource')))
+        self.not_resources = tuple(as_list(statement.get('NotResource')))
+        # operator -> condition key -> tuple of values
+        self.conditions = {operator: {key: tuple(as_list(values)) for key, values in condition.items()}
+                           for operator, condition in (statement.get('Condition') or {}).items()}
+
+    def is_allow(self):
+        return self.effect == 'Allow'
+
+    def matches_action(self, action):
+        """Return True if the statement applies to the action, e.g. 's3:GetObject', given its Action or NotAction."""
+        if self.not_actions:
+            return not matches_any(self.not_actions, action, ignore_case=True)
+        return matches_any(self.actions, action, ignore_case=True)
+
+    def matches_resource(self, resource):
+        """Return True if the statement applies to the resource ARN, given its Resource or NotResource."""
+        if self.not_resources:
+            return not matches_any(self.not_resources, resource)
+        return matches_any(self.resources, resource)
+
+    def get_condition_values(self, operator, key):
+        """Return the values of a condition key for an operator, e.g. ('IpAddress', 'aws:SourceIp'), or None when absent."""
+        return self.conditions.get(operator, {}).get(key)
+
+class CompiledPolicy():
+    """A compiled policy document, and the results of the checks already evaluated on it.
+
+    Keyword arguments:
+    document -- the policy document, as a dictionary
+    digest -- the content hash of the document
+    """
+
+    def __init__(self, document, digest):
+        self.digest = digest
+        self.version = document.get('Version')
+        self.statements = tuple(CompiledStatement(statement) for statement in as_list(document.get('Statement'))
+                                if isinstance(statement, dict))
+        # (check, arguments) -> result
+        self.results = {}
+
+    def evaluate(self, check, *args):
+        """Return check(policy, *args), computed only the first time for this document.
+
+        Keyword arguments:
+        check -- a function of the CompiledPolicy and of the args, without side effects
+        args -- hashable arguments of the check
+        """
+        key = (check, args)
+        try:
+            return self.results[key]
+        except KeyError:
+            pass
+        # Two threads may compute the same result, which is then stored twice.
+        result = check(self, *args)
+        self.results[key] = result
+        return result
+
+class PolicyCompiler():
+    """Bounded cache of the compiled policies, keyed by the content hash of the documents.
+
+    Keyword arguments:
+    max_policies -- the maximum number of compiled policies kept (default MAX_POLICIES)
+    """
+
+    def __init__(self, max_policies=MAX_POLICIES):
+        self.max_policies = max_policies
+        self.lock = threading.Lock()
+        self.policies = collections.OrderedDict()
+        self.counters = collections.Counter()
+
+    def compile(self, document):
+        if isinstance(document, str):
+            document = json.loads(document)
+        digest = get_digest(document)
+        with self.lock:
+            policy = self.policies.get(digest)
+            if policy is not None:
+                self.policies.move_to_end(digest)
+                self.counters['hits'] += 1
+                return policy
+        policy = CompiledPolicy(document, digest)
+        with self.lock:
+            # Another thread may have compiled the same document meanwhile: keep the first one, with its results.
+            policy = self.policies.setdefault(digest, policy)
+            self.policies.move_to_end(digest)
+            self.counters['misses'] += 1
+            while len(self.policies) > self.max_policies:
+                self.policies.popitem(last=False)
+                self.counters['evictions'] += 1
+        return policy
+
+    def get_counters(self):
+        """Return the hits, misses (compilations) and evictions, since the compiler was built or cleared."""
+        with self.lock:
+            return {name: self.counters[name] for name in ('hits', 'misses', 'evictions')}
+
+    def clear(self):
+        with self.lock:
+            self.policies.clear()
+            self.counters.clear()
+
+POLICY_COMPILER = PolicyCompiler()
+
+def compile_policy(document):
+    """Return the CompiledPolicy of a policy document, given as a dictionary or as JSON, compiled once per distinct content."""
+    return POLICY_COMPILER.compile(document)
+
+def clear_compiled_policies():
+    """Forget the compiled policies and their results, and reset the counters, e.g. between two tests."""
+    POLICY_COMPILER.clear()
+
+####################
+# Helper Functions #
+####################
+
+# The key order and the spacing of a document do not change its content hash.
+def get_digest(document):
+    return hashlib.sha256(json.dumps(document, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return value
+    return [value]
+
+def matches_any(patterns, value, ignore_case=False):
+    return any(get_wildcard_matcher(pattern, ignore_case)(value) for pattern in patterns)
+
+@functools.lru_cache(maxsize=MAX_PATTERNS)
+def get_wildcard_matcher(pattern, ignore_case=False):
+    """Return the function matching a string against an IAM pattern, where * matches any sequence of characters and ? any character."""
+    if '*' not in pattern and '?' not in pattern:
+        if ignore_case:
+            pattern = pattern.lower()
+            return lambda value: value.lower() == pattern
+        return lambda value: value == pattern
+    regex = ''.join('.*' if char == '*' else '.' if char == '?' else re.escape(char) for char in pattern)
+    return re.compile(regex + r'\Z', re.IGNORECASE | re.DOTALL if ignore_case else re.DOTALL).match
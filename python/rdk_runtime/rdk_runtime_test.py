@@ -0,0 +1,903 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import datetime
+import tempfile
+import threading
+import unittest
+import urllib.parse
+import concurrent.futures
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+config_client_mock = MagicMock()
+iam_client_mock = MagicMock()
+sts_client_mock = MagicMock()
+
+class Boto3Mock():
+    def client(self, client_name, *args, **kwargs):
+        if client_name == 'config':
+            return config_client_mock
+        if client_name == 'iam':
+            return iam_client_mock
+        if client_name == 'sts':
+            return sts_client_mock
+        raise Exception("Attempting to create an unknown client")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import rdk_runtime
+import rdk_runtime.clients
+import rdk_runtime.submission
+import rdk_runtime.checkpoint
+import rdk_runtime.handler
+import rdk_runtime.credential_report
+import rdk_runtime.policy_cache
+import rdk_runtime.policy_engine
+import botocore.session
+import botocore.stub
+import botocore.exceptions
+
+DEFAULT_RESOURCE_TYPE = 'AWS::IAM::User'
+
+class TestGetClient(unittest.TestCase):
+
+    def setUp(self):
+        sts_client_mock.reset_mock()
+        rdk_runtime.clear_client_cache()
+        boto3_patch = patch.object(rdk_runtime.clients, 'boto3', Boto3Mock())
+        boto3_patch.start()
+        self.addCleanup(boto3_patch.stop)
+
+    def test_credentials_shared_by_services(self):
+        sts_client_mock.assume_role = MagicMock(return_value=build_assume_role_response(datetime.timedelta(hours=1)))
+        rdk_runtime.get_client('config', build_event(), assume_role=True)
+        rdk_runtime.get_client('iam', build_event(), assume_role=True)
+        rdk_runtime.get_client('iam', build_event(), assume_role=True)
+        self.assertEqual(1, sts_client_mock.assume_role.call_count)
+
+    def test_credentials_cached_by_role(self):
+        sts_client_mock.assume_role = MagicMock(return_value=build_assume_role_response(datetime.timedelta(hours=1)))
+        rdk_runtime.get_client('iam', build_event(), assume_role=True)
+        rdk_runtime.get_client('iam', build_event(), assume_role=True, role_arn='arn:aws:iam::123456789012:role/other-role')
+        self.assertEqual(2, sts_client_mock.assume_role.call_count)
+
+    def test_credentials_renewed_before_expiration(self):
+        sts_client_mock.assume_role = MagicMock(side_effect=[
+            build_assume_role_response(datetime.timedelta(minutes=1)),
+            build_assume_role_response(datetime.timedelta(hours=1))])
+        rdk_runtime.get_client('config', build_event(), assume_role=True)
+        rdk_runtime.get_client('iam', build_event(), assume_role=True)
+        rdk_runtime.get_client('iam', build_event(), assume_role=True)
+        self.assertEqual(2, sts_client_mock.assume_role.call_count)
+
+    def test_assume_role_access_denied(self):
+        sts_client_mock.assume_role = MagicMock(side_effect=build_client_error('AccessDenied'))
+        with self.assertRaises(botocore.exceptions.ClientError) as context:
+            rdk_runtime.get_client('config', build_event(), assume_role=True)
+        self.assertEqual("AWS Config does not have permission to assume the IAM role.", context.exception.response['Error']['Message'])
+
+    def test_client_reused_by_service_and_region(self):
+        boto3_mock = MagicMock()
+        boto3_mock.client = MagicMock(side_effect=lambda *args, **kwargs: MagicMock())
+        with patch.object(rdk_runtime.clients, 'boto3', boto3_mock):
+            iam_client = rdk_runtime.get_client('iam', build_event())
+            self.assertIs(iam_client, rdk_runtime.get_client('iam', build_event()))
+            self.assertIsNot(iam_client, rdk_runtime.get_client('iam', build_event(), 'eu-west-1'))
+            self.assertIsNot(iam_client, rdk_runtime.get_client('config', build_event()))
+        self.assertEqual(3, boto3_mock.client.call_count)
+
+    def test_client_renewed_with_credentials(self):
+        sts_client_mock.assume_role = MagicMock(side_effect=[
+            build_assume_role_response(datetime.timedelta(minutes=1)),
+            build_assume_role_response(datetime.timedelta(hours=1))])
+        boto3_mock = MagicMock()
+        boto3_mock.client = MagicMock(side_effect=lambda service, *args, **kwargs: sts_client_mock if service == 'sts' else MagicMock())
+        with patch.object(rdk_runtime.clients, 'boto3', boto3_mock):
+            expiring_client = rdk_runtime.get_client('iam', build_event(), assume_role=True)
+            renewed_client = rdk_runtime.get_client('iam', build_event(), assume_role=True)
+            self.assertIsNot(expiring_client, renewed_client)
+            self.assertIs(renewed_client, rdk_runtime.get_client('iam', build_event(), assume_role=True))
+
+    def test_execution_role_name_parameter(self):
+        event = build_event()
+        self.assertEqual('arn:aws:iam::123456789012:role/config-role', rdk_runtime.get_execution_role_arn(event))
+        event['ruleParameters'] = json.dumps({'ExecutionRoleName': 'audit-role'})
+        self.assertEqual('arn:aws:iam::123456789012:role/audit-role', rdk_runtime.get_execution_role_arn(event))
+
+class TestLambdaHandler(unittest.TestCase):
+
+    def setUp(self):
+        config_client_mock.reset_mock()
+        config_client_mock.put_evaluations = MagicMock(return_value={'FailedEvaluations': []})
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': []})
+
+    def test_list_is_cleaned_up(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': [
+            build_old_result('user-1'), build_old_result('user-2')]})
+        rule = build_rule(lambda event, configuration_item, valid_rule_parameters: [build_evaluation('user-2', 'COMPLIANT')])
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual([('user-1', 'NOT_APPLICABLE'), ('user-2', 'COMPLIANT')],
+                         [(evaluation['ComplianceResourceId'], evaluation['ComplianceType']) for evaluation in response])
+        config_client_mock.put_evaluations.assert_called_once_with(Evaluations=response, ResultToken='TESTMODE', TestMode=True)
+
+    def test_empty_list_reported_on_account(self):
+        rule = build_rule(lambda event, configuration_item, valid_rule_parameters: [])
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual([('123456789012', 'AWS::::Account', 'NOT_APPLICABLE')],
+                         [(evaluation['ComplianceResourceId'], evaluation['ComplianceResourceType'], evaluation['ComplianceType'])
+                          for evaluation in response])
+
+    def test_empty_list_reported_on_rule_resource_type(self):
+        rule = build_rule(lambda event, configuration_item, valid_rule_parameters: [], EMPTY_RESULT_RESOURCE_TYPE='AWS::EKS::Cluster')
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual(1, len(response))
+        self.assertEqual('AWS::EKS::Cluster', response[0]['ComplianceResourceType'])
+
+    def test_scheduled_string_result(self):
+        rule = build_rule(lambda event, configuration_item, valid_rule_parameters: 'NON_COMPLIANT')
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual([('123456789012', DEFAULT_RESOURCE_TYPE, 'NON_COMPLIANT')],
+                         [(evaluation['ComplianceResourceId'], evaluation['ComplianceResourceType'], evaluation['ComplianceType'])
+                          for evaluation in response])
+
+    def test_deleted_resource_not_applicable(self):
+        event = build_event()
+        event['invokingEvent'] = json.dumps({
+            'messageType': 'ConfigurationItemChangeNotification',
+            'notificationCreationTime': '2020-01-01T00:00:00.000Z',
+            'configurationItem': {'configurationItemStatus': 'ResourceDeleted', 'resourceType': DEFAULT_RESOURCE_TYPE,
+                                  'resourceId': 'AIDAEXAMPLE0000000001', 'configurationItemCaptureTime': '2020-01-01T00:00:00.000Z'}})
+        evaluate_compliance = MagicMock()
+        response = rdk_runtime.lambda_handler(event, {}, build_rule(evaluate_compliance))
+        evaluate_compliance.assert_not_called()
+        self.assertEqual([('AIDAEXAMPLE0000000001', 'NOT_APPLICABLE')],
+                         [(evaluation['ComplianceResourceId'], evaluation['ComplianceType']) for evaluation in response])
+
+    def test_invalid_parameters(self):
+        rule = build_rule(MagicMock())
+        rule.evaluate_parameters = MagicMock(side_effect=ValueError('Invalid parameter'))
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual('InvalidParameterValueException', response['customerErrorCode'])
+        self.assertEqual('Invalid parameter', response['customerErrorMessage'])
+        config_client_mock.put_evaluations.assert_not_called()
+
+    def test_unexpected_message_type(self):
+        event = build_event()
+        event['invokingEvent'] = json.dumps({'messageType': 'ConfigurationSnapshotDeliveryCompleted'})
+        response = rdk_runtime.lambda_handler(event, {}, build_rule(MagicMock()))
+        self.assertEqual('InternalError', response['customerErrorCode'])
+        self.assertEqual('Unexpected message type', response['internalErrorMessage'])
+
+class TestCleanUpOldEvaluations(unittest.TestCase):
+
+    def setUp(self):
+        config_client_mock.reset_mock()
+
+    def test_no_old_result(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': []})
+        latest = [build_evaluation('user-1', 'COMPLIANT')]
+        response = rdk_runtime.clean_up_old_evaluations(config_client_mock, latest, build_event(), DEFAULT_RESOURCE_TYPE)
+        self.assertEqual(latest, response)
+
+    def test_old_results_are_paginated(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(side_effect=[
+            {'EvaluationResults': [build_old_result('user-1'), build_old_result('user-2')], 'NextToken': 'token-1'},
+            {'EvaluationResults': [build_old_result('user-3')]}])
+        latest = [build_evaluation('user-2', 'NON_COMPLIANT')]
+        response = rdk_runtime.clean_up_old_evaluations(config_client_mock, latest, build_event(), DEFAULT_RESOURCE_TYPE)
+        self.assertEqual(['user-1', 'user-3', 'user-2'], [evaluation['ComplianceResourceId'] for evaluation in response])
+        self.assertEqual(['NOT_APPLICABLE', 'NOT_APPLICABLE', 'NON_COMPLIANT'], [evaluation['ComplianceType'] for evaluation in response])
+        self.assertEqual(2, config_client_mock.get_compliance_details_by_config_rule.call_count)
+        config_client_mock.get_compliance_details_by_config_rule.assert_called_with(
+            ConfigRuleName='rule-name', ComplianceTypes=['COMPLIANT', 'NON_COMPLIANT'], Limit=100, NextToken='token-1')
+
+    def test_old_result_matched_on_resource_type(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': [
+            build_old_result('123456789012', 'AWS::::Account'),
+            build_old_result('user-1')]})
+        latest = [build_evaluation('123456789012', 'NOT_APPLICABLE', 'AWS::::Account')]
+        response = rdk_runtime.clean_up_old_evaluations(config_client_mock, latest, build_event(), DEFAULT_RESOURCE_TYPE)
+        self.assertEqual(2, len(response))
+        self.assertEqual('user-1', response[0]['ComplianceResourceId'])
+        self.assertEqual(DEFAULT_RESOURCE_TYPE, response[0]['ComplianceResourceType'])
+        self.assertEqual('NOT_APPLICABLE', response[0]['ComplianceType'])
+
+    def test_old_result_without_resource_type(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': [
+            {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ResourceId': 'user-1'}}},
+            {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ResourceId': 'user-2'}}}]})
+        latest = [build_evaluation('user-1', 'COMPLIANT')]
+        response = rdk_runtime.clean_up_old_evaluations(config_client_mock, latest, build_event(), DEFAULT_RESOURCE_TYPE)
+        self.assertEqual(2, len(response))
+        self.assertEqual('user-2', response[0]['ComplianceResourceId'])
+        self.assertEqual(DEFAULT_RESOURCE_TYPE, response[0]['ComplianceResourceType'])
+
+class TestPutEvaluations(unittest.TestCase):
+
+    def setUp(self):
+        config_client_mock.reset_mock()
+        rdk_runtime.submission.BACKOFF_BASE_SECONDS = 0.001
+
+    def test_no_evaluation(self):
+        config_client_mock.put_evaluations = MagicMock()
+        reports = rdk_runtime.put_evaluations(config_client_mock, [], 'TESTMODE')
+        self.assertEqual([], reports)
+        config_client_mock.put_evaluations.assert_not_called()
+
+    def test_batches_of_100(self):
+        config_client_mock.put_evaluations = MagicMock(return_value={'FailedEvaluations': []})
+        evaluations = [build_evaluation('user-' + str(i), 'COMPLIANT') for i in range(250)]
+        reports = rdk_runtime.put_evaluations(config_client_mock, evaluations, 'TESTMODE')
+        self.assertEqual([50, 100, 100], sorted(report['size'] for report in reports))
+        self.assertEqual(3, config_client_mock.put_evaluations.call_count)
+        sent = []
+        for call in config_client_mock.put_evaluations.call_args_list:
+            self.assertTrue(call[1]['TestMode'])
+            sent.extend(call[1]['Evaluations'])
+        self.assertEqual(sorted(e['ComplianceResourceId'] for e in evaluations), sorted(e['ComplianceResourceId'] for e in sent))
+
+    def test_failed_evaluations_are_sent_again(self):
+        evaluations = [build_evaluation('user-1', 'COMPLIANT'), build_evaluation('user-2', 'NON_COMPLIANT')]
+        config_client_mock.put_evaluations = MagicMock(side_effect=[{'FailedEvaluations': [evaluations[1]]}, {'FailedEvaluations': []}])
+        reports = rdk_runtime.put_evaluations(config_client_mock, evaluations, 'token')
+        self.assertEqual(2, len(reports))
+        config_client_mock.put_evaluations.assert_called_with(Evaluations=[evaluations[1]], ResultToken='token', TestMode=False)
+
+    def test_throttled_batch_is_retried(self):
+        evaluations = [build_evaluation('user-1', 'COMPLIANT')]
+        config_client_mock.put_evaluations = MagicMock(side_effect=[build_client_error('ThrottlingException'), {}])
+        reports = rdk_runtime.put_evaluations(config_client_mock, evaluations, 'TESTMODE')
+        self.assertEqual(1, reports[0]['throttled'])
+        self.assertEqual(2, config_client_mock.put_evaluations.call_count)
+
+    def test_other_error_is_raised(self):
+        evaluations = [build_evaluation('user-1', 'COMPLIANT')]
+        config_client_mock.put_evaluations = MagicMock(side_effect=build_client_error('InvalidResultTokenException'))
+        with self.assertRaises(botocore.exceptions.ClientError):
+            rdk_runtime.put_evaluations(config_client_mock, evaluations, 'token')
+        self.assertEqual(1, config_client_mock.put_evaluations.call_count)
+
+class TestStreamingEvaluations(unittest.TestCase):
+
+    def setUp(self):
+        config_client_mock.reset_mock()
+        config_client_mock.put_evaluations = MagicMock(return_value={'FailedEvaluations': []})
+
+    def test_evaluations_sent_while_yielded(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': []})
+        sent_before = []
+
+        def evaluate_compliance(event, configuration_item, valid_rule_parameters):
+            for i in range(250):
+                sent_before.append(config_client_mock.put_evaluations.call_count)
+                yield build_evaluation('user-' + str(i), 'COMPLIANT')
+
+        response = rdk_runtime.lambda_handler(build_event(), {}, build_rule(evaluate_compliance))
+        self.assertEqual(250, len(response))
+        self.assertEqual(3, config_client_mock.put_evaluations.call_count)
+        # The last evaluations are yielded once the first batch has been sent.
+        self.assertTrue(sent_before[-1] >= 1)
+
+    def test_stale_evaluations_after_yielded_ones(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': [
+            build_old_result('user-1'), build_old_result('user-2')]})
+
+        def evaluate_compliance(event, configuration_item, valid_rule_parameters):
+            yield build_evaluation('user-2', 'NON_COMPLIANT')
+
+        response = rdk_runtime.lambda_handler(build_event(), {}, build_rule(evaluate_compliance))
+        self.assertEqual([('user-1', 'NOT_APPLICABLE'), ('user-2', 'NON_COMPLIANT')],
+                         [(evaluation['ComplianceResourceId'], evaluation['ComplianceType']) for evaluation in response])
+
+    def test_evaluations_not_kept_outside_test_mode(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': [
+            build_old_result('user-1'), build_old_result('user-2')]})
+
+        def evaluate_compliance(event, configuration_item, valid_rule_parameters):
+            for i in range(2, 152):
+                yield build_evaluation('user-' + str(i), 'COMPLIANT')
+
+        event = build_event()
+        event['resultToken'] = 'token'
+        response = rdk_runtime.lambda_handler(event, {}, build_rule(evaluate_compliance))
+        self.assertEqual({'evaluationsSent': 150, 'staleEvaluationsSent': 1}, response)
+        self.assertEqual(151, sum(len(call[1]['Evaluations']) for call in config_client_mock.put_evaluations.call_args_list))
+
+    def test_empty_generator(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': []})
+
+        def evaluate_compliance(event, configuration_item, valid_rule_parameters):
+            return
+            yield
+
+        response = rdk_runtime.lambda_handler(build_event(), {}, build_rule(evaluate_compliance))
+        self.assertEqual(1, len(response))
+        self.assertEqual('AWS::::Account', response[0]['ComplianceResourceType'])
+        self.assertEqual('NOT_APPLICABLE', response[0]['ComplianceType'])
+
+    def test_api_error_while_yielding(self):
+        def evaluate_compliance(event, configuration_item, valid_rule_parameters):
+            yield build_evaluation('user-1', 'COMPLIANT')
+            raise build_client_error('AccessDenied')
+
+        response = rdk_runtime.lambda_handler(build_event(), {}, build_rule(evaluate_compliance))
+        self.assertEqual('AccessDenied', response['customerErrorCode'])
+
+class TestDeltaReporting(unittest.TestCase):
+
+    recent = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+    old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=30)
+
+    def setUp(self):
+        config_client_mock.reset_mock()
+        config_client_mock.put_evaluations = MagicMock(return_value={'FailedEvaluations': []})
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': [
+            build_old_result('user-1', compliance_type='COMPLIANT', recorded_time=self.recent),
+            build_old_result('user-2', compliance_type='COMPLIANT', recorded_time=self.recent),
+            build_old_result('user-3', compliance_type='NON_COMPLIANT', annotation='No MFA.', recorded_time=self.recent),
+            build_old_result('user-4', compliance_type='COMPLIANT', recorded_time=self.old),
+            build_old_result('user-5', compliance_type='COMPLIANT', recorded_time=self.recent)]})
+        self.latest = [
+            build_evaluation('user-1', 'COMPLIANT'),
+            build_evaluation('user-2', 'NON_COMPLIANT'),
+            rdk_runtime.build_evaluation('user-3', 'NON_COMPLIANT', build_event(), DEFAULT_RESOURCE_TYPE, 'No MFA device.'),
+            build_evaluation('user-4', 'COMPLIANT'),
+            build_evaluation('user-6', 'COMPLIANT')]
+
+    def test_list_only_changes_reported(self):
+        rule = build_rule(lambda event, configuration_item, valid_rule_parameters: self.latest, DELTA_REPORTING_MODE=True)
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual([('user-5', 'NOT_APPLICABLE'), ('user-2', 'NON_COMPLIANT'), ('user-3', 'NON_COMPLIANT'), ('user-4', 'COMPLIANT'), ('user-6', 'COMPLIANT')],
+                         [(evaluation['ComplianceResourceId'], evaluation['ComplianceType']) for evaluation in response])
+
+    def test_generator_only_changes_reported(self):
+        def evaluate_compliance(event, configuration_item, valid_rule_parameters):
+            for evaluation in self.latest:
+                yield evaluation
+
+        response = rdk_runtime.lambda_handler(build_event(), {}, build_rule(evaluate_compliance, DELTA_REPORTING_MODE=True))
+        self.assertEqual(['user-5', 'user-2', 'user-3', 'user-4', 'user-6'], [evaluation['ComplianceResourceId'] for evaluation in response])
+
+    def test_full_refresh_cadence(self):
+        rule = build_rule(lambda event, configuration_item, valid_rule_parameters: self.latest, DELTA_REPORTING_MODE=True, DELTA_REPORTING_FULL_REFRESH_DAYS=0)
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual(6, len(response))
+
+    def test_delta_reporting_off(self):
+        rule = build_rule(lambda event, configuration_item, valid_rule_parameters: self.latest)
+        response = rdk_runtime.lambda_handler(build_event(), {}, rule)
+        self.assertEqual(6, len(response))
+
+class TestCheckpoint(unittest.TestCase):
+
+    pages = {None: (['user-1', 'user-2'], 'page-2'), 'page-2': (['user-3', 'user-4'], 'page-3'), 'page-3': (['user-5'], None)}
+
+    def setUp(self):
+        config_client_mock.reset_mock()
+        config_client_mock.put_evaluations = MagicMock(return_value={'FailedEvaluations': []})
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': [
+            build_old_result('user-1'), build_old_result('user-0')]})
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = rdk_runtime.LocalFileCursorStore(self.directory)
+        self.listed_pages = []
+
+        def evaluate_compliance(event, configuration_item, valid_rule_parameters):
+            cursor = rdk_runtime.get_cursor()
+            while True:
+                self.listed_pages.append(cursor.marker)
+                user_names, next_marker = self.pages[cursor.marker]
+                for user_name in user_names:
+                    if not cursor.is_processed(DEFAULT_RESOURCE_TYPE, user_name):
+                        yield build_evaluation(user_name, 'COMPLIANT')
+                if not next_marker:
+                    break
+                cursor.marker = next_marker
+
+        self.rule = build_rule(evaluate_compliance, CHECKPOINT_MODE=True, CHECKPOINT_MARGIN_SECONDS=10, CHECKPOINT_STORE=self.store)
+
+    def test_run_within_time_budget(self):
+        response = rdk_runtime.lambda_handler(build_event(), build_context([60000]), self.rule)
+        self.assertEqual(['user-0', 'user-1', 'user-2', 'user-3', 'user-4', 'user-5'], [evaluation['ComplianceResourceId'] for evaluation in response])
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_interrupted_then_resumed(self):
+        # The time left is checked after each evaluation: the third one leaves less than the margin.
+        response = rdk_runtime.lambda_handler(build_event(), build_context([50000, 40000, 5000]), self.rule)
+        self.assertEqual(['user-1', 'user-2', 'user-3'], [evaluation['ComplianceResourceId'] for evaluation in response])
+        cursor = self.store.load('123456789012-rule-name')
+        self.assertEqual('page-2', cursor.marker)
+        self.assertEqual({(DEFAULT_RESOURCE_TYPE, 'user-1'), (DEFAULT_RESOURCE_TYPE, 'user-2'), (DEFAULT_RESOURCE_TYPE, 'user-3')}, cursor.processed)
+        # The clean-up is left to the invocation completing the run.
+        config_client_mock.get_compliance_details_by_config_rule.assert_not_called()
+
+        response = rdk_runtime.lambda_handler(build_event(), build_context([60000]), self.rule)
+        self.assertEqual([('user-0', 'NOT_APPLICABLE'), ('user-4', 'COMPLIANT'), ('user-5', 'COMPLIANT')],
+                         [(evaluation['ComplianceResourceId'], evaluation['ComplianceType']) for evaluation in response])
+        self.assertEqual([None, 'page-2', 'page-2', 'page-3'], self.listed_pages)
+        self.assertIsNone(self.store.load('123456789012-rule-name'))
+
+    def test_old_cursor_ignored(self):
+        self.store.save('123456789012-rule-name', rdk_runtime.checkpoint.Cursor('page-3', [(DEFAULT_RESOURCE_TYPE, 'user-1')], time.time() - 3 * 24 * 3600))
+        response = rdk_runtime.lambda_handler(build_event(), build_context([60000]), self.rule)
+        self.assertEqual(6, len(response))
+
+    def test_cursor_of_previous_daily_run_resumed(self):
+        self.store.save('123456789012-rule-name', rdk_runtime.checkpoint.Cursor('page-3', [(DEFAULT_RESOURCE_TYPE, 'user-1')], time.time() - 25 * 3600))
+        response = rdk_runtime.lambda_handler(build_event(), build_context([60000]), self.rule)
+        self.assertEqual(['page-3'], self.listed_pages)
+        self.assertEqual(['user-0', 'user-5'], [evaluation['ComplianceResourceId'] for evaluation in response])
+
+    def test_no_cursor_store(self):
+        with patch.dict(os.environ):
+            os.environ.pop('RDK_CHECKPOINT_BUCKET', None)
+            rule = build_rule(self.rule.evaluate_compliance, CHECKPOINT_MODE=True, CHECKPOINT_MARGIN_SECONDS=10)
+            response = rdk_runtime.lambda_handler(build_event(), build_context([5000]), rule)
+        # Without a shared store, the rule is not interrupted: every resource is evaluated and the old ones cleaned up.
+        self.assertEqual(6, len(response))
+        self.assertEqual([None, 'page-2', 'page-3'], self.listed_pages)
+
+    def test_cursor_store_in_bucket(self):
+        s3_client = MagicMock()
+        with patch.dict(os.environ, {'RDK_CHECKPOINT_BUCKET': 'checkpoint-bucket'}), \
+                patch.object(rdk_runtime.checkpoint, 'get_client', MagicMock(return_value=s3_client)):
+            store = rdk_runtime.checkpoint.get_cursor_store(build_rule(self.rule.evaluate_compliance, CHECKPOINT_MODE=True), build_event())
+        self.assertIsInstance(store, rdk_runtime.S3CursorStore)
+        self.assertIs(s3_client, store.s3_client)
+        self.assertEqual('checkpoint-bucket', store.bucket)
+
+    def test_no_time_left_in_context(self):
+        response = rdk_runtime.lambda_handler(build_event(), {}, self.rule)
+        self.assertEqual(6, len(response))
+
+    def test_cursor_outside_of_checkpoint_mode(self):
+        rdk_runtime.lambda_handler(build_event(), build_context([5000]), build_rule(self.rule.evaluate_compliance))
+        self.assertEqual([None, 'page-2', 'page-3'], self.listed_pages)
+        self.assertEqual([], os.listdir(self.directory))
+
+class TestApiCallMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = rdk_runtime.ApiCallMetrics()
+        session = botocore.session.get_session()
+        self.iam_client = session.create_client('iam', region_name='us-east-1', aws_access_key_id='access-key-id', aws_secret_access_key='secret-access-key')
+        rdk_runtime.instrument_client(self.iam_client, self.metrics)
+        self.stubber = botocore.stub.Stubber(self.iam_client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def test_calls_and_pages_counted(self):
+        self.stubber.add_response('list_users', {'Users': [], 'IsTruncated': True, 'Marker': 'page-2'})
+        self.stubber.add_response('list_users', {'Users': []}, {'Marker': 'page-2'})
+        self.stubber.add_response('get_user', {'User': build_iam_user()})
+        self.iam_client.list_users()
+        self.iam_client.list_users(Marker='page-2')
+        self.iam_client.get_user()
+        record = self.metrics.build_emf_record('rule-name')
+        self.assertEqual(3, record['ApiCalls'])
+        self.assertEqual(1, record['ApiPages'])
+        self.assertEqual(2, record['Operations']['iam.ListUsers']['calls'])
+        self.assertEqual(1, record['Operations']['iam.ListUsers']['pages'])
+        self.assertEqual(2, sum(record['Operations']['iam.ListUsers']['latency_histogram'].values()))
+        self.assertEqual(1, record['Operations']['iam.GetUser']['calls'])
+
+    def test_errors_counted(self):
+        self.stubber.add_client_error('get_user', 'NoSuchEntity')
+        with self.assertRaises(botocore.exceptions.ClientError):
+            self.iam_client.get_user(UserName='user-1')
+        self.assertEqual(1, self.metrics.get_totals()['errors'])
+
+    def test_emf_record(self):
+        self.metrics.record_call('iam', 'ListUsers', 30, retries=1)
+        self.metrics.record_throttle('iam', 'ListUsers')
+        record = self.metrics.build_emf_record('rule-name', timestamp=1577836800)
+        self.assertEqual(1577836800000, record['_aws']['Timestamp'])
+        self.assertEqual([['RuleName']], record['_aws']['CloudWatchMetrics'][0]['Dimensions'])
+        for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            self.assertIn(metric['Name'], record)
+        self.assertEqual('rule-name', record['RuleName'])
+        self.assertEqual((1, 1, 30), (record['ApiRetries'], record['ApiThrottles'], record['ApiLatency']))
+        self.assertEqual(1, record['Operations']['iam.ListUsers']['latency_histogram']['le_50'])
+        json.dumps(record)
+
+    def test_record_printed_per_invocation(self):
+        config_client_mock.get_compliance_details_by_config_rule = MagicMock(return_value={'EvaluationResults': []})
+        config_client_mock.put_evaluations = MagicMock(return_value={'FailedEvaluations': []})
+        with patch.object(rdk_runtime.handler, 'print_api_metrics') as print_api_metrics:
+            rdk_runtime.lambda_handler(build_event(), {}, build_rule(lambda event, configuration_item, valid_rule_parameters: None))
+            with self.assertRaises(ZeroDivisionError):
+                rdk_runtime.lambda_handler(build_event(), {}, build_rule(lambda event, configuration_item, valid_rule_parameters: 1 / 0))
+        self.assertEqual(2, print_api_metrics.call_count)
+
+class TestCredentialReport(unittest.TestCase):
+
+    def setUp(self):
+        rdk_runtime.clear_credential_report_cache()
+        session = botocore.session.get_session()
+        self.iam_client = session.create_client('iam', region_name='us-east-1', aws_access_key_id='access-key-id', aws_secret_access_key='secret-access-key')
+        self.stubber = botocore.stub.Stubber(self.iam_client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def test_report_parsed(self):
+        self.stubber.add_response('get_credential_report', build_credential_report_response(datetime.timedelta(hours=1)))
+        report = rdk_runtime.get_credential_report(self.iam_client, build_event())
+        self.assertEqual(['user-1'], list(report.users))
+        report_user = report.get_user(build_iam_user())
+        self.assertTrue(report_user.mfa_active)
+        self.assertIsNone(report_user.password_last_used)
+        self.assertEqual([(1, True, datetime.datetime(2020, 2, 1, tzinfo=datetime.timezone.utc))],
+                         [(key.number, key.active, key.last_used) for key in report_user.access_keys])
+        # Cached for the next invocations
+        self.assertIs(report, rdk_runtime.get_credential_report(self.iam_client, build_event()))
+        self.stubber.assert_no_pending_responses()
+
+    def test_stale_report_generated_again(self):
+        self.stubber.add_response('get_credential_report', build_credential_report_response(datetime.timedelta(hours=5)))
+        self.stubber.add_response('generate_credential_report', {'State': 'COMPLETE'})
+        self.stubber.add_response('get_credential_report', build_credential_report_response(datetime.timedelta(seconds=1)))
+        report = rdk_runtime.get_credential_report(self.iam_client, build_event())
+        self.assertTrue(report.get_age_seconds() < 60)
+        self.stubber.assert_no_pending_responses()
+
+    def test_missing_report_generated(self):
+        self.stubber.add_client_error('get_credential_report', 'ReportNotPresent')
+        self.stubber.add_response('generate_credential_report', {'State': 'STARTED'})
+        self.stubber.add_response('generate_credential_report', {'State': 'COMPLETE'})
+        self.stubber.add_response('get_credential_report', build_credential_report_response(datetime.timedelta(seconds=1)))
+        with patch.object(rdk_runtime.credential_report.time, 'sleep'):
+            self.assertIsNotNone(rdk_runtime.get_credential_report(self.iam_client, build_event()))
+        self.stubber.assert_no_pending_responses()
+
+    def test_fallback_without_report(self):
+        self.stubber.add_client_error('get_credential_report', 'AccessDenied')
+        self.assertIsNone(rdk_runtime.get_credential_report(self.iam_client, build_event()))
+        self.stubber.add_client_error('get_credential_report', 'ReportNotPresent')
+        self.stubber.add_response('generate_credential_report', {'State': 'INPROGRESS'})
+        with patch.object(rdk_runtime.credential_report, 'GENERATION_TIMEOUT_SECONDS', 0):
+            self.assertIsNone(rdk_runtime.get_credential_report(self.iam_client, build_event()))
+        self.assertIsNone(rdk_runtime.get_credential_report(self.iam_client, build_event(), max_age_seconds=0))
+
+    def test_user_created_after_report(self):
+        report = rdk_runtime.CredentialReport.from_csv(build_credential_report_content(), datetime.datetime.now(datetime.timezone.utc))
+        self.assertIsNone(report.get_user(dict(build_iam_user(), UserName='user-2')))
+        self.assertIsNone(report.get_user(dict(build_iam_user(), CreateDate=datetime.datetime(2020, 3, 1))))
+
+class TestAuthorizationSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        session = botocore.session.get_session()
+        self.iam_client = session.create_client('iam', region_name='us-east-1', aws_access_key_id='access-key-id', aws_secret_access_key='secret-access-key')
+        self.stubber = botocore.stub.Stubber(self.iam_client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        rdk_runtime.clear_policy_document_cache()
+
+    def test_policies_of_entity(self):
+        document = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': '*', 'Resource': '*'}]}
+        role = {'RoleName': 'role-1', 'RoleId': 'AROAEXAMPLE0000000001', 'Arn': 'arn:aws:iam::123456789012:role/role-1', 'Path': '/',
+                'CreateDate': datetime.datetime(2020, 1, 1), 'RolePolicyList': [{'PolicyName': 'inline-1', 'PolicyDocument': json.dumps(document)}],
+                'AttachedManagedPolicies': [{'PolicyName': 'policy-1', 'PolicyArn': 'arn:aws:iam::123456789012:policy/policy-1'},
+                                            {'PolicyName': 'policy-2', 'PolicyArn': 'arn:aws:iam::123456789012:policy/policy-2'}]}
+        policy = {'PolicyName': 'policy-1', 'Arn': 'arn:aws:iam::123456789012:policy/policy-1', 'DefaultVersionId': 'v1',
+                  'PolicyVersionList': [{'VersionId': 'v1', 'IsDefaultVersion': True, 'Document': json.dumps(document)}]}
+        filters = ['Role', 'LocalManagedPolicy', 'AWSManagedPolicy']
+        self.stubber.add_response('get_account_authorization_details', {'RoleDetailList': [role], 'IsTruncated': True, 'Marker': 'page-2'},
+                                  {'Filter': filters, 'MaxItems': 1000})
+        self.stubber.add_response('get_account_authorization_details', {'Policies': [policy], 'IsTruncated': False},
+                                  {'Filter': filters, 'MaxItems': 1000, 'Marker': 'page-2'})
+        snapshot = rdk_runtime.get_authorization_snapshot(self.iam_client, ['AWS::IAM::Role'])
+        self.assertEqual([('role-1', 'AROAEXAMPLE0000000001')], [(name, entity_id) for name, entity_id, entity in snapshot.iter_entities('AWS::IAM::Role')])
+        # The policy missing from the snapshot is got from IAM
+        self.stubber.add_response('get_policy', {'Policy': {'DefaultVersionId': 'v3'}}, {'PolicyArn': 'arn:aws:iam::123456789012:policy/policy-2'})
+        self.stubber.add_response('get_policy_version', {'PolicyVersion': {'Document': json.dumps(document)}},
+                                  {'PolicyArn': 'arn:aws:iam::123456789012:policy/policy-2', 'VersionId': 'v3'})
+        policies = list(snapshot.iter_policies('AWS::IAM::Role', snapshot.entities['AWS::IAM::Role'][0], self.iam_client))
+        self.assertEqual([('inline', 'inline-1', document), ('managed', 'policy-1', document), ('managed', 'policy-2', document)], policies)
+        self.stubber.assert_no_pending_responses()
+
+    def test_entities_without_policies(self):
+        user = {'UserName': 'user-1', 'UserId': 'AIDAEXAMPLE0000000001', 'Arn': 'arn:aws:iam::123456789012:user/user-1', 'Path': '/',
+                'CreateDate': datetime.datetime(2020, 1, 1),
+                'PermissionsBoundary': {'PermissionsBoundaryType': 'Policy', 'PermissionsBoundaryArn': 'arn:aws:iam::aws:policy/PowerUserAccess'}}
+        self.stubber.add_response('get_account_authorization_details', {'UserDetailList': [user], 'IsTruncated': False},
+                                  {'Filter': ['User'], 'MaxItems': 1000})
+        snapshot = rdk_runtime.get_authorization_snapshot(self.iam_client, ['AWS::IAM::User'], include_policies=False)
+        self.assertEqual([user], snapshot.entities['AWS::IAM::User'])
+        self.assertEqual({}, snapshot.managed_policies)
+        self.stubber.assert_no_pending_responses()
+
+class TestPolicyDocumentCache(unittest.TestCase):
+
+    policy_arn = 'arn:aws:iam::123456789012:policy/policy-1'
+    document = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': 's3:GetObject', 'Resource': '*'}]}
+
+    def setUp(self):
+        self.iam_client = MagicMock()
+        self.iam_client.get_policy = MagicMock(return_value={'Policy': {'DefaultVersionId': 'v1'}})
+        self.iam_client.get_policy_version = MagicMock(return_value={'PolicyVersion': {'Document': self.document}})
+        self.cache = rdk_runtime.PolicyDocumentCache(max_documents=2)
+
+    def test_document_got_once(self):
+        for _ in range(3):
+            self.assertEqual(self.document, self.cache.get_document(self.iam_client, self.policy_arn))
+        self.iam_client.get_policy.assert_called_once_with(PolicyArn=self.policy_arn)
+        self.iam_client.get_policy_version.assert_called_once_with(PolicyArn=self.policy_arn, VersionId='v1')
+        self.assertEqual({'hits': 4, 'misses': 2, 'shared': 0, 'evictions': 0}, self.cache.get_counters())
+
+    def test_known_default_version(self):
+        self.cache.get_document(self.iam_client, self.policy_arn, 'v2')
+        self.iam_client.get_policy.assert_not_called()
+        self.iam_client.get_policy_version.assert_called_once_with(PolicyArn=self.policy_arn, VersionId='v2')
+
+    def test_default_version_expired(self):
+        self.cache.get_document(self.iam_client, self.policy_arn)
+        self.iam_client.get_policy = MagicMock(return_value={'Policy': {'DefaultVersionId': 'v2'}})
+        with patch('time.time', return_value=time.time() + rdk_runtime.policy_cache.DEFAULT_VERSION_TTL_SECONDS + 1):
+            self.cache.get_document(self.iam_client, self.policy_arn)
+        self.iam_client.get_policy_version.assert_called_with(PolicyArn=self.policy_arn, VersionId='v2')
+        self.assertEqual(2, self.iam_client.get_policy_version.call_count)
+
+    def test_least_recently_used_evicted(self):
+        for version_id in ('v1', 'v2', 'v1', 'v3'):
+            self.cache.get_document(self.iam_client, self.policy_arn, version_id)
+        self.assertEqual([(self.policy_arn, 'v1'), (self.policy_arn, 'v3')], list(self.cache.documents))
+        self.assertEqual(1, self.cache.get_counters()['evictions'])
+
+    def test_concurrent_calls_shared(self):
+        started = threading.Event()
+        release = threading.Event()
+        def get_policy_version(**kwargs):
+            started.set()
+            release.wait(5)
+            return {'PolicyVersion': {'Document': self.document}}
+        self.iam_client.get_policy_version = MagicMock(side_effect=get_policy_version)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(self.cache.get_document, self.iam_client, self.policy_arn, 'v1')
+            started.wait(5)
+            second = executor.submit(self.cache.get_document, self.iam_client, self.policy_arn, 'v1')
+            while not self.cache.get_counters()['shared']:
+                time.sleep(0.01)
+            release.set()
+            self.assertEqual(first.result(), second.result())
+        self.iam_client.get_policy_version.assert_called_once()
+
+    def test_error_not_cached(self):
+        self.iam_client.get_policy_version = MagicMock(side_effect=[build_client_error('Throttling'), {'PolicyVersion': {'Document': self.document}}])
+        with self.assertRaises(botocore.exceptions.ClientError):
+            self.cache.get_document(self.iam_client, self.policy_arn, 'v1')
+        self.assertEqual(self.document, self.cache.get_document(self.iam_client, self.policy_arn, 'v1'))
+
+class TestPolicyEngine(unittest.TestCase):
+
+    document = {'Version': '2012-10-17', 'Statement': {'Effect': 'Allow', 'Action': 'S3:Get*', 'Resource': 'arn:aws:s3:::bucket/*',
+                                                       'Condition': {'IpAddress': {'aws:SourceIp': '10.0.0.0/24'}}}}
+
+    def setUp(self):
+        rdk_runtime.clear_compiled_policies()
+
+    def test_document_normalized(self):
+        statement = rdk_runtime.compile_policy(self.document).statements[0]
+        self.assertEqual(('S3:Get*',), statement.actions)
+        self.assertEqual(('arn:aws:s3:::bucket/*',), statement.resources)
+        self.assertEqual(('10.0.0.0/24',), statement.get_condition_values('IpAddress', 'aws:SourceIp'))
+        self.assertIsNone(statement.get_condition_values('NotIpAddress', 'aws:SourceIp'))
+        self.assertTrue(statement.matches_action('s3:GetObject'))
+        self.assertFalse(statement.matches_action('s3:PutObject'))
+        self.assertTrue(statement.matches_resource('arn:aws:s3:::bucket/key'))
+        self.assertFalse(statement.matches_resource('arn:aws:s3:::other-bucket/key'))
+
+    def test_not_action(self):
+        statement = rdk_runtime.compile_policy({'Statement': [{'Effect': 'Allow', 'NotAction': 'iam:*', 'Resource': '*'}]}).statements[0]
+        self.assertEqual((), statement.actions)
+        self.assertTrue(statement.matches_action('s3:GetObject'))
+        self.assertFalse(statement.matches_action('iam:CreateUser'))
+
+    def test_same_content_compiled_once(self):
+        reordered = json.dumps({'Statement': self.document['Statement'], 'Version': '2012-10-17'}, indent=2)
+        policy = rdk_runtime.compile_policy(self.document)
+        self.assertIs(policy, rdk_runtime.compile_policy(reordered))
+        self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0}, rdk_runtime.POLICY_COMPILER.get_counters())
+
+    def test_check_memoized(self):
+        check = MagicMock(return_value=True)
+        for _ in range(3):
+            self.assertTrue(rdk_runtime.compile_policy(self.document).evaluate(check, 20))
+        rdk_runtime.compile_policy(self.document).evaluate(check, 30)
+        self.assertEqual(2, check.call_count)
+
+    def test_actions_interned(self):
+        first = rdk_runtime.compile_policy({'Statement': [{'Effect': 'Allow', 'Action': ''.join(['s3:', 'GetObject'])}]})
+        second = rdk_runtime.compile_policy({'Statement': [{'Effect': 'Deny', 'Action': ''.join(['s3:', 'GetObject'])}]})
+        self.assertIs(first.statements[0].actions[0], second.statements[0].actions[0])
+
+    def test_least_recently_used_evicted(self):
+        compiler = rdk_runtime.policy_engine.PolicyCompiler(max_policies=1)
+        compiler.compile(self.document)
+        compiler.compile({'Statement': []})
+        self.assertEqual(1, len(compiler.policies))
+        self.assertEqual(1, compiler.get_counters()['evictions'])
+
+class TestRecordedPolicies(unittest.TestCase):
+
+    document = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': 's3:GetObject', 'Resource': '*'}]}
+
+    def setUp(self):
+        rdk_runtime.clear_policy_document_cache()
+        self.config_client = MagicMock()
+        self.iam_client = MagicMock()
+        self.iam_client.get_policy = MagicMock(return_value={'Policy': {'DefaultVersionId': 'v1'}})
+        self.iam_client.get_policy_version = MagicMock(return_value={'PolicyVersion': {'Document': self.document}})
+
+    def test_policies_resolved_from_cache_config_then_iam(self):
+        names = ['policy-{}'.format(n) for n in range(150)]
+        configuration_item = build_role_configuration_item(names + ['AWSLambdaBasicExecutionRole'])
+        # The AWS managed policies are not recorded by Config
+        configuration_item['configuration']['attachedManagedPolicies'][-1]['policyArn'] = 'arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'
+        configuration_item['relationships'].pop()
+        rdk_runtime.POLICY_DOCUMENT_CACHE.put_document('arn:aws:iam::123456789012:policy/policy-0', 'v1', self.document)
+        def batch_get_resource_config(resourceKeys):
+            return {'baseConfigurationItems': [build_policy_configuration_item(key['resourceId'].replace('ANPA', ''), self.document) for key in resourceKeys]}
+        self.config_client.batch_get_resource_config = MagicMock(side_effect=batch_get_resource_config)
+
+        self.assertTrue(rdk_runtime.has_recorded_policies(configuration_item))
+        policies = list(rdk_runtime.iter_recorded_policies(configuration_item, self.config_client, self.iam_client))
+        self.assertEqual([('inline', 'inline-1', self.document)] + [('managed', name, self.document) for name in names + ['AWSLambdaBasicExecutionRole']], policies)
+        # 149 policies recorded by Config, by batches of 100, and the AWS managed policy from IAM
+        self.assertEqual([100, 49], [len(call[1]['resourceKeys']) for call in self.config_client.batch_get_resource_config.call_args_list])
+        self.iam_client.get_policy.assert_called_once_with(PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole')
+        # The next entities get the documents from the cache
+        list(rdk_runtime.iter_recorded_policies(configuration_item, self.config_client, self.iam_client))
+        self.assertEqual(2, self.config_client.batch_get_resource_config.call_count)
+
+    def test_not_recorded(self):
+        configuration_item = build_role_configuration_item([])
+        del configuration_item['configuration']['rolePolicyList']
+        self.assertFalse(rdk_runtime.has_recorded_policies(configuration_item))
+
+def build_role_configuration_item(attached_policy_names):
+    document = urllib.parse.quote(json.dumps(TestRecordedPolicies.document))
+    return {
+        'resourceType': 'AWS::IAM::Role',
+        'configuration': {
+            'roleName': 'role-1',
+            'rolePolicyList': [{'policyName': 'inline-1', 'policyDocument': document}],
+            'attachedManagedPolicies': [{'policyName': name, 'policyArn': 'arn:aws:iam::123456789012:policy/' + name} for name in attached_policy_names]
+        },
+        'relationships': [{'resourceType': 'AWS::IAM::Policy', 'resourceId': 'ANPA' + name, 'resourceName': name, 'name': 'Is attached to CustomerManagedPolicy'}
+                          for name in attached_policy_names]
+    }
+
+def build_policy_configuration_item(policy_name, document):
+    arn = 'arn:aws:iam::123456789012:policy/' + policy_name
+    configuration = {'policyName': policy_name, 'arn': arn, 'defaultVersionId': 'v1',
+                     'policyVersionList': [{'versionId': 'v1', 'isDefaultVersion': True, 'document': urllib.parse.quote(json.dumps(document))}]}
+    return {'resourceType': 'AWS::IAM::Policy', 'resourceId': 'ANPA' + policy_name, 'arn': arn, 'configuration': json.dumps(configuration)}
+
+class TestRouteTableIndex(unittest.TestCase):
+
+    route_tables = [
+        {'RouteTableId': 'rtb-main', 'VpcId': 'vpc-1', 'Associations': [{'Main': True, 'RouteTableId': 'rtb-main'}],
+         'Routes': [{'DestinationCidrBlock': '10.0.0.0/16', 'GatewayId': 'local'}, {'DestinationCidrBlock': '0.0.0.0/0', 'GatewayId': 'igw-1'}]},
+        {'RouteTableId': 'rtb-private', 'VpcId': 'vpc-1', 'Associations': [{'Main': False, 'SubnetId': 'subnet-private'}],
+         'Routes': [{'DestinationCidrBlock': '10.0.0.0/16', 'GatewayId': 'local'}, {'DestinationIpv6CidrBlock': '::/0', 'NatGatewayId': 'nat-1'}]},
+        {'RouteTableId': 'rtb-public', 'VpcId': 'vpc-1', 'Associations': [{'Main': False, 'SubnetId': 'subnet-public'}, {'Main': False, 'GatewayId': 'vgw-1'}],
+         'Routes': [{'DestinationIpv6CidrBlock': '::/0', 'GatewayId': 'igw-1'}]}
+    ]
+
+    def setUp(self):
+        rdk_runtime.clear_route_table_cache()
+        self.ec2_client = MagicMock()
+        self.ec2_client.describe_route_tables = MagicMock(side_effect=[
+            {'RouteTables': self.route_tables[:2], 'NextToken': 'page-2'}, {'RouteTables': self.route_tables[2:]}])
+
+    def test_subnets_of_vpc(self):
+        index = rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1')
+        self.assertFalse(index.is_subnet_public('subnet-private'))
+        self.assertTrue(index.is_subnet_public('subnet-public'))
+        # A subnet without explicit association uses the main route table.
+        self.assertEqual('rtb-main', index.get_route_table_id('subnet-other'))
+        self.assertTrue(index.is_subnet_public('subnet-other'))
+        self.ec2_client.describe_route_tables.assert_called_with(Filters=[{'Name': 'vpc-id', 'Values': ['vpc-1']}], MaxResults=100, NextToken='page-2')
+
+    def test_index_cached_by_vpc(self):
+        index = rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1')
+        self.assertIs(index, rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1'))
+        self.assertEqual(2, self.ec2_client.describe_route_tables.call_count)
+        self.ec2_client.describe_route_tables = MagicMock(return_value={'RouteTables': []})
+        self.assertFalse(rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-2').is_subnet_public('subnet-private'))
+        self.assertTrue(rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1', ttl_seconds=60).is_subnet_public('subnet-public'))
+        self.assertFalse(rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1', ttl_seconds=0).is_subnet_public('subnet-public'))
+        self.assertEqual(2, self.ec2_client.describe_route_tables.call_count)
+
+    def test_index_described_again_for_a_later_change(self):
+        # 2020-01-01T00:00:00Z
+        with patch.object(rdk_runtime.route_tables.time, 'time', MagicMock(return_value=1577836800.0)):
+            index = rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1', '2019-12-31T23:59:59.000Z')
+            self.assertIs(index, rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1', '2020-01-01T00:00:00.000Z'))
+            self.assertEqual(2, self.ec2_client.describe_route_tables.call_count)
+        self.ec2_client.describe_route_tables = MagicMock(return_value={'RouteTables': []})
+        with patch.object(rdk_runtime.route_tables.time, 'time', MagicMock(return_value=1577836810.0)):
+            self.assertFalse(rdk_runtime.get_route_table_index(self.ec2_client, 'vpc-1', '2020-01-01T00:00:05.000Z').is_subnet_public('subnet-public'))
+        self.assertEqual(1, self.ec2_client.describe_route_tables.call_count)
+
+def build_rule(evaluate_compliance, **parameters):
+    rule = types.ModuleType('RULE')
+    for name, value in parameters.items():
+        setattr(rule, name, value)
+    rule.DEFAULT_RESOURCE_TYPE = DEFAULT_RESOURCE_TYPE
+    rule.evaluate_parameters = lambda rule_parameters: rule_parameters
+    rule.evaluate_compliance = evaluate_compliance
+    rule.get_client = lambda service, event: config_client_mock
+    return rule
+
+def build_context(remaining_times_in_millis):
+    context = MagicMock()
+    context.get_remaining_time_in_millis = MagicMock(side_effect=remaining_times_in_millis + [remaining_times_in_millis[-1]] * 100)
+    return context
+
+def build_iam_user():
+    return {'Path': '/', 'UserName': 'user-1', 'UserId': 'AIDAEXAMPLE0000000001', 'Arn': 'arn:aws:iam::123456789012:user/user-1',
+            'CreateDate': datetime.datetime(2020, 1, 1)}
+
+def build_credential_report_content():
+    return ('user,arn,user_creation_time,password_enabled,password_last_used,password_last_changed,password_next_rotation,mfa_active,'
+            'access_key_1_active,access_key_1_last_rotated,access_key_1_last_used_date,access_key_1_last_used_region,access_key_1_last_used_service,'
+            'access_key_2_active,access_key_2_last_rotated,access_key_2_last_used_date,access_key_2_last_used_region,access_key_2_last_used_service,'
+            'cert_1_active,cert_1_last_rotated,cert_2_active,cert_2_last_rotated\n'
+            '<root_account>,arn:aws:iam::123456789012:root,2020-01-01T00:00:00+00:00,not_supported,2020-01-01T00:00:00+00:00,not_supported,not_supported,true,'
+            'false,N/A,N/A,N/A,N/A,false,N/A,N/A,N/A,N/A,false,N/A,false,N/A\n'
+            'user-1,arn:aws:iam::123456789012:user/user-1,2020-01-01T00:00:00+00:00,false,N/A,N/A,N/A,true,'
+            'true,2020-01-01T00:00:00+00:00,2020-02-01T00:00:00+00:00,us-east-1,s3,false,N/A,N/A,N/A,N/A,false,N/A,false,N/A\n')
+
+def build_credential_report_response(age):
+    return {'Content': build_credential_report_content().encode('utf-8'), 'ReportFormat': 'text/csv',
+            'GeneratedTime': datetime.datetime.now(datetime.timezone.utc) - age}
+
+def build_client_error(code):
+    return botocore.exceptions.ClientError({'Error': {'Code': code, 'Message': code}}, 'operation')
+
+def build_assume_role_response(expires_in):
+    return {'Credentials': {'AccessKeyId': 'access-key-id',
+                            'SecretAccessKey': 'secret-access-key',
+                            'SessionToken': 'session-token',
+                            'Expiration': datetime.datetime.now(datetime.timezone.utc) + expires_in}}
+
+def build_event():
+    return {
+        'configRuleName': 'rule-name',
+        'executionRoleArn': 'arn:aws:iam::123456789012:role/config-role',
+        'accountId': '123456789012',
+        'eventLeftScope': False,
+        'invokingEvent': json.dumps({'messageType': 'ScheduledNotification', 'notificationCreationTime': '2020-01-01T00:00:00.000Z'}),
+        'resultToken': 'TESTMODE'
+    }
+
+def build_evaluation(resource_id, compliance_type, resource_type=DEFAULT_RESOURCE_TYPE):
+    return rdk_runtime.build_evaluation(resource_id, compliance_type, build_event(), resource_type)
+
+def build_old_result(resource_id, resource_type=DEFAULT_RESOURCE_TYPE, compliance_type='COMPLIANT', annotation=None, recorded_time=None):
+    old_result = {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ConfigRuleName': 'rule-name',
+                                                                               'ResourceType': resource_type,
+                                                                               'ResourceId': resource_id}},
+                  'ComplianceType': compliance_type}
+    if annotation:
+        old_result['Annotation'] = annotation
+    if recorded_time:
+        old_result['ResultRecordedTime'] = recorded_time
+    return old_result
@@ -0,0 +1,123 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Policies of an IAM user, group or role, read from its configuration item.
+
+The configuration item of an IAM entity records its inline policies, with their documents, and the ARNs of its
+attached managed policies: a rule triggered by a change of the entity evaluates them without calling IAM. The
+documents of the managed policies are resolved, in this order:
+
+* from the policy document cache (see policy_cache.py), filled by the previous invocations of the container;
+* from the configuration items of the customer managed policies recorded by Config, got by batches of 100 with
+  BatchGetResourceConfig, their resource ids being in the relationships of the entity;
+* from IAM, through the policy document cache, for the others (e.g. the AWS managed policies, not recorded).
+'''
+import json
+import urllib.parse
+from rdk_runtime.policy_cache import POLICY_DOCUMENT_CACHE, get_managed_policy_document
+
+##############
+# Parameters #
+##############
+
+# The field of the configuration listing the inline policies, by entity type.
+INLINE_POLICY_FIELDS = {
+    'AWS::IAM::User': 'userPolicyList',
+    'AWS::IAM::Group': 'groupPolicyList',
+    'AWS::IAM::Role': 'rolePolicyList'
+}
+
+POLICY_RESOURCE_TYPE = 'AWS::IAM::Policy'
+
+# Maximum number of resource keys of a BatchGetResourceConfig call.
+BATCH_SIZE = 100
+
+#############
+# Main Code #
+#############
+
+def has_recorded_policies(configuration_item):
+    """Return True if the configuration item of the IAM entity records its inline and attached managed policies."""
+    field = INLINE_POLICY_FIELDS.get(configuration_item.get('resourceType'))
+    configuration = configuration_item.get('configuration') or {}
+    return field in configuration and 'attachedManagedPolicies' in configuration
+
+def iter_recorded_policies(configuration_item, config_client, iam_client):
+    """Yield the (policy type, policy name, document) of the inline policies of the entity, then of its managed policies.
+
+    The managed policies are only resolved once all the inline policies have been consumed.
+
+    Keyword arguments:
+    configuration_item -- the configuration item of the user, group or role, see has_recorded_policies()
+    config_client -- the Config boto client
+    iam_client -- the IAM boto client, for the managed policies not found in the cache nor in Config
+    """
+    configuration = configuration_item['configuration']
+    for policy in configuration[INLINE_POLICY_FIELDS[configuration_item['resourceType']]] or []:
+        yield 'inline', policy['policyName'], decode_policy_document(policy['policyDocument'])
+
+    attached_policies = configuration['attachedManagedPolicies'] or []
+    if not attached_policies:
+        return
+    documents = get_managed_policy_documents(configuration_item, config_client, iam_client)
+    for attached_policy in attached_policies:
+        yield 'managed', attached_policy['policyName'], documents[attached_policy['policyArn']]
+
+def get_managed_policy_documents(configuration_item, config_client, iam_client):
+    """Return the documents of the managed policies attached to the entity, by policy ARN."""
+    attached_policies = configuration_item['configuration']['attachedManagedPolicies'] or []
+    documents = {}
+    for attached_policy in attached_policies:
+        document = POLICY_DOCUMENT_CACHE.peek_document(attached_policy['policyArn'])
+        if document is not None:
+            documents[attached_policy['policyArn']] = document
+
+    # The customer managed policies recorded by Config are related to the entity by their resource id.
+    policy_ids = get_related_policy_ids(configuration_item)
+    missing_ids = [policy_ids[policy['policyName']] for policy in attached_policies
+                   if policy['policyArn'] not in documents and policy['policyName'] in policy_ids]
+    for policy_arn, default_version_id, document in get_recorded_policy_documents(config_client, missing_ids):
+        POLICY_DOCUMENT_CACHE.put_document(policy_arn, default_version_id, document)
+        documents[policy_arn] = document
+
+    for attached_policy in attached_policies:
+        if attached_policy['policyArn'] not in documents:
+            documents[attached_policy['policyArn']] = get_managed_policy_document(iam_client, attached_policy['policyArn'])
+    return documents
+
+# Yield the (policy ARN, default version id, document) of the policies recorded by Config, by batches of BATCH_SIZE.
+def get_recorded_policy_documents(config_client, policy_ids):
+    for start in range(0, len(policy_ids), BATCH_SIZE):
+        resource_keys = [{'resourceType': POLICY_RESOURCE_TYPE, 'resourceId': policy_id} for policy_id in policy_ids[start:start + BATCH_SIZE]]
+        response = config_client.batch_get_resource_config(resourceKeys=resource_keys)
+        # The unprocessed keys are left to IAM.
+        for item in response.get('baseConfigurationItems', []):
+            configuration = item['configuration']
+            if isinstance(configuration, str):
+                configuration = json.loads(configuration)
+            for version in configuration.get('policyVersionList', []):
+                if version['isDefaultVersion']:
+                    yield item['arn'], version['versionId'], decode_policy_document(version['document'])
+
+####################
+# Helper Functions #
+####################
+
+# policy name -> resource id of the customer managed policies related to the entity
+def get_related_policy_ids(configuration_item):
+    return {relationship['resourceName']: relationship['resourceId'] for relationship in configuration_item.get('relationships') or []
+            if relationship.get('resourceType') == POLICY_RESOURCE_TYPE and relationship.get('resourceName')}
+
+# The documents are URL-encoded JSON in the configuration items.
+def decode_policy_document(document):
+    if isinstance(document, str):
+        return json.loads(urllib.parse.unquote(document))
+    return document
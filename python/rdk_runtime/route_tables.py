@@ -0,0 +1,124 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Index of the route tables of a VPC, telling whether a subnet routes to the internet.
+
+A subnet uses the route table it is explicitly associated with, or else the main route table of its VPC. The
+route tables of a VPC are got once, with a vpc-id filter and by pages, and indexed by subnet, each table with a
+flag telling whether it has a route to the internet. The index is kept at module level, by VPC, for
+ROUTE_TABLE_TTL_SECONDS: a burst of changes in the same VPC is evaluated without describing the route tables
+again. An index described before the capture of the configuration item evaluated is not reused, since it can
+miss the change of the routes which caused the event.
+'''
+import time
+import datetime
+import threading
+import dateutil.parser
+
+##############
+# Parameters #
+##############
+
+# Time during which the route tables of a VPC are not described again.
+ROUTE_TABLE_TTL_SECONDS = 60
+
+# Maximum number of route tables of a DescribeRouteTables page.
+PAGE_SIZE = 100
+
+# vpc id -> (RouteTableIndex, time of the description)
+ROUTE_TABLE_CACHE = {}
+ROUTE_TABLE_CACHE_LOCK = threading.Lock()
+
+#############
+# Main Code #
+#############
+
+def get_route_table_index(ec2_client, vpc_id, capture_time=None, ttl_seconds=ROUTE_TABLE_TTL_SECONDS):
+    """Return the RouteTableIndex of a VPC, described at most ttl_seconds ago and after capture_time.
+
+    Keyword arguments:
+    ec2_client -- the EC2 boto client
+    vpc_id -- the id of the VPC
+    capture_time -- the configurationItemCaptureTime of the configuration item evaluated (default None)
+    ttl_seconds -- the maximum age of the index; 0 to always describe the route tables (default ROUTE_TABLE_TTL_SECONDS)
+    """
+    with ROUTE_TABLE_CACHE_LOCK:
+        index, described_time = ROUTE_TABLE_CACHE.get(vpc_id, (None, 0))
+        if index is not None and described_time + ttl_seconds > time.time() and \
+                (capture_time is None or described_time >= parse_capture_time(capture_time)):
+            return index
+
+    index = RouteTableIndex(describe_route_tables(ec2_client, vpc_id))
+    with ROUTE_TABLE_CACHE_LOCK:
+        ROUTE_TABLE_CACHE[vpc_id] = (index, time.time())
+    return index
+
+def describe_route_tables(ec2_client, vpc_id):
+    response = ec2_client.describe_route_tables(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}], MaxResults=PAGE_SIZE)
+    route_tables = []
+    while True:
+        route_tables += response['RouteTables']
+        if 'NextToken' in response:
+            response = ec2_client.describe_route_tables(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}], MaxResults=PAGE_SIZE,
+                                                        NextToken=response['NextToken'])
+        else:
+            break
+    return route_tables
+
+def clear_route_table_cache():
+    """Forget the indexed route tables, e.g. between two tests."""
+    with ROUTE_TABLE_CACHE_LOCK:
+        ROUTE_TABLE_CACHE.clear()
+
+class RouteTableIndex():
+    """The route tables of a VPC, indexed by subnet.
+
+    Keyword arguments:
+    route_tables -- the route tables of the VPC, as returned by DescribeRouteTables
+    """
+
+    def __init__(self, route_tables):
+        # route table id -> True if the table has a route to the internet
+        self.internet_routes = {}
+        # subnet id -> id of the route table explicitly associated
+        self.subnet_route_tables = {}
+        self.main_route_table_id = None
+        for route_table in route_tables:
+            route_table_id = route_table['RouteTableId']
+            self.internet_routes[route_table_id] = any(is_internet_route(route) for route in route_table.get('Routes', []))
+            for association in route_table.get('Associations', []):
+                if association.get('Main'):
+                    self.main_route_table_id = route_table_id
+                elif association.get('SubnetId'):
+                    self.subnet_route_tables[association['SubnetId']] = route_table_id
+
+    def get_route_table_id(self, subnet_id):
+        """Return the id of the route table of the subnet: the one it is explicitly associated with, or else the main one."""
+        return self.subnet_route_tables.get(subnet_id, self.main_route_table_id)
+
+    def is_subnet_public(self, subnet_id):
+        """Return True if the route table of the subnet has a route to the internet."""
+        return self.internet_routes.get(self.get_route_table_id(subnet_id), False)
+
+####################
+# Helper Functions #
+####################
+
+# The configurationItemCaptureTime, e.g. 2020-01-01T00:00:00.000Z, as a time.time() value.
+def parse_capture_time(capture_time):
+    date = dateutil.parser.parse(capture_time)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date.timestamp()
+
+# A route to 0.0.0.0/0, or through an internet gateway.
+def is_internet_route(route):
+    return route.get('DestinationCidrBlock') == '0.0.0.0/0' or route.get('GatewayId', '').startswith('igw-')
@@ -0,0 +1,189 @@
+# Copyright 2017-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may
+# not use this file except in compliance with the License. A copy of the License is located at
+#
+#        http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for
+# the specific language governing permissions and limitations under the License.
+'''
+Submission of the evaluations to AWS Config.
+
+The evaluations are sent by batches of 100 (the PutEvaluations limit) through a small pool of
+threads, as they are produced by the rule. The threads share one backoff delay, which grows when Config throttles any of them and
+shrinks when the calls succeed again. The evaluations returned in FailedEvaluations are sent again.
+'''
+import time
+import random
+import threading
+import concurrent.futures
+import botocore.exceptions
+
+##############
+# Parameters #
+##############
+
+# Maximum number of evaluations in one PutEvaluations call.
+PUT_EVALUATIONS_BATCH_SIZE = 100
+
+# Number of PutEvaluations calls in flight.
+PUT_EVALUATIONS_WORKERS = 4
+
+# Number of times an evaluation is sent before giving up, whether it is throttled or returned in FailedEvaluations.
+PUT_EVALUATIONS_MAX_ATTEMPTS = 5
+
+# Bounds of the delay waited before each call once Config started throttling, in seconds.
+BACKOFF_BASE_SECONDS = 0.1
+BACKOFF_MAX_SECONDS = 5
+
+THROTTLING_ERROR_CODES = ('ThrottlingException', 'Throttling', 'TooManyRequestsException', 'RequestLimitExceeded')
+
+#############
+# Main Code #
+#############
+
+# Report the evaluations to Config, by batches of 100.
+def put_evaluations(config_client, evaluations, result_token, max_workers=PUT_EVALUATIONS_WORKERS):
+    """Send the evaluations to Config and return the list of batch reports, one per PutEvaluations call.
+
+    Keyword arguments:
+    config_client -- the Config boto client
+    evaluations -- the evaluations to report, a list or any iterable
+    result_token -- the resultToken of the event given in the lambda handler
+    max_workers -- the maximum number of PutEvaluations calls in flight (default PUT_EVALUATIONS_WORKERS)
+    """
+    with EvaluationSubmitter(config_client, result_token, max_workers) as submitter:
+        for evaluation in evaluations:
+            submitter.add(evaluation)
+        return submitter.close()
+
+class EvaluationSubmitter():
+    """Send the evaluations as they are added, as soon as a batch is full.
+
+    At most max_workers batches are in flight: add() waits for one of them to complete before sending
+    another one, so the evaluations waiting to be sent stay bounded whatever their total number.
+    """
+
+    def __init__(self, config_client, result_token, max_workers=PUT_EVALUATIONS_WORKERS):
+        self.config_client = config_client
+        self.result_token = result_token
+        # Used solely for RDK test to skip actual put_evaluation API call
+        self.test_mode = result_token == 'TESTMODE'
+        self.max_workers = max(max_workers, 1)
+        self.backoff = AdaptiveBackoff()
+        self.executor = None
+        self.futures = []
+        self.buffer = []
+        self.reports = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+    def add(self, evaluation):
+        self.buffer.append(evaluation)
+        if len(self.buffer) >= PUT_EVALUATIONS_BATCH_SIZE:
+            self.submit(self.buffer, attempt=1)
+            self.buffer = []
+
+    def close(self):
+        """Send the last evaluations, wait for every batch to complete and return the batch reports."""
+        if self.buffer and not self.executor:
+            # A single batch, e.g. on a configuration change: no need for a thread.
+            self.handle_result(put_batch(self.config_client, self.buffer, 1, self.result_token, self.test_mode, self.backoff))
+        elif self.buffer:
+            self.submit(self.buffer, attempt=1)
+        self.buffer = []
+        while self.futures:
+            self.collect(concurrent.futures.wait(self.futures, return_when=concurrent.futures.FIRST_COMPLETED).done)
+        return self.reports
+
+    def submit(self, batch, attempt):
+        while len(self.futures) >= self.max_workers:
+            self.collect(concurrent.futures.wait(self.futures, return_when=concurrent.futures.FIRST_COMPLETED).done)
+        if not self.executor:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        self.futures.append(self.executor.submit(put_batch, self.config_client, batch, attempt, self.result_token, self.test_mode, self.backoff))
+
+    def collect(self, done):
+        for future in done:
+            # A batch re-queued by handle_result() may already have collected it.
+            if future not in self.futures:
+                continue
+            self.futures.remove(future)
+            self.handle_result(future.result())
+
+    def handle_result(self, result):
+        report, failed_evaluations = result
+        self.reports.append(report)
+        print_batch_report(len(self.reports), report)
+        if not failed_evaluations:
+            return
+        if report['attempt'] >= PUT_EVALUATIONS_MAX_ATTEMPTS:
+            print("Giving up on {} evaluation(s) failed {} times.".format(len(failed_evaluations), report['attempt']))
+            return
+        for i in range(0, len(failed_evaluations), PUT_EVALUATIONS_BATCH_SIZE):
+            self.submit(failed_evaluations[i:i + PUT_EVALUATIONS_BATCH_SIZE], attempt=report['attempt'] + 1)
+
+# Send one batch, waiting and retrying while Config throttles the calls.
+def put_batch(config_client, batch, attempt, result_token, test_mode, backoff):
+    start = time.time()
+    throttled = 0
+    while True:
+        backoff.wait()
+        try:
+            response = config_client.put_evaluations(Evaluations=batch, ResultToken=result_token, TestMode=test_mode)
+            break
+        except botocore.exceptions.ClientError as ex:
+            if not is_throttling_error(ex) or attempt + throttled >= PUT_EVALUATIONS_MAX_ATTEMPTS:
+                raise
+            throttled += 1
+            backoff.increase()
+    backoff.decrease()
+
+    failed_evaluations = []
+    # Local stand-ins of Config (e.g. for the RDK tests) may not return a PutEvaluations response.
+    if isinstance(response, dict):
+        failed_evaluations = response.get('FailedEvaluations', [])
+    report = {
+        'size': len(batch),
+        'failed': len(failed_evaluations),
+        'throttled': throttled,
+        'attempt': attempt + throttled,
+        'latency_ms': int((time.time() - start) * 1000)
+    }
+    return report, failed_evaluations
+
+def is_throttling_error(exception):
+    return exception.response['Error']['Code'] in THROTTLING_ERROR_CODES
+
+def print_batch_report(number, report):
+    print("PutEvaluations batch {}: {} evaluation(s), {} failed, {} throttled, {} ms".format(
+        number, report['size'], report['failed'], report['throttled'], report['latency_ms']))
+
+class AdaptiveBackoff():
+    """Delay shared by the threads sending the evaluations."""
+
+    def __init__(self):
+        self.delay = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            delay = self.delay
+        if delay:
+            # Jitter, so the throttled threads do not call again all at once.
+            time.sleep(random.uniform(delay / 2, delay))
+
+    def increase(self):
+        with self.lock:
+            self.delay = min(max(self.delay * 2, BACKOFF_BASE_SECONDS), BACKOFF_MAX_SECONDS)
+
+    def decrease(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > BACKOFF_BASE_SECONDS else 0
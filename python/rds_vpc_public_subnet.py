@@ -33,11 +33,20 @@
 #}
 #
 
+import os
+import sys
 import boto3
 import botocore
 import json
 import logging
 
+try:
+    import rdk_runtime
+except ImportError:
+    # Outside of a Lambda layer, the runtime is the rdk_runtime directory next to the rule.
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import rdk_runtime
+
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
@@ -48,34 +57,14 @@ def evaluate_compliance(configuration_item):
         subnet_ids.append(i['subnetIdentifier'])
     client      = boto3.client("ec2");
 
-    response    = client.describe_route_tables()
+    route_table_index = rdk_runtime.get_route_table_index(client, vpc_id, configuration_item["configurationItemCaptureTime"])
 
     # If the subnet is explicitly associated to a route table, check if there
     # is a public route. If no explicit association exists, check if the main
-    # route table has a public route.
-
-    private = True
-
-    for subnet_id in subnet_ids:
-        mainTableIsPublic = False
-        noExplicitAssociationFound = True
-        explicitAssocationIsPublic = False
-        for i in response['RouteTables']:
-            if i['VpcId'] == vpc_id:
-                for j in i['Associations']:
-                    if j['Main'] == True:
-                        for k in i['Routes']:
-                            if k['DestinationCidrBlock'] == '0.0.0.0/0' or k['GatewayId'].startswith('igw-'):
-                                mainTableIsPublic = True
-                    else:
-                        if j['SubnetId'] == subnet_id:
-                            noExplicitAssociationFound = False
-                            for k in i['Routes']:
-                                if k['DestinationCidrBlock'] == '0.0.0.0/0' or k['GatewayId'].startswith('igw-'):
-                                    explicitAssocationIsPublic = True
-
-        if (mainTableIsPublic and noExplicitAssociationFound) or explicitAssocationIsPublic:
-            private = False
+    # route table has a public route. The route tables of the VPC are indexed
+    # once for the next events captured before the index, see
+    # rdk_runtime/route_tables.py.
+    private = not any(route_table_index.is_subnet_public(subnet_id) for subnet_id in subnet_ids)
 
     if private:
         return {